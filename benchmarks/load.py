@@ -0,0 +1,377 @@
+"""
+Load generator that plays thousands of Telegram users against the bot.
+
+Synthetic updates are fed straight into the dispatcher from loader.py,
+with the same middlewares and handlers as main.py. Telegram and the
+sites come from the stub server of the benchmarks, so the run is
+offline; yt-dlp based jobs (YouTube format choices, playlist tracks)
+fail fast on a closed proxy and exercise the error path.
+
+    python -m benchmarks.load --users 2000 --rate 20 --max-rate 200 --duration 120
+
+Arrivals are open-loop: updates are sent at the given rate whether or not
+the bot keeps up, so a rising handling latency or loop lag marks the
+ceiling. Every --interval seconds a line with update latency, loop lag,
+user_tasks, memory and file descriptors is printed.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import ROOT, prepare_env
+from benchmarks.scenarios import FIXTURES_DIR, SCENARIOS
+
+# Traffic kinds and their default share
+DEFAULT_MIX = "url=60,viral=15,youtube=10,playlist=5,cancel=10"
+
+URL_TEMPLATES = (
+    "https://x.com/bench/status/{id}",
+    "https://www.pinterest.com/pin/{id}/",
+    "https://www.pixiv.net/en/artworks/{id}",
+    "https://www.reddit.com/r/pics/comments/{id}/bench_gallery/",
+)
+YOUTUBE_TEMPLATE = "https://www.youtube.com/watch?v=bench{id}"
+PLAYLIST_TEMPLATE = "https://open.spotify.com/playlist/bench{id}"
+
+# Directories the bot opens relative to the working directory
+LINKED_DIRS = ("services", "locales", "cookies")
+
+LAG_PROBE_INTERVAL = 0.05
+
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("url", "viral", "youtube", "playlist", "cancel"):
+            raise argparse.ArgumentTypeError(f"unknown traffic kind: {kind}")
+        mix[kind] = int(weight)
+    return mix
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        # Peak instead of current outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def _prepare_workdir(workdir: str) -> None:
+    """Runs the bot from a scratch directory, so the database and logs of the real bot stay untouched."""
+    for name in LINKED_DIRS:
+        source = os.path.join(ROOT, name)
+        if os.path.exists(source):
+            os.symlink(source, os.path.join(workdir, name))
+    os.makedirs(os.path.join(workdir, "database"))
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+
+class _JobCounter(logging.Handler):
+    """Counts finished jobs by status from the job log, see utils.tracing."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.statuses: Dict[str, int] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        status = json.loads(record.getMessage())["status"]
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class LoadGenerator:
+    def __init__(self, bot, dp, users: int, mix: Dict[str, int], viral: int) -> None:
+        self.bot = bot
+        self.dp = dp
+        self.users = users
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.viral_urls = [template.format(id=1790000000000000 + i) for i in range(viral) for template in URL_TEMPLATES]
+        self.update_id = 0
+        self.message_id = 0
+        self.in_flight = 0
+        self.sent: Dict[str, int] = {kind: 0 for kind in mix}
+        self.errors = 0
+        self.latencies: List[float] = []
+        # Users with a URL in progress, the targets of /cancel
+        self.busy_users: List[int] = []
+
+    def _user(self) -> int:
+        return random.randint(1, self.users)
+
+    def _message(self, user_id: int, text: str, **extra: Any) -> Dict[str, Any]:
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "load"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "load", "language_code": "en"},
+            "text": text,
+            **extra,
+        }
+
+    def _payload(self, kind: str) -> Dict[str, Any]:
+        user_id = self._user()
+        unique = 1000000000 + self.update_id
+        if kind == "url":
+            text = random.choice(URL_TEMPLATES).format(id=unique)
+        elif kind == "viral":
+            text = random.choice(self.viral_urls)
+        elif kind == "playlist":
+            text = PLAYLIST_TEMPLATE.format(id=unique)
+        elif kind == "youtube":
+            # The format prompt was already answered: the choice arrives as a callback on the bot's reply
+            url = self._message(user_id, YOUTUBE_TEMPLATE.format(id=unique))
+            reply = self._message(user_id, "Choose a format to download:", reply_to_message=url)
+            return {
+                "callback_query": {
+                    "id": str(unique),
+                    "from": url["from"],
+                    "chat_instance": str(user_id),
+                    "data": random.choice(("video", "audio")),
+                    "message": reply,
+                }
+            }
+        else:
+            if self.busy_users:
+                user_id = random.choice(self.busy_users)
+            text = "/cancel"
+            return {"message": self._message(user_id, text, entities=[{"type": "bot_command", "offset": 0, "length": 7}])}
+
+        if len(self.busy_users) > 1000:
+            del self.busy_users[:500]
+        self.busy_users.append(user_id)
+        return {"message": self._message(user_id, text)}
+
+    async def _feed(self, kind: str) -> None:
+        from aiogram import types
+
+        self.update_id += 1
+        payload = {"update_id": self.update_id, **self._payload(kind)}
+        # Parsed with the bot in context, as polling does
+        update = types.Update.model_validate(payload, context={"bot": self.bot})
+        self.sent[kind] += 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors += 1
+        finally:
+            self.in_flight -= 1
+            self.latencies.append(time.perf_counter() - started)
+
+    async def run(self, rate: float, max_rate: float, duration: float) -> None:
+        tasks = set()
+        started = time.perf_counter()
+        elapsed = 0.0
+        sent = 0
+        while elapsed < duration:
+            current = rate + (max_rate - rate) * elapsed / duration
+            due = int(rate * elapsed + (max_rate - rate) * elapsed ** 2 / (2 * duration))
+            for _ in range(due - sent):
+                task = asyncio.create_task(self._feed(random.choices(self.kinds, self.weights)[0]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            sent = max(sent, due)
+            await asyncio.sleep(min(0.05, 1 / max(current, 1)))
+            elapsed = time.perf_counter() - started
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class Sampler:
+    """Measures the process every ``interval`` seconds while the load runs."""
+
+    def __init__(self, generator: LoadGenerator, jobs: _JobCounter, interval: float) -> None:
+        self.generator = generator
+        self.jobs = jobs
+        self.interval = interval
+        self.samples: List[Dict[str, Any]] = []
+        self._lags: List[float] = []
+        self._started = time.perf_counter()
+
+    async def probe_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self._lags.append(max(0.0, loop.time() - expected))
+
+    def sample(self) -> Dict[str, Any]:
+        from managers.download_manager import user_tasks
+
+        generator = self.generator
+        latencies, generator.latencies = generator.latencies, []
+        lags, self._lags = self._lags, []
+        item = {
+            "t": round(time.perf_counter() - self._started, 1),
+            "sent": sum(generator.sent.values()),
+            "in_flight": generator.in_flight,
+            "handled": len(latencies),
+            "update_p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+            "update_p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+            "lag_p99_ms": round(_percentile(lags, 99) * 1000, 1),
+            "lag_max_ms": round(max(lags, default=0.0) * 1000, 1),
+            "user_tasks": len(user_tasks),
+            "running_user_tasks": sum(1 for task in user_tasks.values() if not task.done()),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "jobs": dict(self.jobs.statuses),
+            "rss_mb": round(_rss_mb(), 1),
+            "fds": _open_fds(),
+        }
+        self.samples.append(item)
+        return item
+
+    async def run(self) -> None:
+        print(
+            f"{'t':>6} {'sent':>7} {'flight':>6} {'upd p50':>8} {'upd p99':>8} {'lag p99':>8} {'lag max':>8} "
+            f"{'tasks':>6} {'aio':>6} {'jobs ok':>7} {'failed':>6} {'rss MB':>7} {'fds':>5}",
+            flush=True,
+        )
+        while True:
+            await asyncio.sleep(self.interval)
+            item = self.sample()
+            ok = item["jobs"].get("ok", 0)
+            print(
+                f"{item['t']:>6} {item['sent']:>7} {item['in_flight']:>6} {item['update_p50_ms']:>8} "
+                f"{item['update_p99_ms']:>8} {item['lag_p99_ms']:>8} {item['lag_max_ms']:>8} {item['user_tasks']:>6} "
+                f"{item['asyncio_tasks']:>6} {ok:>7} {sum(item['jobs'].values()) - ok:>6} {item['rss_mb']:>7} {item['fds']:>5}",
+                flush=True,
+            )
+
+
+def _summary(generator: LoadGenerator, sampler: Sampler, baseline_rss: float, baseline_fds: int) -> Dict[str, Any]:
+    samples = sampler.samples
+    return {
+        "sent": generator.sent,
+        "dispatch_errors": generator.errors,
+        "jobs": samples[-1]["jobs"] if samples else {},
+        "update_p99_ms_max": max((item["update_p99_ms"] for item in samples), default=0.0),
+        "lag_max_ms": max((item["lag_max_ms"] for item in samples), default=0.0),
+        "user_tasks_peak": max((item["user_tasks"] for item in samples), default=0),
+        "user_tasks_left": samples[-1]["user_tasks"] if samples else 0,
+        "rss_start_mb": round(baseline_rss, 1),
+        "rss_peak_mb": max((item["rss_mb"] for item in samples), default=0.0),
+        "rss_growth_mb": round(samples[-1]["rss_mb"] - baseline_rss, 1) if samples else 0.0,
+        "fds_start": baseline_fds,
+        "fds_peak": max((item["fds"] for item in samples), default=0),
+        "fds_left": samples[-1]["fds"] if samples else 0,
+    }
+
+
+def _user_tasks() -> List[asyncio.Task]:
+    from managers.download_manager import user_tasks
+
+    return list(user_tasks.values())
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    import main as bot_main
+    from benchmarks.stub_server import StubServer, load_routes
+    from database.migrations import migrate
+    from loader import bot, dp
+    from managers.cache_manager import media_cache
+    from utils.register_services import initialize_services
+
+    # Job failures are expected here and would flood the console
+    logging.getLogger().removeHandler(bot_main.console_handler)
+    jobs = _JobCounter()
+    logging.getLogger("jobs").addHandler(jobs)
+
+    routes = []
+    for scenario in SCENARIOS.values():
+        routes.extend(load_routes(scenario.load_fixture()))
+    with open(os.path.join(FIXTURES_DIR, "load.json"), encoding="utf-8") as f:
+        routes.extend(load_routes(json.load(f)))
+
+    stub = StubServer(routes, latency=args.latency_ms / 1000, bandwidth=args.bandwidth_kbps * 1024 // 8)
+    await stub.start()
+
+    await migrate()
+    await media_cache.scan()
+    bot_main.load_modules(["handlers.user", "handlers.admin"], ignore_files=["__init__.py", "help.py"])
+    initialize_services()
+
+    generator = LoadGenerator(bot, dp, args.users, args.mix, args.viral)
+    sampler = Sampler(generator, jobs, args.interval)
+    baseline_rss, baseline_fds = _rss_mb(), _open_fds()
+    background = [asyncio.create_task(sampler.probe_lag()), asyncio.create_task(sampler.run())]
+    try:
+        await generator.run(args.rate, args.max_rate or args.rate, args.duration)
+        # Let the downloads started by the load finish
+        deadline = time.perf_counter() + args.drain
+        while time.perf_counter() < deadline and any(not task.done() for task in _user_tasks()):
+            await asyncio.sleep(0.5)
+        sampler.sample()
+    finally:
+        for task in background:
+            task.cancel()
+        await stub.stop()
+        await bot.session.close()
+
+    summary = _summary(generator, sampler, baseline_rss, baseline_fds)
+    summary["samples"] = sampler.samples
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Feeds synthetic Telegram updates into the bot's dispatcher.")
+    parser.add_argument("--users", type=int, default=1000, help="Distinct users sending updates")
+    parser.add_argument("--rate", type=float, default=20, help="Updates per second at the start")
+    parser.add_argument("--max-rate", type=float, default=0, help="Updates per second at the end, ramped linearly (default: --rate)")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of load")
+    parser.add_argument("--drain", type=float, default=30, help="Seconds to wait for running downloads afterwards")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX), help=f"Traffic kinds and weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--viral", type=int, default=2, help="Viral links per service, sent by many users")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Stub server latency per response")
+    parser.add_argument("--bandwidth-kbps", type=int, default=0, help="Stub server bandwidth per response, 0 = unlimited")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between samples")
+    parser.add_argument("--json", help="Write the summary and all samples to this file")
+    parser.add_argument("--seed", type=int, help="Random seed, for repeatable runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    json_path: Optional[str] = os.path.abspath(args.json) if args.json else None
+
+    with tempfile.TemporaryDirectory(prefix="charlotte-load-") as workdir:
+        prepare_env(workdir)
+        _prepare_workdir(workdir)
+        summary = asyncio.run(_main(args))
+        os.chdir(ROOT)
+
+    samples = summary.pop("samples")
+    print(json.dumps(summary, indent=2))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({**summary, "samples": samples}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
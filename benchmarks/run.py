@@ -0,0 +1,278 @@
+"""
+Offline benchmarks of the download pipeline.
+
+Every scenario replays recorded responses of a service from
+benchmarks/fixtures through a local stub server, which also plays the
+Telegram Bot API. Scenarios run in separate processes so CPU time and
+peak RSS are their own.
+
+    python -m benchmarks.run                          # all scenarios
+    python -m benchmarks.run -s twitter -s reddit --jobs 200 --concurrency 50
+    python -m benchmarks.run --save-baseline          # store the results as the new baseline
+
+The exit code is 1 when a scenario regressed against the baseline by
+more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from benchmarks.scenarios import SCENARIOS, Scenario
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Nothing listens on the discard port, so proxied connections fail at once
+OFFLINE_PROXY = "http://127.0.0.1:9"
+
+# Metric: True if higher is better
+COMPARED = {
+    "throughput": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "cpu_ms_per_job": False,
+    "peak_rss_mb": False,
+}
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def prepare_env(workdir: str) -> None:
+    """
+    Points the bot at throwaway directories and dummy credentials before
+    config is imported. Clients that honour proxy variables (yt-dlp,
+    requests) get a closed port, so nothing leaves the machine.
+    """
+    os.environ.update({
+        "BOT_TOKEN": "123456:benchmark",
+        "ADMIN_ID": "1",
+        "SPOTIFY_CLIENT_ID": "benchmark",
+        "SPOTIFY_SECRET": "benchmark",
+        "LOCAL_SERVER": "",
+        "TEMP_DIR": os.path.join(workdir, "temp"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "METRICS_PORT": "0",
+        "TRACE_OTLP_ENDPOINT": "",
+        "SLOW_JOB_SECONDS": "0",
+        **{name: OFFLINE_PROXY for name in ("HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy")},
+    })
+
+
+class _JobCollector(logging.Handler):
+    """Keeps the JSON lines of finished jobs, see utils.tracing."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.jobs: List[Dict[str, Any]] = []
+        self.status: Dict[int, str] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        item = json.loads(record.getMessage())
+        self.jobs.append(item)
+        self.status[item.get("user_id")] = item["status"]
+
+
+async def _run_child(scenario: Scenario, jobs: int, concurrency: int, warmup: int, latency: float, bandwidth: int) -> Dict[str, Any]:
+    from aiogram import types
+
+    from benchmarks.stub_server import StubServer, load_routes
+
+    fixture = scenario.load_fixture()
+    url = fixture["url"]
+    stub = StubServer(load_routes(fixture), latency=latency, bandwidth=bandwidth)
+    await stub.start()
+
+    collector = _JobCollector()
+    jobs_logger = logging.getLogger("jobs")
+    jobs_logger.addHandler(collector)
+    jobs_logger.propagate = False
+    # Nothing configures logging here the way main.py does, and job lines are INFO
+    jobs_logger.setLevel(logging.INFO)
+
+    target = scenario.load_target()
+    if scenario.service:
+        from handlers.user.url import handle_single_download
+        from loader import bot
+
+        service = target(output_path=os.environ["TEMP_DIR"])
+
+        async def job(number: int) -> bool:
+            message = types.Message(
+                message_id=number,
+                date=datetime.now(),
+                chat=types.Chat(id=1, type="private"),
+                from_user=types.User(id=number, is_bot=False, first_name="bench"),
+                text=url,
+            ).as_(bot)
+            await handle_single_download(service, url, message)
+            # Each job has its own user id, so concurrent jobs don't mix up their results.
+            # Only a reported failure counts, a job without a status line isn't one.
+            return collector.status.pop(number, "ok") == "ok"
+    else:
+        async def job(number: int) -> bool:
+            result = await target(url)
+            return all(result)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def timed(number: int, record: bool) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await job(number)
+            if record:
+                latencies.append(time.perf_counter() - started)
+                failures += 0 if ok else 1
+
+    try:
+        await asyncio.gather(*(timed(i, False) for i in range(warmup)))
+        collector.jobs.clear()
+
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(warmup + i, True) for i in range(jobs)))
+        wall = time.perf_counter() - started
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        await stub.stop()
+
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    phases: Dict[str, List[int]] = {}
+    for item in collector.jobs:
+        for name, ms in item.get("phases_ms", {}).items():
+            phases.setdefault(name, []).append(ms)
+
+    return {
+        "jobs": jobs,
+        "concurrency": concurrency,
+        "failures": failures,
+        "throughput": round(jobs / wall, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "cpu_ms_per_job": round(cpu * 1000 / jobs, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(usage_after.ru_maxrss / 1024, 1),
+        "uploaded_mb": round(stub.uploaded_bytes / 1024 ** 2, 2),
+        "phases_p50_ms": {name: statistics.median(values) for name, values in sorted(phases.items())},
+    }
+
+
+def _child_main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory(prefix="charlotte-bench-") as workdir:
+        prepare_env(workdir)
+        scenario = SCENARIOS[args.child]
+        result = asyncio.run(_run_child(
+            scenario, args.jobs, args.concurrency, args.warmup,
+            args.latency_ms / 1000, args.bandwidth_kbps * 1024 // 8,
+        ))
+    print(json.dumps(result))
+
+
+def _run_scenario(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--child", name,
+        "--jobs", str(args.jobs), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+        "--latency-ms", str(args.latency_ms), "--bandwidth-kbps", str(args.bandwidth_kbps),
+    ]
+    process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def _compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if (base.get("jobs"), base.get("concurrency")) != (result["jobs"], result["concurrency"]):
+            print(f"  {name}: baseline was taken with other --jobs/--concurrency, skipped")
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the download pipeline.")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run, repeatable (default: all)")
+    parser.add_argument("--jobs", type=int, default=100, help="Measured jobs per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="Jobs running at the same time")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured jobs run first")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Stub server latency per response")
+    parser.add_argument("--bandwidth-kbps", type=int, default=0, help="Stub server bandwidth per response, 0 = unlimited")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child_main(args)
+        return
+
+    results = {}
+    for name in args.scenario or sorted(SCENARIOS):
+        print(f"Running {name}...", flush=True)
+        result = _run_scenario(name, args)
+        results[name] = result
+        print(
+            f"  {result['throughput']} jobs/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+            f"CPU {result['cpu_ms_per_job']} ms/job, peak RSS {result['peak_rss_mb']} MB, "
+            f"{result['failures']} failed"
+        )
+        if result["phases_p50_ms"]:
+            print("  phases (p50 ms): " + ", ".join(f"{k} {v}" for k, v in result["phases_p50_ms"].items()))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet, run with --save-baseline to create one")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = _compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
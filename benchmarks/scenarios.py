@@ -0,0 +1,46 @@
+import importlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    One benchmarked job type.
+
+    ``service`` scenarios run the whole pipeline of a URL message
+    (``handle_single_download``: download, processing, upload to the fake
+    Bot API). ``resolver`` scenarios only run the metadata lookup, for
+    services whose audio then comes from YouTube Music through yt-dlp,
+    which can't be replayed from fixtures.
+    """
+
+    name: str
+    fixture: str
+    service: Optional[str] = None
+    resolver: Optional[str] = None
+
+    def load_fixture(self) -> Dict[str, Any]:
+        with open(os.path.join(FIXTURES_DIR, self.fixture), encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_target(self) -> Callable:
+        module_name, _, attribute = (self.service or self.resolver or "").partition(":")
+        return getattr(importlib.import_module(module_name), attribute)
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("twitter", "twitter.json", service="services.twitter:TwitterService"),
+        Scenario("pinterest", "pinterest.json", service="services.pinterest:PinterestService"),
+        Scenario("pixiv", "pixiv.json", service="services.pixiv:PixivService"),
+        Scenario("reddit", "reddit.json", service="services.reddit:RedditService"),
+        Scenario("apple_music", "apple_music.json", resolver="utils.get_applemusic_author:get_applemusic_author"),
+        Scenario("spotify", "spotify.json", resolver="utils.get_spotify_author:get_spotify_author"),
+    )
+}
@@ -0,0 +1,198 @@
+import asyncio
+import io
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+from aiohttp import web
+from PIL import Image
+
+TELEGRAM_HOST = "api.telegram.org"
+
+# Bot API methods that return a list of messages or a plain boolean instead of one message
+_LIST_METHODS = {"sendMediaGroup"}
+_BOOL_METHODS = {"sendChatAction", "deleteWebhook", "setMyCommands", "deleteMessage", "setMessageReaction"}
+
+
+@dataclass
+class Route:
+    method: str
+    host: str
+    path: re.Pattern
+    status: int = 200
+    content_type: str = "application/json"
+    body: bytes = b""
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def _jpeg(width: int, height: int, quality: int = 85) -> bytes:
+    # A gradient compresses like a photo, unlike a flat colour
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _html(spec: Dict[str, Any]) -> bytes:
+    html = spec["html"]
+    pad_kb = spec.get("pad_kb", 0)
+    if pad_kb:
+        # Comment-like markup, so parsers build a realistic DOM instead of skipping a blob
+        block = '<div class="comment"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div>\n'
+        filler = block * (pad_kb * 1024 // len(block) + 1)
+        html = html.replace("</body>", filler + "</body>")
+    return html.encode()
+
+
+def load_routes(fixture: Dict[str, Any]) -> List[Route]:
+    """
+    Builds routes from a fixture file.
+
+    Every route has a ``method``, a ``host`` and a ``path`` regex, and one of
+    ``json`` (inline response), ``html`` (with optional ``pad_kb`` of filler
+    markup) or ``jpeg`` ([width, height] of a generated image).
+    """
+    images: Dict[Tuple[int, int], bytes] = {}
+    routes = []
+    for spec in fixture["routes"]:
+        route = Route(
+            method=spec.get("method", "GET"),
+            host=spec["host"],
+            path=re.compile(spec["path"]),
+            status=spec.get("status", 200),
+            headers=spec.get("headers", {}),
+        )
+        if "json" in spec:
+            route.body = json.dumps(spec["json"]).encode()
+        elif "html" in spec:
+            route.content_type = "text/html; charset=utf-8"
+            route.body = _html(spec)
+        elif "jpeg" in spec:
+            size = tuple(spec["jpeg"])
+            if size not in images:
+                images[size] = _jpeg(*size)
+            route.content_type = "image/jpeg"
+            route.body = images[size]
+        routes.append(route)
+    return routes
+
+
+def _fake_message(chat_id: int, message_id: int) -> Dict[str, Any]:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "bench"},
+    }
+
+
+class StubServer:
+    """
+    Local stand-in for the external sites and the Telegram Bot API.
+
+    While installed, every aiohttp request of the process is rewritten to
+    ``http://127.0.0.1:<port>/<scheme>/<host><path>`` and answered from the
+    fixture routes. Bot API calls get minimal valid results, with the upload
+    body read completely. ``latency`` (seconds per response) and
+    ``bandwidth`` (bytes per second, 0 = unlimited) shape every answer.
+    """
+
+    def __init__(self, routes: List[Route], latency: float = 0.0, bandwidth: int = 0) -> None:
+        self.routes = routes
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests: Dict[str, int] = {}
+        self.uploaded_bytes = 0
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._original_request = None
+        self.base = ""
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=4 * 1024 ** 3)
+        app.router.add_route("*", "/{scheme}/{host}/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        self._install()
+
+    async def stop(self) -> None:
+        self._uninstall()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def rewrite(self, url: Any) -> Any:
+        parts = urlsplit(str(url))
+        if not parts.hostname or parts.hostname == "127.0.0.1":
+            return url
+        return urlunsplit(("http", self.base.split("//", 1)[1], f"/{parts.scheme}/{parts.hostname}{parts.path or '/'}", parts.query, ""))
+
+    def _install(self) -> None:
+        original = aiohttp.ClientSession._request
+        stub = self
+
+        async def _request(session, method, str_or_url, **kwargs):
+            return await original(session, method, stub.rewrite(str_or_url), **kwargs)
+
+        self._original_request = original
+        aiohttp.ClientSession._request = _request
+
+    def _uninstall(self) -> None:
+        if self._original_request is not None:
+            aiohttp.ClientSession._request = self._original_request
+            self._original_request = None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        host = request.match_info["host"]
+        path = "/" + request.match_info["path"]
+        self.requests[host] = self.requests.get(host, 0) + 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if host == TELEGRAM_HOST:
+            return await self._telegram(request, path)
+
+        for route in self.routes:
+            if route.host == host and route.method in (request.method, "*") and route.path.search(path):
+                return await self._send(request, route)
+            if route.host == host and request.method == "HEAD" and route.method == "GET" and route.path.search(path):
+                return web.Response(status=route.status, headers={"Content-Length": str(len(route.body)), "Content-Type": route.content_type})
+
+        return web.json_response({"error": f"no fixture for {request.method} {host}{path}"}, status=404)
+
+    async def _send(self, request: web.Request, route: Route) -> web.StreamResponse:
+        if not self.bandwidth:
+            return web.Response(status=route.status, body=route.body, content_type=route.content_type.split(";")[0], headers=route.headers)
+
+        response = web.StreamResponse(status=route.status, headers={**route.headers, "Content-Type": route.content_type})
+        response.content_length = len(route.body)
+        await response.prepare(request)
+        chunk = max(1024, self.bandwidth // 20)
+        for start in range(0, len(route.body), chunk):
+            await response.write(route.body[start:start + chunk])
+            await asyncio.sleep(chunk / self.bandwidth)
+        await response.write_eof()
+        return response
+
+    async def _telegram(self, request: web.Request, path: str) -> web.Response:
+        method = path.rsplit("/", 1)[-1]
+        size = 0
+        async for data in request.content.iter_any():
+            size += len(data)
+        self.uploaded_bytes += size
+
+        self._message_id += 1
+        if method in _BOOL_METHODS:
+            result: Any = True
+        elif method in _LIST_METHODS:
+            result = [_fake_message(1, self._message_id)]
+        else:
+            result = _fake_message(1, self._message_id)
+        return web.json_response({"ok": True, "result": result})
@@ -8,3 +8,74 @@ LOG_DIR = os.getenv("LOG_DIR")
 SEND_INTERVAL_MIN = os.getenv("SEND_INTERVAL_MIN")
 USE_AD = os.getenv("USE_AD")
 LOCAL_SERVER = os.getenv("LOCAL_SERVER")
+# The local Bot API server shares the filesystem with the bot: upload files by path instead of over HTTP.
+# LOCAL_SERVER_PATH_MAP maps the bot's paths to the server's ones when they differ: "/app/other=/data/other"
+LOCAL_SERVER_FILES = os.getenv("LOCAL_SERVER_FILES")
+LOCAL_SERVER_PATH_MAP = os.getenv("LOCAL_SERVER_PATH_MAP", "")
+
+# Size limits below the Bot API upload limit: global and per service ("Youtube=200,Pinterest=100"), 0 = no extra limit
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "0"))
+SERVICE_SIZE_LIMITS_MB = os.getenv("SERVICE_SIZE_LIMITS_MB", "")
+
+# Media cache
+CACHE_DIR = os.getenv("CACHE_DIR", "other/cache")
+CACHE_MAX_SIZE_MB = int(os.getenv("CACHE_MAX_SIZE_MB", "2048"))
+CACHE_EVICTION_POLICY = os.getenv("CACHE_EVICTION_POLICY", "lru")
+
+# Per-job temp workspaces (point TEMP_DIR to tmpfs, e.g. /dev/shm/charlotte, for faster IO)
+TEMP_DIR = os.getenv("TEMP_DIR", "other/downloadsTemp")
+WORKSPACE_MAX_AGE_MIN = int(os.getenv("WORKSPACE_MAX_AGE_MIN", "60"))
+JANITOR_INTERVAL_MIN = int(os.getenv("JANITOR_INTERVAL_MIN", "10"))
+
+# Disk admission control for TEMP_DIR
+TEMP_DIR_QUOTA_MB = int(os.getenv("TEMP_DIR_QUOTA_MB", "4096"))
+DISK_MIN_FREE_MB = int(os.getenv("DISK_MIN_FREE_MB", "512"))
+
+# Audio output: "copy" remuxes sources listed in AUDIO_REMUX_CODECS without re-encoding
+# and converts everything else to MP3; "mp3" always converts. A codec a chat picks
+# with /format is remuxed too.
+AUDIO_OUTPUT_POLICY = os.getenv("AUDIO_OUTPUT_POLICY", "copy")
+AUDIO_REMUX_CODECS = os.getenv("AUDIO_REMUX_CODECS", "m4a")
+AUDIO_MP3_QUALITY = os.getenv("AUDIO_MP3_QUALITY", "5")
+AUDIO_MP3_PRESET = os.getenv("AUDIO_MP3_PRESET", "7")
+
+# Cover art embedded into audio tags is downscaled to this size (px)
+COVER_TAG_SIZE = int(os.getenv("COVER_TAG_SIZE", "600"))
+
+# Segmented (range-parallel) downloads of large direct media.
+# SEGMENTED_HOSTS is a comma-separated list of hosts, optionally with a part count: "video.twimg.com=8"
+SEGMENTED_PARTS = int(os.getenv("SEGMENTED_PARTS", "4"))
+SEGMENTED_MIN_SIZE_MB = int(os.getenv("SEGMENTED_MIN_SIZE_MB", "16"))
+SEGMENTED_HOSTS = os.getenv("SEGMENTED_HOSTS", "video.twimg.com,pinimg.com,i.pximg.net,cdninstagram.com,fbcdn.net")
+
+# Retries of direct downloads: exponential backoff with jitter and a per-host retry budget
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_BACKOFF_BASE = float(os.getenv("DOWNLOAD_BACKOFF_BASE", "0.5"))
+DOWNLOAD_BACKOFF_MAX = float(os.getenv("DOWNLOAD_BACKOFF_MAX", "10"))
+HOST_RETRY_BUDGET = int(os.getenv("HOST_RETRY_BUDGET", "30"))
+
+# Oversized videos: "reencode" (split if the bitrate would be too low), "split" or "off" (reject)
+VIDEO_FIT_POLICY = os.getenv("VIDEO_FIT_POLICY", "reencode")
+VIDEO_FIT_SOURCE_FACTOR = int(os.getenv("VIDEO_FIT_SOURCE_FACTOR", "4"))
+VIDEO_FIT_MAX_HEIGHT = int(os.getenv("VIDEO_FIT_MAX_HEIGHT", "720"))
+VIDEO_FIT_MIN_KBPS = int(os.getenv("VIDEO_FIT_MIN_KBPS", "300"))
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, 0 = disabled
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Job tracing: JSON line per job in other/logs/jobs.log, optional OTLP/HTTP export
+# (e.g. http://localhost:4318/v1/traces) and an admin report for jobs slower than SLOW_JOB_SECONDS (0 = off)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+SLOW_JOB_SECONDS = int(os.getenv("SLOW_JOB_SECONDS", "120"))
+
+# Event loop health: lag sampling period (s), and a stack trace in the log when a callback
+# holds the loop longer than BLOCKING_THRESHOLD_MS (0 = off, for debugging)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+BLOCKING_THRESHOLD_MS = int(os.getenv("BLOCKING_THRESHOLD_MS", "0"))
+
+# /news_spam broadcasts: messages per second (Telegram allows about 30), parallel senders,
+# and chats read from the database per batch (progress is saved after every batch)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
@@ -77,22 +77,3 @@ class SQLiteDatabaseManager:
 
         return False
 
-
-async def create_table_settings():
-    """
-    Creates the 'chat_settings' table in the SQLite database if it does not already exist.
-
-    The table includes:
-        - chat_id (INTEGER PRIMARY KEY): Unique identifier for the chat.
-        - lang (TEXT): Language setting for the chat, defaulting to 'en'.
-        - anonime_statistic (BOOLEAN): Indicates if anonymous statistics are enabled, defaulting to 0 (False).
-    """
-    async with SQLiteDatabaseManager() as conn:
-        await conn.execute(
-            """CREATE TABLE IF NOT EXISTS chat_settings (
-                chat_id INTEGER PRIMARY KEY,
-                lang TEXT DEFAULT en,
-                anonime_statistic BOOLEAN DEFAULT 0
-            );
-        """
-        )
@@ -0,0 +1,152 @@
+import logging
+
+from database.database_manager import SQLiteDatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+async def add_missing_columns(cursor, table: str, columns: dict) -> None:
+    """
+    Adds the columns of ``columns`` ({name: definition}) that ``table`` doesn't have yet,
+    for databases created before the columns existed.
+    """
+    await cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in await cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            logger.info(f"Added column {table}.{name}")
+
+
+async def _create_tables(cursor) -> None:
+    """Create chat_settings and broadcasts"""
+    # chat_settings:
+    #   - chat_id: Unique identifier for the chat.
+    #   - lang: Language of the chat. Tables created before the migrations have
+    #     the unquoted DEFAULT en, which SQLite also stores as 'en'.
+    #   - anonime_statistic: Indicates if anonymous statistics are enabled.
+    #   - is_active: 0 once the chat blocked the bot or was deleted; mailings skip it.
+    #   - inactive_reason: Why the chat became inactive: 'blocked' or 'deleted'.
+    #   - inactive_since: When the chat became inactive.
+    await cursor.execute(
+        """CREATE TABLE IF NOT EXISTS chat_settings (
+            chat_id INTEGER PRIMARY KEY,
+            lang TEXT DEFAULT 'en',
+            anonime_statistic BOOLEAN DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            inactive_reason TEXT,
+            inactive_since TEXT
+        );
+    """
+    )
+    await add_missing_columns(cursor, "chat_settings", {
+        "is_active": "BOOLEAN DEFAULT 1",
+        "inactive_reason": "TEXT",
+        "inactive_since": "TEXT",
+    })
+
+    # Every /news_spam mailing is a row. Chats are sent to in chat_id order and
+    # last_chat_id is saved after every batch, so an unfinished mailing
+    # (finished_at IS NULL) resumes from there after a restart.
+    await cursor.execute(
+        """CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            last_chat_id INTEGER,
+            total INTEGER DEFAULT 0,
+            delivered INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            migrated INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0
+        );
+    """
+    )
+    await add_missing_columns(cursor, "broadcasts", {
+        "deleted": "INTEGER DEFAULT 0",
+        "migrated": "INTEGER DEFAULT 0",
+    })
+
+
+async def _add_usage_columns(cursor) -> None:
+    """Add chat_settings.created_at and last_active_at"""
+    # ALTER TABLE can't add a CURRENT_TIMESTAMP default, the inserts set both.
+    # Existing chats keep NULL until they are seen again.
+    await add_missing_columns(cursor, "chat_settings", {
+        "created_at": "TEXT",
+        "last_active_at": "TEXT",
+    })
+
+
+async def _add_preference_columns(cursor) -> None:
+    """Add chat_settings.default_format and audio_codec"""
+    # NULL is "not chosen": the bot asks, or uses its own default
+    await add_missing_columns(cursor, "chat_settings", {
+        "default_format": "TEXT",
+        "audio_codec": "TEXT",
+    })
+
+
+async def _add_chat_indexes(cursor) -> None:
+    """Index chat_settings for mailings and /chat_stats"""
+    # Partial indexes hold only the rows the queries want: mailing batches
+    # and active counts read the active chat_ids in order, /chat_stats
+    # groups the inactive ones by reason and counts recently seen chats.
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_settings_active ON chat_settings (chat_id) WHERE is_active = 1"
+    )
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_settings_inactive ON chat_settings (inactive_reason) WHERE is_active = 0"
+    )
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_settings_last_active ON chat_settings (last_active_at) WHERE is_active = 1"
+    )
+
+
+async def _add_quality_cap_column(cursor) -> None:
+    """Add chat_settings.quality_cap"""
+    # Highest video height to download, NULL for the best that fits the upload limit
+    await add_missing_columns(cursor, "chat_settings", {
+        "quality_cap": "INTEGER",
+    })
+
+
+# Append only: the position of a migration is its schema version
+MIGRATIONS = [
+    _create_tables,
+    _add_usage_columns,
+    _add_preference_columns,
+    _add_chat_indexes,
+    _add_quality_cap_column,
+]
+
+
+async def migrate() -> None:
+    """
+    Brings the database schema up to date.
+
+    The applied version is kept in PRAGMA user_version. Every newer migration
+    runs in its own transaction together with the version bump, so a failed
+    one leaves the database at the previous version and is retried on the
+    next start.
+    """
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number <= version:
+                continue
+
+            logger.info(f"Applying migration {number}: {migration.__doc__}")
+            await cursor.execute("BEGIN")
+            try:
+                await migration(cursor)
+                await cursor.execute(f"PRAGMA user_version = {number}")
+                await cursor.execute("COMMIT")
+            except Exception:
+                await cursor.execute("ROLLBACK")
+                raise
@@ -1,6 +1,13 @@
+import datetime
+from typing import Dict, List, Optional, Tuple
+
 from database.database_manager import SQLiteDatabaseManager
 
 
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
 async def db_add_chat(chat_id: int, locale: str, anonime_statistic: int) -> None:
     """Add chat info into database
 
@@ -9,16 +16,23 @@ async def db_add_chat(chat_id: int, locale: str, anonime_statistic: int) -> None
         locale (str): Localisation, such as: en, ru, etc.
         anonime_statistic (int): Anonime statistic bool
     """
+    now = _now()
     async with SQLiteDatabaseManager() as cursor:
         await cursor.execute(
             """
-            INSERT INTO chat_settings (chat_id, lang, anonime_statistic)
-            SELECT ?, ?, ?
+            INSERT INTO chat_settings (chat_id, lang, anonime_statistic, created_at, last_active_at)
+            SELECT ?, ?, ?, ?, ?
             WHERE NOT EXISTS (
                 SELECT 1 FROM chat_settings WHERE chat_id = ?
             )
             """,
-            (chat_id, locale, anonime_statistic, chat_id),
+            (chat_id, locale, anonime_statistic, now, now, chat_id),
+        )
+        # A chat that blocked the bot and came back gets mailings again
+        await cursor.execute(
+            "UPDATE chat_settings SET is_active = 1, inactive_reason = NULL, inactive_since = NULL "
+            "WHERE chat_id = ? AND is_active = 0",
+            (chat_id,),
         )
 
 
@@ -38,15 +52,18 @@ async def db_change_lang(chat_id: int, lang: str) -> None:
 
         if row:
             await cursor.execute(
-                "UPDATE chat_settings SET lang = ? WHERE chat_id = ?", (lang, chat_id)
+                "UPDATE chat_settings SET lang = ?, is_active = 1, inactive_reason = NULL, inactive_since = NULL "
+                "WHERE chat_id = ?",
+                (lang, chat_id),
             )
         else:
+            now = _now()
             await cursor.execute(
                 """
-                INSERT INTO chat_settings (chat_id, lang, anonime_statistic)
-                SELECT ?, ?, ?
+                INSERT INTO chat_settings (chat_id, lang, anonime_statistic, created_at, last_active_at)
+                SELECT ?, ?, ?, ?, ?
                 """,
-                (chat_id, lang, 0),
+                (chat_id, lang, 0, now, now),
             )
 
 
@@ -69,3 +86,122 @@ async def db_get_lang(chat_id: int) -> str:
             return row[0]
         else:
             return "en"
+
+
+async def db_get_preferences(chat_id: int) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """Get download preferences from database
+
+    Args:
+        chat_id (int): Chat ID
+
+    Returns:
+        tuple: (default_format, quality_cap, audio_codec), None for the ones not chosen
+    """
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.execute(
+            "SELECT default_format, quality_cap, audio_codec FROM chat_settings WHERE chat_id = ?", (chat_id,)
+        )
+        row = await cursor.fetchone()
+        return tuple(row) if row else (None, None, None)
+
+
+async def db_set_preferences(chat_id: int, default_format: Optional[str], quality_cap: Optional[int], audio_codec: Optional[str]) -> None:
+    """Change download preferences in database
+
+    Args:
+        chat_id (int): Chat ID
+        default_format (str): 'video' or 'audio', None to ask for every YouTube link
+        quality_cap (int): Highest video height, None for no cap
+        audio_codec (str): 'm4a' or 'opus', None for the bot's choice
+    """
+    now = _now()
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.execute(
+            """
+            INSERT INTO chat_settings (chat_id, default_format, quality_cap, audio_codec, created_at, last_active_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                default_format = excluded.default_format,
+                quality_cap = excluded.quality_cap,
+                audio_codec = excluded.audio_codec
+            """,
+            (chat_id, default_format, quality_cap, audio_codec, now, now),
+        )
+
+
+async def db_deactivate_chats(chats: List[Tuple[int, str]]) -> None:
+    """Mark chats as inactive, so mailings skip them
+
+    Args:
+        chats (list): (chat_id, reason) pairs, reason being 'blocked' or 'deleted'
+    """
+    now = _now()
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.executemany(
+            "UPDATE chat_settings SET is_active = 0, inactive_reason = ?, inactive_since = ? WHERE chat_id = ?",
+            [(reason, now, chat_id) for chat_id, reason in chats],
+        )
+
+
+async def db_migrate_chat(old_chat_id: int, new_chat_id: int) -> bool:
+    """Move the settings of a group to the ID of the supergroup it became
+
+    Args:
+        old_chat_id (int): Group Chat ID
+        new_chat_id (int): Supergroup Chat ID
+
+    Returns:
+        bool: False if the supergroup already had settings, the group's are dropped then
+    """
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.execute("SELECT 1 FROM chat_settings WHERE chat_id = ?", (new_chat_id,))
+        if await cursor.fetchone():
+            await cursor.execute("DELETE FROM chat_settings WHERE chat_id = ?", (old_chat_id,))
+            return False
+
+        await cursor.execute(
+            "UPDATE chat_settings SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id)
+        )
+        return True
+
+
+async def db_touch_chats(chat_ids: List[int]) -> None:
+    """Record that chats used the bot, which also brings back chats marked inactive
+
+    Args:
+        chat_ids (list): Chat IDs seen since the last call
+    """
+    now = _now()
+    async with SQLiteDatabaseManager() as cursor:
+        await cursor.executemany(
+            "UPDATE chat_settings SET last_active_at = ?, is_active = 1, inactive_reason = NULL, inactive_since = NULL "
+            "WHERE chat_id = ?",
+            [(now, chat_id) for chat_id in chat_ids],
+        )
+
+
+async def db_chat_stats(recent_days: int = 30) -> Dict[str, int]:
+    """Count chats by state
+
+    Args:
+        recent_days (int): Window for 'recent', the active chats seen in the last days
+
+    Returns:
+        dict: Number of chats for 'active', 'recent' and for every inactive reason
+    """
+    since = (datetime.datetime.now() - datetime.timedelta(days=recent_days)).strftime("%Y-%m-%d %H:%M:%S")
+    async with SQLiteDatabaseManager() as cursor:
+        # Each query reads one of the partial indexes on chat_settings, never the table
+        await cursor.execute("SELECT COUNT(*) FROM chat_settings WHERE is_active = 1")
+        stats: Dict[str, int] = {"active": (await cursor.fetchone())[0]}
+        await cursor.execute(
+            "SELECT COUNT(*) FROM chat_settings WHERE is_active = 1 AND last_active_at >= ?", (since,)
+        )
+        stats["recent"] = (await cursor.fetchone())[0]
+        await cursor.execute(
+            "SELECT inactive_reason, COUNT(*) FROM chat_settings WHERE is_active = 0 GROUP BY inactive_reason"
+        )
+        for reason, count in await cursor.fetchall():
+            key = reason or "unknown"
+            stats[key] = stats.get(key, 0) + count
+        return stats
@@ -21,3 +21,11 @@ async def get_database_handler(message: Message, state: FSMContext) -> None:
         return
 
     await message.answer_document(document=types.FSInputFile("database/database.sql"))
+
+
+@dp.message(Command("get_jobs_log"))
+async def get_jobs_log_handler(message: Message, state: FSMContext) -> None:
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    await message.answer_document(document=types.FSInputFile("other/logs/jobs.log"))
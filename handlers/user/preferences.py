@@ -0,0 +1,78 @@
+from aiogram import F
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from aiogram.utils.i18n import gettext as _
+
+from handlers.user.settings import check_if_admin_or_owner
+from loader import dp
+from managers.preference_manager import AUDIO_CODECS, FORMATS, QUALITY_CAPS, ChatPreferences, preference_manager
+
+
+def preferences_keyboard(preferences: ChatPreferences) -> InlineKeyboardMarkup:
+    def button(text: str, selected: bool, data: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(text=f"✅ {text}" if selected else text, callback_data=f"pref:{data}")
+
+    formats = {"video": _("Video"), "audio": _("Audio")}
+    codecs = {"m4a": "M4A", "opus": "Opus"}
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [button(_("Ask every time"), preferences.default_format is None, "format:ask")]
+        + [button(formats[name], preferences.default_format == name, f"format:{name}") for name in FORMATS],
+        [button(_("Best quality"), preferences.quality_cap is None, "quality:0")]
+        + [button(f"{cap}p", preferences.quality_cap == cap, f"quality:{cap}") for cap in QUALITY_CAPS],
+        [button(_("Any codec"), preferences.audio_codec is None, "codec:auto")]
+        + [button(codecs[codec], preferences.audio_codec == codec, f"codec:{codec}") for codec in AUDIO_CODECS],
+    ])
+
+
+async def can_edit(message: Message, user_id: int) -> bool:
+    if message.chat.type in ("group", "supergroup"):
+        return await check_if_admin_or_owner(message.bot, message.chat.id, user_id)
+    return True
+
+
+@dp.message(Command("format"))
+async def format_command(message: Message) -> None:
+    if not await can_edit(message, message.from_user.id):
+        await message.answer(_("You have no rights to edit these settings!"))
+        return
+
+    preferences = await preference_manager.get(message.chat.id)
+    await message.answer(
+        _(
+            "Download preferences for YouTube links\n\n"
+            "First row: the format to download without asking\n"
+            "Second row: the highest video resolution\n"
+            "Third row: the preferred audio codec"
+        ),
+        reply_markup=preferences_keyboard(preferences),
+    )
+
+
+@dp.callback_query(F.data.startswith("pref:"))
+async def preference_choice_handler(callback_query: CallbackQuery) -> None:
+    message = callback_query.message
+    if not isinstance(message, Message):
+        return
+    if not await can_edit(message, callback_query.from_user.id):
+        await callback_query.answer(_("You have no rights to edit these settings!"), show_alert=True)
+        return
+
+    field, value = callback_query.data.split(":")[1:]
+    if field == "format":
+        changes = {"default_format": value if value in FORMATS else None}
+    elif field == "quality":
+        changes = {"quality_cap": int(value) if int(value) in QUALITY_CAPS else None}
+    elif field == "codec":
+        changes = {"audio_codec": value if value in AUDIO_CODECS else None}
+    else:
+        return
+
+    current = await preference_manager.get(message.chat.id)
+    if all(getattr(current, name) == changed for name, changed in changes.items()):
+        # Editing the message to the same keyboard is an error in Telegram
+        await callback_query.answer()
+        return
+
+    preferences = await preference_manager.update(message.chat.id, **changes)
+    await message.edit_reply_markup(reply_markup=preferences_keyboard(preferences))
+    await callback_query.answer(_("Saved"))
@@ -12,9 +12,10 @@ from aiogram.types import (
 from aiogram.utils.i18n import gettext as _
 
 from filters.settings_filter import EmojiTextFilter
-from functions.db import db_change_lang
+from functions.db import db_change_lang, db_migrate_chat
 from main import custom_i18n
 from loader import dp
+from managers.preference_manager import preference_manager
 
 
 class Settings(StatesGroup):
@@ -98,4 +99,12 @@ async def check_if_admin_or_owner(bot: Bot, chat_id: int, user_id: int) -> bool:
     if chat_member.status in [ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR]:
         return True
     else:
-        return False
\ No newline at end of file
+        return False
+
+
+@dp.message(F.migrate_to_chat_id)
+async def chat_migrated_handler(message: Message) -> None:
+    # The group became a supergroup with a new ID: keep its settings and mailings
+    await db_migrate_chat(message.chat.id, message.migrate_to_chat_id)
+    custom_i18n.clear_cache(message.chat.id)
+    preference_manager.clear_cache(message.chat.id)
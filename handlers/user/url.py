@@ -1,18 +1,23 @@
 import asyncio
+import time
 from asyncio import Semaphore
 from collections import defaultdict
 from typing import Optional
 
 import aiogram
-from aiogram import types
+from aiogram import F, types
 from aiogram.utils.i18n import gettext as _
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from filters.url_filter import UrlFilter
 from loader import dp
 from managers.download_manager import MediaHandler, TaskManager, user_tasks
+from managers.preference_manager import preference_manager
+from managers.workspace_manager import workspace_manager
 from utils import get_service_handler, handle_download_error, random_emoji
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import JOB_SECONDS, JOBS, PHASE_SECONDS, current_service, track_phase
+from utils.tracing import finish_trace, start_trace
 
 user_semaphores = defaultdict(lambda: Semaphore(1))
 
@@ -33,24 +38,32 @@ async def url_handler(message: types.Message) -> None:
     url = message.text
     if not url:
         return
+    started = time.perf_counter()
     service = get_service_handler(url)
+    PHASE_SECONDS.observe(time.perf_counter() - started, service=service.name, phase="resolve")
 
+    format_choice = None
     if service.name == "Youtube":
-        markup = InlineKeyboardBuilder()
-        markup.add(types.InlineKeyboardButton(text=_("Video"), callback_data="video"))
-        markup.add(types.InlineKeyboardButton(text=_("Audio"), callback_data="audio"))
+        # A chat with a default format set in /format skips the prompt
+        preferences = await preference_manager.get(message.chat.id)
+        if not preferences.default_format:
+            markup = InlineKeyboardBuilder()
+            markup.add(types.InlineKeyboardButton(text=_("Video"), callback_data="video"))
+            markup.add(types.InlineKeyboardButton(text=_("Audio"), callback_data="audio"))
+
+            await message.reply(
+                _("Choose a format to download:"), reply_markup=markup.as_markup()
+            )
+            return
+        format_choice = f"{preferences.default_format}:{user_id}"
 
-        await message.reply(
-            _("Choose a format to download:"), reply_markup=markup.as_markup()
-        )
-    else:
-        coro = handle_playlist_download(service, url, message) if service.is_playlist(url) else handle_single_download(service, url, message)
-        task = asyncio.create_task(download_wrapper(user_id, coro))
+    coro = handle_playlist_download(service, url, message) if service.is_playlist(url) else handle_single_download(service, url, message, format_choice=format_choice)
+    task = asyncio.create_task(download_wrapper(user_id, coro))
 
-        TaskManager().add_task(user_id, task)
+    TaskManager().add_task(user_id, task)
 
 
-@dp.callback_query()
+@dp.callback_query(F.data.in_({"video", "audio"}))
 async def format_choice_handler(callback_query: types.CallbackQuery):
     choice = callback_query.data
     user_id = callback_query.from_user.id
@@ -84,27 +97,49 @@ async def handle_single_download(
     user_id = 0
     assert message.bot, "Bot is not found"
 
+    current_service.set(service.name)
+    trace = start_trace(
+        service.name,
+        url,
+        chat_id=message.chat.id,
+        user_id=int(format_choice.split(":")[1]) if format_choice else (message.from_user.id if message.from_user else None),
+    )
+    if format_choice:
+        trace.attributes["format"] = format_choice.split(":")[0]
+    started = time.perf_counter()
+    result = "ok"
     try:
-        if service.name == "Youtube" and format_choice:
-            format, user_id = format_choice.split(":")
-            content = await service.download(url, format)
-        else:
-            await message.bot.send_chat_action(message.chat.id, "record_video")
-            user = message.from_user
-            if user is None:
-                return
-            user_id = user.id
-            content = await service.download(url)
-        if not content:
-            raise BotError(
-                code=ErrorCode.DOWNLOAD_FAILED,
-                url=url,
-                message="No content found",
-                critical=True,
-                is_logged=True
-            )
-
-        await MediaHandler.send_media_content(message, content)
+        async with workspace_manager.workspace() as workspace:
+            if service.name == "Youtube" and format_choice:
+                format, user_id = format_choice.split(":")
+                preferences = await preference_manager.get(message.chat.id)
+                content = await service.download(
+                    url,
+                    format,
+                    output_path=str(workspace.path),
+                    quality_cap=preferences.quality_cap,
+                    audio_codec=preferences.audio_codec,
+                )
+            else:
+                await message.bot.send_chat_action(message.chat.id, "record_video")
+                user = message.from_user
+                if user is None:
+                    return
+                user_id = user.id
+                content = await service.download(url, output_path=str(workspace.path))
+            if not content:
+                raise BotError(
+                    code=ErrorCode.DOWNLOAD_FAILED,
+                    url=url,
+                    message="No content found",
+                    critical=True,
+                    is_logged=True
+                )
+
+            trace.attributes["files"] = len(content)
+            trace.attributes["bytes"] = MediaHandler.count_upload(content)
+            with track_phase("upload"):
+                await MediaHandler.send_media_content(message, content)
 
     except Exception as e:
         if not isinstance(e, BotError):
@@ -115,9 +150,13 @@ async def handle_single_download(
                 critical=True,
                 is_logged=True
             )
+        result = e.code.value
         await handle_download_error(message, e)
 
     finally:
+        JOBS.inc(service=service.name, result=result)
+        JOB_SECONDS.observe(time.perf_counter() - started, service=service.name)
+        await finish_trace(trace, result, message.bot)
         TaskManager().remove_task(int(user_id))
 
 
@@ -125,6 +164,8 @@ async def handle_playlist_download(service, url: str, message: types.Message) ->
     """Handle download of a playlist."""
     assert message.bot, "Bot is not found"
 
+    current_service.set(service.name)
+
     try:
         tracks = await service.get_playlist_tracks(url)
         if isinstance(tracks, BotError):
@@ -133,12 +174,25 @@ async def handle_playlist_download(service, url: str, message: types.Message) ->
             if message.from_user.id not in user_tasks:
                 break
 
+            trace = start_trace(service.name, track, chat_id=message.chat.id, user_id=message.from_user.id)
+            trace.attributes["playlist"] = url
+            started = time.perf_counter()
+            result = "ok"
             try:
-                await message.bot.send_chat_action(message.chat.id, "record_voice")
-                file = await service.download(track)
-                await MediaHandler.send_audio(message, file[0])
-            except Exception:
+                async with workspace_manager.workspace() as workspace:
+                    await message.bot.send_chat_action(message.chat.id, "record_voice")
+                    file = await service.download(track, output_path=str(workspace.path))
+                    trace.attributes["files"] = 1
+                    trace.attributes["bytes"] = MediaHandler.count_upload(file[:1])
+                    with track_phase("upload"):
+                        await MediaHandler.send_audio(message, file[0])
+            except Exception as e:
+                result = e.code.value if isinstance(e, BotError) else ErrorCode.DOWNLOAD_FAILED.value
                 continue
+            finally:
+                JOBS.inc(service=service.name, result=result)
+                JOB_SECONDS.observe(time.perf_counter() - started, service=service.name)
+                await finish_trace(trace, result, message.bot)
 
         await message.reply(_("Download completed."))
     except Exception as e:
@@ -5,12 +5,12 @@ from aiogram.client.default import DefaultBotProperties
 from config.secrets import BOT_TOKEN
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
-from config.settings import LOCAL_SERVER
+from config.settings import LOCAL_SERVER, LOCAL_SERVER_FILES
 
 # Initialize the Telegram bot with the given token and parse mode set to HTML
 if LOCAL_SERVER:
     session = AiohttpSession(
-        api=TelegramAPIServer.from_base(LOCAL_SERVER)
+        api=TelegramAPIServer.from_base(LOCAL_SERVER, is_local=bool(LOCAL_SERVER_FILES))
     )
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML), session=session)
 else:
@@ -5,9 +5,16 @@ import os
 import pkgutil
 from logging.handlers import TimedRotatingFileHandler
 
-from database.database_manager import create_table_settings
+from config.settings import METRICS_HOST, METRICS_PORT
+from database.migrations import migrate
 from loader import bot, dp
+from managers.broadcast_manager import broadcast_manager
+from managers.cache_manager import media_cache
+from managers.workspace_manager import workspace_manager
+from utils.activity_middleware import ActivityMiddleware
+from utils.loop_monitor import loop_monitor
 from utils.language_middleware import CustomI18nMiddleware
+from utils.metrics import start_metrics_server
 from aiogram.utils.i18n import I18n, FSMI18nMiddleware
 from utils.register_services import initialize_services
 from utils.set_bot_commands import set_default_commands
@@ -20,6 +27,12 @@ dp.update.middleware(fsm_i18n)
 custom_i18n = CustomI18nMiddleware(i18n)
 dp.update.middleware(custom_i18n)
 
+activity = ActivityMiddleware()
+dp.update.middleware(activity)
+
+# Background loops, kept so they aren't garbage-collected while they run
+_background_tasks: set = set()
+
 # Setup Logger
 log_dir = "other/logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -37,6 +50,15 @@ file_handler.setFormatter(logging.Formatter(log_format))
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter(log_format))
 
+# One JSON line per download job, kept out of the main log
+jobs_handler = TimedRotatingFileHandler(
+    os.path.join(log_dir, "jobs.log"), when="midnight", interval=1, backupCount=7, encoding="utf-8"
+)
+jobs_handler.setFormatter(logging.Formatter("%(message)s"))
+jobs_logger = logging.getLogger("jobs")
+jobs_logger.addHandler(jobs_handler)
+jobs_logger.propagate = False
+
 # Setup logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -55,7 +77,10 @@ async def main():
 
     try:
         logger.info("Setting up database...")
-        await create_table_settings()
+        await migrate()
+
+        logger.info("Loading media cache...")
+        await media_cache.scan()
 
         logger.info("Setting default commands...")
         await set_default_commands()
@@ -68,6 +93,22 @@ async def main():
         logger.info("Initializing services...")
         initialize_services()
 
+        logger.info("Starting workspace janitor...")
+        _background_tasks.add(asyncio.create_task(workspace_manager.run_janitor()))
+
+        logger.info("Starting event loop monitor...")
+        _background_tasks.add(asyncio.create_task(loop_monitor.run()))
+
+        logger.info("Starting chat activity recorder...")
+        _background_tasks.add(asyncio.create_task(activity.run()))
+
+        if METRICS_PORT:
+            logger.info("Starting metrics server...")
+            await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+        logger.info("Resuming unfinished mailing...")
+        await broadcast_manager.resume(bot)
+
         await bot.delete_webhook(drop_pending_updates=True)
         await dp.start_polling(bot)
     except Exception as e:
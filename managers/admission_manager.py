@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import shutil
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from config.settings import DISK_MIN_FREE_MB, TEMP_DIR, TEMP_DIR_QUOTA_MB
+from utils.error_handler import BotError, ErrorCode
+from utils.metrics import DISK_RESERVED, DISK_WAITING
+
+logger = logging.getLogger(__name__)
+
+# Used when neither the metadata nor the response tell us the size
+DEFAULT_PHOTO_ESTIMATE = 5 * 1024 * 1024
+DEFAULT_VIDEO_ESTIMATE = 50 * 1024 * 1024
+
+
+def estimate_info_size(info_dict: Dict[str, Any], factor: float = 1.0) -> int:
+    """
+    Estimates how many bytes a yt-dlp download will take on disk.
+
+    Args:
+        info_dict (dict): Info dict returned by ``extract_info(download=False)``.
+        factor (float): Multiplier for postprocessing, e.g. 2 when the file is
+            converted and both versions exist at the same time.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    formats = info_dict.get("requested_formats") or [info_dict]
+    duration = info_dict.get("duration") or 0
+
+    total = 0
+    for f in formats:
+        size = f.get("filesize") or f.get("filesize_approx")
+        if not size and f.get("tbr") and duration:
+            size = f["tbr"] * 1000 / 8 * duration
+        total += size or DEFAULT_VIDEO_ESTIMATE
+
+    return int(total * factor)
+
+
+class DiskAdmissionController:
+    """
+    Reserves temp-dir space for download jobs before they write anything.
+
+    Every job (identified by its workspace path) reserves its estimated size
+    against a quota. Jobs that don't fit wait until running jobs release
+    their reservations, so the disk never fills up mid-download.
+
+    The quota only gates new jobs: a job that already holds a reservation
+    and reserves again for its next file grows it without waiting. Its space
+    is only freed when the job ends, so waiting there could never finish.
+    """
+
+    def __init__(self, root: str = TEMP_DIR, quota_mb: int = TEMP_DIR_QUOTA_MB, min_free_mb: int = DISK_MIN_FREE_MB) -> None:
+        self.root = root
+        self.quota = quota_mb * 1024 * 1024
+        self.min_free = min_free_mb * 1024 * 1024
+        self._reserved: Dict[str, int] = defaultdict(int)
+        self._total = 0
+        self._waiting = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def reserved(self) -> int:
+        return self._total
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _free_space(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return self.quota
+
+    def _fits(self, size: int) -> bool:
+        if self._total == 0:
+            # A single oversized job is still admitted when the disk is idle
+            return True
+        return self._total + size <= self.quota and size <= self._free_space() - self.min_free
+
+    async def reserve(self, owner: Optional[str], size: int) -> None:
+        """
+        Reserves ``size`` bytes for the job, waiting until there is room
+        unless the job already holds a reservation.
+
+        Args:
+            owner (str): Job workspace path. Reservations without owner are skipped.
+            size (int): Estimated number of bytes the job will write.
+
+        Raises:
+            BotError: If the disk is out of space and no job can free it.
+        """
+        if not owner or size <= 0:
+            return
+
+        async with self._condition:
+            if self._total == 0 and size > self._free_space() - self.min_free:
+                raise BotError(
+                    code=ErrorCode.LARGE_FILE,
+                    message=f"Not enough disk space for {size} bytes",
+                    critical=True,
+                    is_logged=True,
+                )
+
+            if owner not in self._reserved and not self._fits(size):
+                logger.info(f"Job {owner} queued: needs {size} bytes, {self._total} bytes reserved")
+                self._waiting += 1
+                try:
+                    await self._condition.wait_for(lambda: self._fits(size))
+                finally:
+                    self._waiting -= 1
+
+            self._reserved[owner] += size
+            self._total += size
+
+    async def release(self, owner: Optional[str]) -> None:
+        """Releases every reservation held by the job."""
+        if not owner:
+            return
+
+        async with self._condition:
+            size = self._reserved.pop(owner, 0)
+            if size:
+                self._total -= size
+                self._condition.notify_all()
+
+
+disk_admission = DiskAdmissionController()
+DISK_WAITING.set_function(lambda: {(): disk_admission.waiting})
+DISK_RESERVED.set_function(lambda: {(): disk_admission.reserved})
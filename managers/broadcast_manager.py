@@ -0,0 +1,317 @@
+import asyncio
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.utils.i18n import gettext
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config.settings import BROADCAST_BATCH_SIZE, BROADCAST_CONCURRENCY, BROADCAST_RATE
+from database.database_manager import SQLiteDatabaseManager
+from functions.db import db_deactivate_chats, db_migrate_chat
+
+logger = logging.getLogger(__name__)
+
+SEND_ATTEMPTS = 3
+# Pause before retrying a network or server error, seconds
+TRANSIENT_ERROR_DELAY = 2
+# Below any chat id, for the first batch
+FIRST_CHAT_ID = -(2 ** 63)
+
+
+class TokenBucket:
+    """
+    Paces sends to ``rate`` per second, with bursts of up to one second of sends.
+
+    A flood wait from Telegram pauses every sender for as long as asked and
+    halves the rate; every clean send then raises it by ``recovery`` until
+    it is back at the maximum.
+    """
+
+    def __init__(self, rate: float, recovery: float = 0.05) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.recovery = recovery
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so senders are served in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def backoff(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.rate = max(1.0, self.rate / 2)
+        self._tokens = 0
+
+    def recover(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.recovery)
+
+
+@dataclass
+class Broadcast:
+    id: int
+    admin_chat_id: int
+    text: str
+    started_at: str
+    last_chat_id: Optional[int] = None
+    total: int = 0
+    delivered: int = 0
+    blocked: int = 0
+    failed: int = 0
+    deleted: int = 0
+    migrated: int = 0
+    finished_at: Optional[str] = None
+
+    @property
+    def processed(self) -> int:
+        return self.delivered + self.blocked + self.deleted + self.failed
+
+    def report(self) -> str:
+        """The admin report, in the current locale."""
+        if self.finished_at:
+            # The summary the mailing always ended with, so its translations still apply
+            lines = [
+                _(
+                    "The mailing has been completed\n"
+                    "Beginning at {start_time}\n"
+                    "Ended at {end_time}\n"
+                    "Number of chats: {total_chat}\n"
+                    "Successfully sent: {sucсess_send}\n"
+                    "erros: {error_send}"
+                ).format(**{
+                    "start_time": self.started_at,
+                    "end_time": self.finished_at,
+                    "total_chat": self.total,
+                    "sucсess_send": self.delivered,
+                    "error_send": self.failed,
+                })
+            ]
+        else:
+            lines = [
+                _("The mailing is running"),
+                _("Beginning at {start_time}").format(start_time=self.started_at),
+                _("Number of chats: {count}").format(count=self.total),
+                _("Delivered: {count}").format(count=self.delivered),
+                _("Failed: {count}").format(count=self.failed),
+            ]
+        lines += [
+            _("Blocked the bot: {count}").format(count=self.blocked),
+            _("Deleted chats: {count}").format(count=self.deleted),
+            _("Groups moved to a new ID: {count}").format(count=self.migrated),
+            _("Removed from future mailings: {count}").format(count=self.blocked + self.deleted),
+        ]
+        if not self.finished_at:
+            lines.append(_("Left: {count}").format(count=max(0, self.total - self.processed)))
+        return "\n".join(lines)
+
+
+def _(text: str) -> str:
+    # Mailings resumed at startup report outside of any update, with no locale set
+    try:
+        return gettext(text)
+    except LookupError:
+        return text
+
+
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class BroadcastManager:
+    """
+    Sends /news_spam mailings to every chat.
+
+    Chats are read from the database in batches of ``batch_size`` in chat_id
+    order and sent to by ``concurrency`` senders sharing one token bucket.
+    Progress is saved after every batch, so after a restart the mailing
+    resumes with the unfinished batch. Only one mailing runs at a time.
+
+    Chats that blocked the bot or no longer exist are marked inactive and
+    skipped from then on; groups that became supergroups get their new ID.
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY, batch_size: int = BROADCAST_BATCH_SIZE) -> None:
+        self.rate = rate
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.current: Optional[Broadcast] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, admin_chat_id: int, text: str) -> bool:
+        """Starts a mailing of ``text`` (MarkdownV2), False if one is already running."""
+        if self.running:
+            return False
+
+        async with SQLiteDatabaseManager() as cursor:
+            await cursor.execute("SELECT COUNT(*) FROM chat_settings WHERE is_active = 1 AND chat_id != ?", (admin_chat_id,))
+            total = (await cursor.fetchone())[0]
+            started_at = _now()
+            await cursor.execute(
+                "INSERT INTO broadcasts (admin_chat_id, text, started_at, total) VALUES (?, ?, ?, ?)",
+                (admin_chat_id, text, started_at, total),
+            )
+            broadcast = Broadcast(id=cursor.lastrowid, admin_chat_id=admin_chat_id, text=text, started_at=started_at, total=total)
+
+        self._spawn(bot, broadcast)
+        return True
+
+    async def resume(self, bot: Bot) -> None:
+        """Continues the mailing interrupted by a restart, if there is one."""
+        async with SQLiteDatabaseManager() as cursor:
+            await cursor.execute(
+                "SELECT id, admin_chat_id, text, started_at, last_chat_id, total, delivered, blocked, failed, deleted, migrated "
+                "FROM broadcasts WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return
+
+        broadcast = Broadcast(*row)
+        logger.info(f"Resuming mailing {broadcast.id} after chat {broadcast.last_chat_id}")
+        try:
+            await bot.send_message(broadcast.admin_chat_id, _("The mailing was resumed after a restart") + f"\n\n{broadcast.report()}")
+        except TelegramAPIError as e:
+            logger.warning(f"Failed to notify the admin about the resumed mailing: {e}")
+        self._spawn(bot, broadcast)
+
+    def _spawn(self, bot: Bot, broadcast: Broadcast) -> None:
+        self.current = broadcast
+        self._task = asyncio.create_task(self._run(bot, broadcast))
+
+    async def _run(self, bot: Bot, broadcast: Broadcast) -> None:
+        bucket = TokenBucket(self.rate)
+        try:
+            while True:
+                chat_ids = await self._next_batch(broadcast)
+                if not chat_ids:
+                    break
+                await self._send_batch(bot, bucket, broadcast, chat_ids)
+                broadcast.last_chat_id = chat_ids[-1]
+                await self._save(broadcast)
+
+            broadcast.finished_at = _now()
+            await self._save(broadcast)
+            logger.info(
+                f"Mailing {broadcast.id} finished: {broadcast.delivered} delivered, {broadcast.blocked} blocked, "
+                f"{broadcast.deleted} deleted, {broadcast.failed} failed"
+            )
+            await bot.send_message(broadcast.admin_chat_id, broadcast.report())
+        except Exception as e:
+            # The saved progress stays, the mailing resumes after a restart
+            logger.error(f"Mailing {broadcast.id} stopped: {e}")
+
+    async def _next_batch(self, broadcast: Broadcast) -> List[int]:
+        # Keyset pagination over idx_chat_settings_active, which holds only the active
+        # chat_ids in order: no cursor stays open between batches, no inactive row is read
+        last = broadcast.last_chat_id if broadcast.last_chat_id is not None else FIRST_CHAT_ID
+        async with SQLiteDatabaseManager() as cursor:
+            await cursor.execute(
+                "SELECT chat_id FROM chat_settings WHERE chat_id > ? AND is_active = 1 ORDER BY chat_id LIMIT ?",
+                (last, self.batch_size),
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def _save(self, broadcast: Broadcast) -> None:
+        async with SQLiteDatabaseManager() as cursor:
+            await cursor.execute(
+                "UPDATE broadcasts SET last_chat_id = ?, delivered = ?, blocked = ?, failed = ?, deleted = ?, migrated = ?, "
+                "finished_at = ? WHERE id = ?",
+                (
+                    broadcast.last_chat_id, broadcast.delivered, broadcast.blocked, broadcast.failed,
+                    broadcast.deleted, broadcast.migrated, broadcast.finished_at, broadcast.id,
+                ),
+            )
+
+    async def _send_batch(self, bot: Bot, bucket: TokenBucket, broadcast: Broadcast, chat_ids: List[int]) -> None:
+        pending = iter(chat_id for chat_id in chat_ids if chat_id != broadcast.admin_chat_id)
+        dead: List[Tuple[int, str]] = []
+        await asyncio.gather(*(self._sender(bot, bucket, broadcast, pending, dead) for _ in range(self.concurrency)))
+        if dead:
+            await db_deactivate_chats(dead)
+
+    async def _sender(self, bot: Bot, bucket: TokenBucket, broadcast: Broadcast, pending: Iterator[int], dead: List[Tuple[int, str]]) -> None:
+        for chat_id in pending:
+            outcome = await self._send(bot, bucket, broadcast, chat_id)
+            if outcome is None:
+                continue
+            result, chat_id = outcome
+            setattr(broadcast, result, getattr(broadcast, result) + 1)
+            if result in ("blocked", "deleted"):
+                dead.append((chat_id, result))
+
+    async def _send(self, bot: Bot, bucket: TokenBucket, broadcast: Broadcast, chat_id: int) -> Optional[Tuple[str, int]]:
+        """
+        Sends to one chat. Returns the counter to increase (delivered, blocked,
+        deleted or failed) with the chat ID, which changes when a group has
+        moved, or None when the chat is covered by another row.
+        """
+        for attempt in range(SEND_ATTEMPTS):
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id, broadcast.text, parse_mode=ParseMode.MARKDOWN_V2)
+                bucket.recover()
+                return "delivered", chat_id
+            except TelegramRetryAfter as e:
+                bucket.backoff(e.retry_after)
+                logger.warning(f"Mailing: flood wait of {e.retry_after}s, slowing down to {bucket.rate:.1f} msg/s")
+            except TelegramMigrateToChat as e:
+                broadcast.migrated += 1
+                if not await db_migrate_chat(chat_id, e.migrate_to_chat_id):
+                    # The supergroup has its own row and gets the message through it
+                    return None
+                chat_id = e.migrate_to_chat_id
+            except TelegramForbiddenError as e:
+                # "user is deactivated" is a deleted account, the rest blocked or kicked the bot
+                return ("deleted" if "deactivated" in e.message else "blocked"), chat_id
+            except TelegramNotFound:
+                return "deleted", chat_id
+            except TelegramBadRequest as e:
+                if "chat not found" in e.message.lower():
+                    return "deleted", chat_id
+                logger.error(f"Mailing: chat {chat_id}: {e}")
+                return "failed", chat_id
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Mailing: attempt {attempt + 1} for chat {chat_id} failed: {e}")
+                await asyncio.sleep(TRANSIENT_ERROR_DELAY)
+            except TelegramAPIError as e:
+                logger.error(f"Mailing: chat {chat_id}: {e}")
+                return "failed", chat_id
+            except Exception as e:
+                logger.error(f"Mailing: unexpected error for chat {chat_id}: {e}")
+                return "failed", chat_id
+        return "failed", chat_id
+
+
+broadcast_manager = BroadcastManager()
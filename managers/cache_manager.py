@@ -0,0 +1,307 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set, Union
+
+from config.settings import CACHE_DIR, CACHE_EVICTION_POLICY, CACHE_MAX_SIZE_MB
+from utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Pins taken by the current download job, see MediaCache.start_job
+_job_pins: contextvars.ContextVar[Optional[Counter]] = contextvars.ContextVar("job_pins", default=None)
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: Path
+    size: int
+    last_access: float
+    hits: int = 0
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk cache for downloaded media.
+
+    Entries are keyed by (service, media ID, format). Every file is written into
+    a temporary name inside the cache directory and renamed into place, so a
+    crash never leaves a half-written entry behind. When the byte budget is
+    exceeded, entries are evicted by the configured policy ("lru" or "lfu").
+
+    Files handed out by get() and put() are pinned for the download job until
+    it releases them after the send, or until the job ends. Eviction skips
+    pinned entries, and a replaced file that is still pinned is deleted when
+    its last pin goes, so a file is never removed while it is being sent.
+    """
+
+    _tmp_suffix = ".tmp"
+    _meta_suffix = ".json"
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_size_mb: int = CACHE_MAX_SIZE_MB, policy: str = CACHE_EVICTION_POLICY) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.policy = policy.lower()
+        self._entries: Dict[str, CacheEntry] = {}
+        self._paths: Dict[str, str] = {}
+        self._size = 0
+        self._pins: Dict[str, int] = {}
+        self._orphans: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def make_key(service: str, media_id: str, fmt: str) -> str:
+        return hashlib.sha256(f"{service}\x00{media_id}\x00{fmt}".encode()).hexdigest()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _entry_path(self, key: str, suffix: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def contains_path(self, path: Union[str, Path, None]) -> bool:
+        """Check whether the file belongs to the cache and must not be deleted."""
+        if path is None:
+            return False
+        path = os.path.abspath(path)
+        return path in self._paths or path in self._orphans
+
+    async def get(self, service: str, media_id: str, fmt: str) -> Optional[CacheEntry]:
+        key = self.make_key(service, media_id, fmt)
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                CACHE_LOOKUPS.inc(cache=service, result="miss")
+                return None
+
+            if not entry.path.exists():
+                self._forget(entry)
+                CACHE_LOOKUPS.inc(cache=service, result="miss")
+                return None
+
+            CACHE_LOOKUPS.inc(cache=service, result="hit")
+            entry.hits += 1
+            entry.last_access = time.time()
+            self._pin(entry.path)
+            return entry
+
+    async def put(self, service: str, media_id: str, fmt: str, source: Union[str, Path], meta: Optional[Dict[str, Any]] = None) -> Path:
+        """
+        Move a downloaded file into the cache and return its new location.
+
+        Args:
+            service (str): Service name, such as "Youtube".
+            media_id (str): Media identifier inside the service.
+            fmt (str): Format of the stored file, such as "audio" or "video".
+            source (str | Path): Path to the downloaded file.
+            meta (dict): Extra JSON-serializable data stored with the entry.
+
+        Returns:
+            Path: Path of the cached file.
+        """
+        key = self.make_key(service, media_id, fmt)
+        suffix = Path(source).suffix
+        target = self._entry_path(key, suffix)
+
+        size = await asyncio.to_thread(self._store, Path(source), target, meta or {})
+
+        async with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._forget(old)
+                if old.path != target:
+                    if self._pins.get(os.path.abspath(old.path)):
+                        self._orphans.add(os.path.abspath(old.path))
+                    else:
+                        await asyncio.to_thread(self._unlink, old.path)
+
+            entry = CacheEntry(key=key, path=target, size=size, last_access=time.time(), meta=meta or {})
+            self._remember(entry)
+            self._pin(target)
+            await self._evict(keep=key)
+
+        logger.info(f"Cached {service}:{media_id}:{fmt} ({size} bytes)")
+        return target
+
+    def start_job(self) -> contextvars.Token:
+        """Starts collecting the pins of the current download job, see end_job."""
+        return _job_pins.set(Counter())
+
+    async def end_job(self, token: contextvars.Token) -> None:
+        """Releases every pin the job still holds, such as files of a failed send."""
+        held = _job_pins.get()
+        try:
+            _job_pins.reset(token)
+        except ValueError:
+            # Exited in another context than it was started in
+            pass
+        if held:
+            async with self._lock:
+                for path, count in held.items():
+                    await self._unpin(path, count)
+                await self._evict()
+
+    async def release(self, paths: Iterable[Union[str, Path, None]]) -> None:
+        """Releases the job's pins on the given files once they have been sent."""
+        held = _job_pins.get()
+        if not held:
+            return
+
+        async with self._lock:
+            for path in paths:
+                if path is None:
+                    continue
+                path = os.path.abspath(path)
+                if held[path] > 0:
+                    held[path] -= 1
+                    await self._unpin(path, 1)
+            await self._evict()
+
+    def _pin(self, path: Path) -> None:
+        # Pins only live as long as a job that releases them
+        held = _job_pins.get()
+        if held is None:
+            return
+        path = os.path.abspath(path)
+        held[path] += 1
+        self._pins[path] = self._pins.get(path, 0) + 1
+
+    async def _unpin(self, path: str, count: int) -> None:
+        pins = self._pins.get(path, 0) - count
+        if pins > 0:
+            self._pins[path] = pins
+            return
+
+        self._pins.pop(path, None)
+        if path in self._orphans:
+            self._orphans.discard(path)
+            await asyncio.to_thread(self._unlink, Path(path))
+
+    async def scan(self) -> None:
+        """Rebuild the in-memory index from the files on disk."""
+        async with self._lock:
+            self._entries.clear()
+            self._paths.clear()
+            self._size = 0
+            entries = await asyncio.to_thread(self._scan_dir)
+            for entry in entries:
+                self._remember(entry)
+            await self._evict()
+
+        logger.info(f"Media cache loaded: {len(self._entries)} entries, {self._size} bytes")
+
+    def _store(self, source: Path, target: Path, meta: Dict[str, Any]) -> int:
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = target.with_name(f"{target.name}.{uuid.uuid4().hex}{self._tmp_suffix}")
+        try:
+            shutil.move(str(source), tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            self._unlink(tmp_path)
+
+        meta_path = target.with_suffix(self._meta_suffix)
+        tmp_meta = meta_path.with_name(f"{meta_path.name}.{uuid.uuid4().hex}{self._tmp_suffix}")
+        try:
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_meta, meta_path)
+        finally:
+            self._unlink(tmp_meta)
+
+        return target.stat().st_size
+
+    def _scan_dir(self) -> list:
+        entries = []
+        if not self.cache_dir.exists():
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            return entries
+
+        for path in self.cache_dir.rglob("*"):
+            if not path.is_file():
+                continue
+
+            # Leftovers from interrupted writes are never valid entries
+            if path.name.endswith(self._tmp_suffix):
+                self._unlink(path)
+                continue
+
+            if path.suffix == self._meta_suffix:
+                continue
+
+            meta = {}
+            meta_path = path.with_suffix(self._meta_suffix)
+            if meta_path.exists():
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Broken cache metadata {meta_path}: {e}")
+
+            stat = path.stat()
+            entries.append(CacheEntry(
+                key=path.stem,
+                path=path,
+                size=stat.st_size,
+                last_access=max(stat.st_atime, stat.st_mtime),
+                meta=meta,
+            ))
+        return entries
+
+    def _remember(self, entry: CacheEntry) -> None:
+        self._entries[entry.key] = entry
+        self._paths[os.path.abspath(entry.path)] = entry.key
+        self._size += entry.size
+
+    def _forget(self, entry: CacheEntry) -> None:
+        self._entries.pop(entry.key, None)
+        self._paths.pop(os.path.abspath(entry.path), None)
+        self._size -= entry.size
+
+    def _victim_order(self, entry: CacheEntry):
+        if self.policy == "lfu":
+            return (entry.hits, entry.last_access)
+        return (entry.last_access,)
+
+    async def _evict(self, keep: Optional[str] = None) -> None:
+        if self._size <= self.max_size:
+            return
+
+        candidates = sorted(
+            (
+                entry for entry in self._entries.values()
+                if entry.key != keep and not self._pins.get(os.path.abspath(entry.path))
+            ),
+            key=self._victim_order,
+        )
+        for entry in candidates:
+            if self._size <= self.max_size:
+                break
+            self._forget(entry)
+            await asyncio.to_thread(self._unlink, entry.path)
+            await asyncio.to_thread(self._unlink, entry.path.with_suffix(self._meta_suffix))
+            logger.info(f"Evicted cache entry {entry.path} ({entry.size} bytes)")
+
+    @staticmethod
+    def _unlink(path: Path) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting cache file {path}: {e}")
+
+
+media_cache = MediaCache()
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+from PIL import Image
+
+from config.settings import COVER_TAG_SIZE
+from managers.cache_manager import media_cache
+from utils.file_sink import stream_to_file
+from utils.metrics import track_phase
+
+logger = logging.getLogger(__name__)
+
+# Telegram ignores audio thumbnails larger than 320x320 or 200 KB
+THUMBNAIL_SIZE = 320
+THUMBNAIL_MAX_BYTES = 200 * 1024
+
+_CACHE_SERVICE = "cover"
+
+
+@dataclass(frozen=True)
+class Cover:
+    tag: Path
+    thumbnail: Path
+
+
+class CoverManager:
+    """
+    Downloads cover art once and keeps resized variants in the media cache.
+
+    Covers are keyed by URL, so tracks of the same album share one entry.
+    Every cover is stored as a "tag" variant (embedded into the audio file)
+    and a "thumbnail" variant that fits Telegram's thumbnail limits.
+    Concurrent requests for the same URL wait for a single download.
+    """
+
+    def __init__(self, tag_size: int = COVER_TAG_SIZE) -> None:
+        self.tag_size = tag_size
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def get(self, url: Optional[str], output_path: str) -> Optional[Cover]:
+        """
+        Returns the cover variants for the URL, downloading it if needed.
+
+        Args:
+            url (str): Cover image URL.
+            output_path (str): Job workspace used for the raw download.
+
+        Returns:
+            Optional[Cover]: Cached cover paths, or None if the cover is unavailable.
+        """
+        if not url:
+            return None
+
+        cover = await self._lookup(url)
+        if cover:
+            return cover
+
+        pending = self._pending.get(url)
+        if pending is not None:
+            cover = await asyncio.shield(pending)
+            # Looked up again, so this job holds its own pins on the files
+            return await self._lookup(url) or cover
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[url] = future
+        cover = None
+        try:
+            with track_phase("cover"):
+                cover = await self._fetch(url, output_path)
+        except Exception as e:
+            logger.warning(f"Failed to get cover {url}: {e}")
+        finally:
+            self._pending.pop(url, None)
+            # Waiters must be released even if this download was cancelled
+            future.set_result(cover)
+        return cover
+
+    async def _lookup(self, url: str) -> Optional[Cover]:
+        tag = await media_cache.get(_CACHE_SERVICE, url, "tag")
+        thumbnail = await media_cache.get(_CACHE_SERVICE, url, "thumbnail")
+        if tag and thumbnail:
+            return Cover(tag=tag.path, thumbnail=thumbnail.path)
+        return None
+
+    async def _fetch(self, url: str, output_path: str) -> Cover:
+        name = hashlib.sha256(url.encode()).hexdigest()[:16]
+        raw_path = os.path.join(output_path, f"cover_{name}_{uuid.uuid4().hex[:8]}")
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                await stream_to_file(response, raw_path)
+
+        try:
+            tag_path, thumbnail_path = await asyncio.to_thread(self._render, raw_path)
+        finally:
+            await asyncio.to_thread(_remove, raw_path)
+
+        tag = await media_cache.put(_CACHE_SERVICE, url, "tag", tag_path, meta={"url": url})
+        thumbnail = await media_cache.put(_CACHE_SERVICE, url, "thumbnail", thumbnail_path, meta={"url": url})
+        return Cover(tag=tag, thumbnail=thumbnail)
+
+    def _render(self, raw_path: str):
+        with Image.open(raw_path) as image:
+            image = image.convert("RGB")
+
+            tag = image.copy()
+            tag.thumbnail((self.tag_size, self.tag_size), Image.LANCZOS)
+            tag_path = f"{raw_path}_tag.jpg"
+            tag.save(tag_path, "JPEG", quality=90, optimize=True)
+
+            thumbnail = image.copy()
+            thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+            thumbnail_path = f"{raw_path}_thumb.jpg"
+            with open(thumbnail_path, "wb") as f:
+                f.write(_encode_jpeg(thumbnail, THUMBNAIL_MAX_BYTES))
+
+        return tag_path, thumbnail_path
+
+
+def _encode_jpeg(image: Image.Image, max_bytes: int) -> bytes:
+    # Lower the quality until the image fits, 320px rarely needs more than one step
+    data = b""
+    for quality in (85, 75, 60, 45, 30):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes:
+            break
+    return data
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+cover_manager = CoverManager()
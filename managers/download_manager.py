@@ -1,15 +1,21 @@
 import asyncio
-from typing import Dict, List, Optional, Tuple
+import os
+from typing import Dict, List, Optional, Tuple, Union
 
 from aiogram import types
 from aiogram.enums import InputMediaType
 from aiogram.utils.media_group import MediaGroupBuilder
 
+from config.settings import LOCAL_SERVER, LOCAL_SERVER_FILES, LOCAL_SERVER_PATH_MAP
 from utils import delete_files, handle_download_error, truncate_string
+from managers.cache_manager import media_cache
 from models.media_models import MediaContent, MediaType
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import ACTIVE_TASKS, UPLOAD_BYTES, current_service
+from utils.video_meta import complete_video
 
 user_tasks: Dict[int, asyncio.Task] = {}
+ACTIVE_TASKS.set_function(lambda: {(): len(user_tasks)})
 
 
 class TaskManager:
@@ -38,12 +44,52 @@ class TaskManager:
 
 
 class MediaHandler:
+    @staticmethod
+    def input_file(path) -> Union[str, types.FSInputFile]:
+        """
+        Returns the file to pass to the Bot API.
+
+        With a local Bot API server that can read our files the path is sent
+        as a file:// URI, so the server reads the file from disk and the body
+        isn't streamed over the socket. Otherwise the file is uploaded.
+        """
+        if not (LOCAL_SERVER and LOCAL_SERVER_FILES):
+            return types.FSInputFile(path)
+
+        local_path = os.path.abspath(path)
+        bot_prefix, _, server_prefix = LOCAL_SERVER_PATH_MAP.partition("=")
+        if bot_prefix and server_prefix:
+            # Whole path components only: /app/other must not match /app/other2
+            bot_prefix, server_prefix = bot_prefix.rstrip("/"), server_prefix.rstrip("/")
+            if local_path == bot_prefix or local_path.startswith(bot_prefix + "/"):
+                local_path = server_prefix + local_path[len(bot_prefix):]
+        return f"file://{local_path}"
+
+    @staticmethod
+    def count_upload(content: List[MediaContent]) -> int:
+        """Adds the size of the content about to be sent to the upload metric of the current service and returns it."""
+        size = 0
+        for item in content:
+            try:
+                size += os.path.getsize(item.path)
+            except OSError:
+                pass
+        UPLOAD_BYTES.inc(size, service=current_service.get())
+        return size
+
     @staticmethod
     async def send_media_content(message: types.Message, content: List[MediaContent]) -> None:
         """Handle sending different types of media content."""
         try:
             media_items, audio_items, gif_items, caption = MediaHandler.parse_media(content=content)
 
+            # Send dimensions, duration and a thumbnail so clients show videos right away
+            await asyncio.gather(*(
+                complete_video(item)
+                for item in media_items + gif_items
+                if item.type in (MediaType.VIDEO, MediaType.GIF)
+            ))
+
             await MediaHandler.send_media_groups(message, media_items, caption)
 
             bot = message.bot
@@ -58,10 +104,15 @@ class MediaHandler:
             for gif in gif_items:
                 await bot.send_chat_action(message.chat.id, "upload_video")
                 await message.answer_animation(
-                    animation=types.FSInputFile(gif.path), disable_notification=True
+                    animation=MediaHandler.input_file(gif.path),
+                    disable_notification=True,
+                    thumbnail=types.FSInputFile(gif.cover) if gif.cover else None,
+                    width=int(gif.width) if gif.width else None,
+                    height=int(gif.height) if gif.height else None,
+                    duration=int(gif.duration) if gif.duration else None,
                 )
 
-                await delete_files([gif.path])
+                await MediaHandler.delete_temp_files([gif.path, gif.cover])
         except Exception as e:
             if not isinstance(e, BotError):
                 e = BotError(
@@ -93,19 +144,20 @@ class MediaHandler:
                 for item in group_items:
                     if item.type == MediaType.PHOTO:
                         media_group.add_photo(
-                            media=types.FSInputFile(item.path),
+                            media=MediaHandler.input_file(item.path),
                             type=InputMediaType.PHOTO,
                         )
                     elif item.type == MediaType.VIDEO:
                         media_group.add_video(
-                            media=types.FSInputFile(item.path),
+                            media=MediaHandler.input_file(item.path),
                             type=InputMediaType.VIDEO,
                             supports_streaming=True,
                             width=int(item.width) if item.width else None,
                             height=int(item.height) if item.height else None,
-                            duration=int(item.duration) if item.duration else None
+                            duration=int(item.duration) if item.duration else None,
+                            thumbnail=types.FSInputFile(item.cover) if item.cover else None,
                         )
-                    temp_media_path.append(item.path)
+                    temp_media_path.extend([item.path, item.cover])
 
                     if item.original_size:
                         media_to_send_as_document.append(item)
@@ -120,7 +172,7 @@ class MediaHandler:
             for item in media_to_send_as_document:
                 await bot.send_chat_action(message.chat.id, "upload_document")
                 await message.answer_document(
-                    document=types.FSInputFile(item.path),
+                    document=MediaHandler.input_file(item.path),
                     disable_notification=True
                 )
                 await asyncio.sleep(0.5)
@@ -135,7 +187,7 @@ class MediaHandler:
                 )
             await handle_download_error(message, e)
         finally:
-            await delete_files(temp_media_path)
+            await MediaHandler.delete_temp_files(temp_media_path)
 
 
     @staticmethod
@@ -143,7 +195,7 @@ class MediaHandler:
         """Send audio file with or without cover."""
         try:
             await message.answer_audio(
-                audio=types.FSInputFile(audio.path),
+                audio=MediaHandler.input_file(audio.path),
                 disable_notification=True,
                 thumbnail=types.FSInputFile(audio.cover) if audio.cover else None,
                 title=audio.title,
@@ -151,7 +203,7 @@ class MediaHandler:
                 performer=audio.performer,
             )
 
-            await delete_files([audio.path, audio.cover])
+            await MediaHandler.delete_temp_files([audio.path, audio.cover])
         except Exception as e:
             if not isinstance(e, BotError):
                 e = BotError(
@@ -163,6 +215,13 @@ class MediaHandler:
             await handle_download_error(message, e)
 
 
+    @staticmethod
+    async def delete_temp_files(files: List) -> None:
+        """Delete sent files, keeping the ones that belong to the media cache and releasing their pins."""
+        cached = [file for file in files if file and media_cache.contains_path(file)]
+        await media_cache.release(cached)
+        await delete_files([file for file in files if file and file not in cached])
+
     @staticmethod
     def parse_media(content: List[MediaContent]) -> Tuple[List[MediaContent], List[MediaContent], List[MediaContent], Optional[str]]:
         """Parse media content to separate media, audio, gif items and extract caption."""
@@ -0,0 +1,51 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from functions.db import db_get_preferences, db_set_preferences
+
+FORMATS = ("video", "audio")
+QUALITY_CAPS = (360, 480, 720, 1080)
+AUDIO_CODECS = ("m4a", "opus")
+
+
+@dataclass(frozen=True)
+class ChatPreferences:
+    """
+    How a chat wants YouTube links downloaded. None means not chosen: the
+    bot asks for the format and picks the quality and codec itself.
+    """
+
+    default_format: Optional[str] = None
+    quality_cap: Optional[int] = None
+    audio_codec: Optional[str] = None
+
+
+class PreferenceManager:
+    """
+    Per-chat download preferences, read from chat_settings once and then
+    served from memory, like the locale cache of the i18n middleware.
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[int, ChatPreferences] = {}
+
+    async def get(self, chat_id: int) -> ChatPreferences:
+        preferences = self._cache.get(chat_id)
+        if preferences is None:
+            preferences = ChatPreferences(*await db_get_preferences(chat_id))
+            self._cache[chat_id] = preferences
+        return preferences
+
+    async def update(self, chat_id: int, **changes) -> ChatPreferences:
+        """Saves the changed fields of the chat's preferences and returns the result."""
+        preferences = dataclasses.replace(await self.get(chat_id), **changes)
+        await db_set_preferences(chat_id, preferences.default_format, preferences.quality_cap, preferences.audio_codec)
+        self._cache[chat_id] = preferences
+        return preferences
+
+    def clear_cache(self, chat_id: int) -> None:
+        self._cache.pop(chat_id, None)
+
+
+preference_manager = PreferenceManager()
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from config.settings import JANITOR_INTERVAL_MIN, TEMP_DIR, WORKSPACE_MAX_AGE_MIN
+from managers.admission_manager import disk_admission
+from managers.cache_manager import media_cache
+from utils.metrics import WORKSPACES
+
+logger = logging.getLogger(__name__)
+
+_current_workspace: contextvars.ContextVar[Optional["JobWorkspace"]] = contextvars.ContextVar("current_workspace", default=None)
+
+
+@dataclass
+class JobWorkspace:
+    job_id: str
+    path: Path
+    created_at: float = field(default_factory=time.time)
+
+    def usage(self) -> int:
+        """Return the number of bytes currently stored in the workspace."""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+
+class WorkspaceManager:
+    """
+    Creates an isolated temp directory for every download job.
+
+    Services write only inside the directory they receive, so concurrent jobs
+    never overwrite each other's files. The directory is removed recursively
+    when the job ends, and a periodic janitor sweeps directories left behind
+    by crashed processes.
+    """
+
+    def __init__(self, root: str = TEMP_DIR, max_age_min: int = WORKSPACE_MAX_AGE_MIN) -> None:
+        self.root = Path(root)
+        self.partial_dir = self.root / "partial"
+        self.max_age = max_age_min * 60
+        self._active: Dict[str, JobWorkspace] = {}
+
+    @property
+    def active(self) -> Dict[str, JobWorkspace]:
+        return self._active
+
+    @staticmethod
+    def current() -> Optional[JobWorkspace]:
+        """The workspace of the job the calling code runs in, if any."""
+        return _current_workspace.get()
+
+    @asynccontextmanager
+    async def workspace(self, job_id: Optional[str] = None) -> AsyncIterator[JobWorkspace]:
+        job_id = job_id or uuid.uuid4().hex
+        path = self.root / f"job_{job_id}"
+        await asyncio.to_thread(path.mkdir, parents=True, exist_ok=True)
+
+        workspace = JobWorkspace(job_id=job_id, path=path)
+        self._active[job_id] = workspace
+        pins = media_cache.start_job()
+        current = _current_workspace.set(workspace)
+        try:
+            yield workspace
+        finally:
+            try:
+                _current_workspace.reset(current)
+            except ValueError:
+                pass
+            self._active.pop(job_id, None)
+            await media_cache.end_job(pins)
+            await disk_admission.release(str(path))
+            usage = await asyncio.to_thread(workspace.usage)
+            elapsed = time.time() - workspace.created_at
+            logger.info(f"Job {job_id} finished in {elapsed:.1f}s, workspace left {usage} bytes on disk")
+            await asyncio.to_thread(shutil.rmtree, path, True)
+
+    def sweep(self) -> int:
+        """
+        Remove stale job directories that no running job owns, abandoned partial
+        downloads and thumbnails made outside of a job.
+        """
+        if not self.root.exists():
+            return 0
+
+        removed = 0
+        now = time.time()
+        active_paths = {workspace.path for workspace in self._active.values()}
+        for path in self.root.iterdir():
+            if path.name.startswith("thumb_"):
+                try:
+                    if not path.is_file() or now - path.stat().st_mtime < self.max_age:
+                        continue
+                    path.unlink()
+                except OSError:
+                    continue
+                removed += 1
+                logger.info(f"Janitor removed stale thumbnail: {path}")
+                continue
+            if not path.is_dir() or not path.name.startswith("job_") or path in active_paths:
+                continue
+            try:
+                if now - path.stat().st_mtime < self.max_age:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+            logger.info(f"Janitor removed stale workspace: {path}")
+
+        if self.partial_dir.exists():
+            for path in self.partial_dir.iterdir():
+                try:
+                    if not path.is_file() or now - path.stat().st_mtime < self.max_age:
+                        continue
+                    path.unlink()
+                except OSError:
+                    continue
+                removed += 1
+                logger.info(f"Janitor removed abandoned partial download: {path}")
+        return removed
+
+    async def run_janitor(self, interval_min: int = JANITOR_INTERVAL_MIN) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Workspace janitor error: {e}")
+            await asyncio.sleep(interval_min * 60)
+
+
+workspace_manager = WorkspaceManager()
+WORKSPACES.set_function(lambda: {(): len(workspace_manager.active)})
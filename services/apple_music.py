@@ -5,29 +5,41 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, List, Optional
 
-import aiofiles
 import aiohttp
-import yt_dlp
 from aiofiles import os as aios
-from bs4 import BeautifulSoup
 from yt_dlp.utils import sanitize_filename
 
 from config.secrets import APPLEMUSIC_DEV_TOKEN
+from managers.admission_manager import disk_admission, estimate_info_size
+from managers.cover_manager import cover_manager
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils import (
     get_applemusic_author,
     random_cookie_file,
     search_music,
-    update_metadata,
 )
+from utils.audio_policy import find_audio_file, get_audio_format
+from utils.audio_postprocessor import AudioTagPP
 from utils.error_handler import BotError, ErrorCode
+from utils.html_parsing import iter_elements, run_parser
+from utils.metrics import track_phase
+from utils.ytdlp_session import open_ydl
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_server_data(page: str) -> Optional[Any]:
+    """The JSON of the serialized-server-data script of a page, or None if there is none."""
+    for attributes, start, end in iter_elements(page, "script"):
+        if attributes.get("id") == "serialized-server-data":
+            content = page[start:end].strip()
+            return json.loads(content) if content else None
+    return None
+
+
 class AppleMusicService(BaseService):
     name = "AppleMusic"
     _download_executor = ThreadPoolExecutor(max_workers=10)
@@ -43,17 +55,11 @@ class AppleMusicService(BaseService):
             'referer': 'https://music.apple.com/',
         }
 
-    def _get_audio_options(self):
+    def _get_audio_options(self, output_path: str):
         return {
-            "format": "bestaudio",
-            "outtmpl": f"{self.output_path}/{sanitize_filename('%(title)s')}",
+            "format": get_audio_format(),
+            "outtmpl": f"{output_path}/{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                },
-            ],
         }
 
     def is_supported(self, url: str) -> bool:
@@ -65,8 +71,9 @@ class AppleMusicService(BaseService):
         return bool(
             re.match(r"https:\/\/music\.apple\.com\/[\w]{2}\/playlist\/([\w-]+)\/([\w.-]+)", url)
         )
-    async def download(self, url: str) -> List[MediaContent]:
-        options = self._get_audio_options()
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
+        options = self._get_audio_options(output_path)
         try:
             permofer, title, cover_url = await get_applemusic_author(url)
 
@@ -81,13 +88,14 @@ class AppleMusicService(BaseService):
 
             video_link = await search_music(permofer, title)
 
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(video_link, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(video_link, download=False)
+                    )
                 if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
@@ -97,48 +105,29 @@ class AppleMusicService(BaseService):
                         is_logged=True,
                     )
 
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.download([video_link])
-                )
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict, factor=2))
 
                 base_path = os.path.join(
-                    self.output_path,
+                    output_path,
                     f"{sanitize_filename(info_dict['title'])}"
                 )
 
-                audio_path = f"{base_path}.mp3"
-                cover_path = f"{base_path}.jpg"
-
-
                 if cover_url is None:
                     cover_url = info_dict.get("thumbnail", None)
 
-                if cover_url:
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(cover_url) as response:
-                                response.raise_for_status()
-                                cover_path = f"{base_path}.jpg"
-                                async with aiofiles.open(cover_path, 'wb') as f:
-                                    async for chunk in response.content.iter_chunked(1024):
-                                        await f.write(chunk)
-
-                        if not await aios.path.exists(cover_path):
-                            cover_path = None
-
-                    except Exception:
-                        cover_path = None
-
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: update_metadata(
-                        audio_path,
-                        title=title,
-                        artist=permofer,
-                        cover_file=cover_path
-                    )
+                cover = await cover_manager.get(cover_url, output_path)
+
+                ydl.add_post_processor(
+                    AudioTagPP(ydl, title=title, artist=permofer, cover=cover.tag if cover else None),
+                    when="post_process",
                 )
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.download([video_link])
+                    )
+
+                audio_path = find_audio_file(base_path) or f"{base_path}.mp3"
 
                 if await aios.path.exists(audio_path):
                     return [MediaContent(
@@ -147,7 +136,7 @@ class AppleMusicService(BaseService):
                         duration=info_dict.get("duration", None),
                         title=title,
                         performer=permofer,
-                        cover=Path(cover_path) if cover_path else None
+                        cover=cover.thumbnail if cover else None
                     )]
                 else:
                     raise BotError(
@@ -231,15 +220,11 @@ class AppleMusicService(BaseService):
                 async with session.get(url) as response:
                     response.raise_for_status()
 
-                    soup = BeautifulSoup(await response.text(), 'html.parser')
-
-                    script_tag = soup.find('script', {'id': 'serialized-server-data'})
-                    if not script_tag or not script_tag.string:
+                    json_data = await run_parser(_parse_server_data, await response.text())
+                    if json_data is None:
                         logger.error(f"Could not find JSON in page for playlist {playlist_id} (serialized-server-data script tag missing or empty).")
                         return []
 
-                    json_data = json.loads(script_tag.string)
-
                     track_urls: list[str] = []
 
                     sections = json_data[0].get('data', {}).get('sections', [])
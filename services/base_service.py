@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 
 class BaseService(ABC):
@@ -12,8 +13,9 @@ class BaseService(ABC):
         pass
 
     @abstractmethod
-    async def download(self, url: str) -> list:
-        """Возвращает список скачанного контента:
+    async def download(self, url: str, output_path: Optional[str] = None) -> list:
+        """Скачивает медиа в output_path (временная папка задачи) и
+        возвращает список скачанного контента:
         [
             {"type": "image", "path": "path/to/image.jpg"},
             {"type": "audio", "path": "path/to/audio.mp3"},
@@ -3,7 +3,7 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from aiofiles import os as aios
 from bilix.sites.bilibili import DownloaderBilibili
@@ -30,10 +30,11 @@ class BiliBiliService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         try:
             async with DownloaderBilibili() as d:
-                video_path =  await d.get_video(url, path=Path("other/downloadsTemp"),time_range=(0, 180))
+                video_path =  await d.get_video(url, path=Path(output_path),time_range=(0, 180))
 
 
             if video_path and await aios.path.exists(video_path):
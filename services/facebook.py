@@ -1,14 +1,19 @@
 import logging
 import re
 from pathlib import Path
-from typing import List
-import yt_dlp
+from typing import List, Optional
 import asyncio
 
+from managers.admission_manager import disk_admission, estimate_info_size
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils import truncate_string
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.size_limits import size_limit
+from utils.video_fit import choose_format, keeps_source, prepare_video
+from utils.video_meta import info_meta
+from utils.ytdlp_session import open_ydl
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +23,12 @@ class FacebookService(BaseService):
 
     def __init__(self, output_path: str = "other/downloadsTemp") -> None:
         self.output_path = output_path
-        self.yt_dlp_video_options = {
-            "format": "mp4",
-            "outtmpl": f"{output_path}/%(title)s.%(ext)s",
+
+    def _get_video_options(self, output_path: str):
+        return {
+            "format": "bv*+ba/b",
+            "merge_output_format": "mp4/mkv",
+            "outtmpl": f"{output_path}/%(id)s.%(ext)s",
         }
 
     def is_supported(self, url: str) -> bool:
@@ -33,21 +41,37 @@ class FacebookService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
         try:
-            with yt_dlp.YoutubeDL(self.yt_dlp_video_options) as ydl:
-                info_dict = await asyncio.to_thread(ydl.extract_info, url, download=False)
+            options = self._get_video_options(output_path)
+            async with open_ydl(options) as ydl:
+                with track_phase("extract", self.name):
+                    info_dict = await asyncio.to_thread(ydl.extract_info, url, download=False)
+
+            limit = size_limit(self.name)
+            choice = choose_format(info_dict, limit, url)
+            if choice:
+                options["format"] = choice.format_id
+
+            async with open_ydl(options) as ydl:
+                await disk_admission.reserve(output_path, choice.size if choice else estimate_info_size(info_dict))
+                with track_phase("download", self.name):
+                    info_dict = await asyncio.to_thread(ydl.process_ie_result, info_dict, True)
                 filename = ydl.prepare_filename(info_dict)
-                await asyncio.to_thread(ydl.download, [url])
 
-            result.append(
-                MediaContent(
-                    type=MediaType.VIDEO,
-                    path=Path(filename),
-                    title=truncate_string(info_dict["title"])
+            paths = await prepare_video(filename, limit, info_dict.get("duration"))
+            meta = info_meta(info_dict) if keeps_source(filename, paths) else {}
+            for path in paths:
+                result.append(
+                    MediaContent(
+                        type=MediaType.VIDEO,
+                        path=Path(path),
+                        title=truncate_string(info_dict["title"]),
+                        **meta,
+                    )
                 )
-            )
 
             return result
         except BotError as e:
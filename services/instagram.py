@@ -2,19 +2,25 @@ import asyncio
 import logging
 import os
 import re
-from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import instaloader
 from concurrent.futures import ThreadPoolExecutor
 
-import aiofiles
 import aiohttp
 import yt_dlp
 
+from config.settings import VIDEO_FIT_POLICY, VIDEO_FIT_SOURCE_FACTOR
+from managers.admission_manager import DEFAULT_PHOTO_ESTIMATE, DEFAULT_VIDEO_ESTIMATE, disk_admission, estimate_info_size
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.http_download import download_file
+from utils.size_limits import size_limit
+from utils.video_fit import choose_format, keeps_source, prepare_video
+from utils.video_meta import info_meta
+from utils.ytdlp_session import open_ydl
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +32,11 @@ class InstagramService(BaseService):
     def __init__(self, output_path: str = "other/downloadsTemp"):
         self.output_path = output_path
         os.makedirs(self.output_path, exist_ok=True)
-        self.yt_dlp_opts = {
-            "outtmpl": f"{self.output_path}/%(id)s_{yt_dlp.utils.sanitize_filename('%(title)s')}.%(ext)s",
+
+    def _get_video_options(self, output_path: str):
+        return {
+            "outtmpl": f"{output_path}/%(id)s_{yt_dlp.utils.sanitize_filename('%(title)s')}.%(ext)s",
+            "merge_output_format": "mp4/mkv",
             "quiet": True,
         }
 
@@ -42,40 +51,57 @@ class InstagramService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
 
         try:
             if re.match(r'https://www\.instagram\.com/reel/([A-Za-z0-9_-]+)', url):
-                with yt_dlp.YoutubeDL(self.yt_dlp_opts) as ydl:
-                    loop = asyncio.get_event_loop()
-                    info_dict = await loop.run_in_executor(
-                        self._download_executor,
-                        lambda: ydl.extract_info(url, download=False)
-                    )
-                    if not info_dict:
-                        raise BotError(
-                            code=ErrorCode.DOWNLOAD_FAILED,
-                            message="Failed to get video info",
-                            url=url,
-                            critical=False,
-                            is_logged=True,
+                options = self._get_video_options(output_path)
+                loop = asyncio.get_event_loop()
+                async with open_ydl(options) as ydl:
+                    with track_phase("extract", self.name):
+                        info_dict = await loop.run_in_executor(
+                            self._download_executor,
+                            lambda: ydl.extract_info(url, download=False)
                         )
-                    await loop.run_in_executor(
-                        self._download_executor,
-                        lambda: ydl.download([url])
+                if not info_dict:
+                    raise BotError(
+                        code=ErrorCode.DOWNLOAD_FAILED,
+                        message="Failed to get video info",
+                        url=url,
+                        critical=False,
+                        is_logged=True,
                     )
-                    result.append(
-                        MediaContent(
-                            type=MediaType.VIDEO,
-                            path=Path(ydl.prepare_filename(info_dict)),
+
+                limit = size_limit(self.name)
+                choice = choose_format(info_dict, limit, url)
+                if choice:
+                    options["format"] = choice.format_id
+
+                async with open_ydl(options) as ydl:
+                    await disk_admission.reserve(output_path, choice.size if choice else estimate_info_size(info_dict))
+                    with track_phase("download", self.name):
+                        info_dict = await loop.run_in_executor(
+                            self._download_executor,
+                            lambda: ydl.process_ie_result(info_dict, download=True)
+                        )
+                    filename = ydl.prepare_filename(info_dict)
+                    paths = await prepare_video(filename, limit, info_dict.get("duration"))
+                    meta = info_meta(info_dict) if keeps_source(filename, paths) else {}
+                    for path in paths:
+                        result.append(
+                            MediaContent(
+                                type=MediaType.VIDEO,
+                                path=Path(path),
+                                **meta,
+                            )
                         )
-                    )
                     return result
 
             media_urls, filenames = await self._get_instagram_post(url)
 
-            downloaded = await download_all_media(media_urls, filenames)
+            downloaded = await download_all_media(media_urls, filenames, output_path)
 
             if isinstance(downloaded, BotError):
                 raise BotError(
@@ -86,7 +112,7 @@ class InstagramService(BaseService):
                     is_logged=True,
                 )
 
-            for path in downloaded:
+            for path in (path for paths in downloaded for path in paths):
                 if isinstance(path, str):
                     result.append(
                         MediaContent(
@@ -118,11 +144,10 @@ class InstagramService(BaseService):
         try:
             loop = asyncio.get_event_loop()
 
-            L = instaloader.Instaloader()
-
+            # Building the loader sets up a requests session, keep it off the event loop too
             post = await loop.run_in_executor(
                 self._download_executor,
-                lambda: instaloader.Post.from_shortcode(L.context, shortcode)
+                lambda: instaloader.Post.from_shortcode(instaloader.Instaloader().context, shortcode)
             )
 
             if post is None:
@@ -139,8 +164,12 @@ class InstagramService(BaseService):
 
             if post.typename == 'GraphSidecar':
                 for i, node in enumerate(post.get_sidecar_nodes(), start=1):
-                    images.append(node.display_url)
-                    filenames.append(f"{i}_{shortcode}.jpg")
+                    if node.is_video and node.video_url:
+                        images.append(node.video_url)
+                        filenames.append(f"{i}_{shortcode}.mp4")
+                    else:
+                        images.append(node.display_url)
+                        filenames.append(f"{i}_{shortcode}.jpg")
             elif post.typename == 'GraphImage':
                 images.append(post.url)
                 filenames.append(f"{shortcode}.jpg")
@@ -168,26 +197,10 @@ class InstagramService(BaseService):
                 is_logged=True,
             )
 
-async def run_in_thread(func, *args):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, partial(func, *args))
-
-
-async def download_media(session, url, filename) -> str:
+async def download_media(session, url, filename) -> List[str]:
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                async with aiofiles.open(filename, "wb") as f:
-                    await f.write(await response.read())
-                return filename
-            else:
-                raise BotError(
-                    code=ErrorCode.INTERNAL_ERROR,
-                    message=f"Failed to download Instagram media: {response.status}",
-                    url=url,
-                    critical=False,
-                    is_logged=True,
-                )
+        await download_file(url, filename, session=session, estimate=DEFAULT_PHOTO_ESTIMATE)
+        return [filename]
     except BotError as e:
         raise e
     except Exception as e:
@@ -200,40 +213,34 @@ async def download_media(session, url, filename) -> str:
         )
 
 
-async def download_all_media(media_urls, filenames):
+async def download_all_media(media_urls, filenames, output_path: str):
     async with aiohttp.ClientSession() as session:
         tasks = []
         for url, name in zip(media_urls, filenames):
             if name.endswith(".mp4"):
-                tasks.append(download_video_with_ytdlp(url, name))
+                tasks.append(download_video(session, url, os.path.join(output_path, name)))
             else:
-                tasks.append(download_media(session, url, name))
+                tasks.append(download_media(session, url, os.path.join(output_path, name)))
         results = await asyncio.gather(*tasks)
         return results
 
-async def download_video_with_ytdlp(url: str, filename: str) -> str:
+async def download_video(session, url: str, filename: str) -> List[str]:
+    """
+    Downloads a post video from its CDN URL, like the photos, and fits it
+    into the upload limit. Returns the paths to send, several if it was split.
+    """
+    limit = size_limit(InstagramService.name)
+    # Oversized sources are accepted up to the budget prepare_video can shrink
+    max_size = limit if VIDEO_FIT_POLICY == "off" else limit * VIDEO_FIT_SOURCE_FACTOR
     try:
-        def _download():
-            ydl_opts = {
-                'outtmpl': "other/downloadsTemp/%(id)s.%(ext)s",
-                'quiet': True,
-                'format': 'mp4',
-                'merge_output_format': 'mp4',
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                return ydl.prepare_filename(info)
-
-        downloaded_path = await run_in_thread(_download)
-
-        final_path = os.path.join("other/downloadsTemp", filename)
-        os.rename(downloaded_path, final_path)
-        return final_path
-
+        await download_file(url, filename, session=session, max_size=max_size, estimate=DEFAULT_VIDEO_ESTIMATE)
+        return await prepare_video(filename, limit)
+    except BotError as e:
+        raise e
     except Exception as e:
         raise BotError(
             code=ErrorCode.DOWNLOAD_FAILED,
-            message=f"yt-dlp failed: {type(e).__name__} – {e}",
+            message=f"Instagram video download: {type(e).__name__} – {e}",
             url=url,
             critical=True,
             is_logged=True,
@@ -3,16 +3,19 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-import aiofiles
 import aiohttp
-import yt_dlp
 from fake_useragent import UserAgent
 
+from managers.admission_manager import DEFAULT_PHOTO_ESTIMATE, DEFAULT_VIDEO_ESTIMATE, disk_admission
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.size_limits import check_url_size, size_limit
+from utils.http_download import download_file
+from utils.ytdlp_session import open_ydl
 
 ua = UserAgent()
 
@@ -37,7 +40,8 @@ class PinterestService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
 
         async with aiohttp.ClientSession() as sesion:
@@ -63,10 +67,10 @@ class PinterestService(BaseService):
             if post_dict["ext"] == "mp4":
                 video_url = post_dict["video"]
                 if video_url.endswith(".m3u8"):
-                    filename = os.path.join(self.output_path, f"{image_signature}.mp4")
+                    filename = os.path.join(output_path, f"{image_signature}.mp4")
                     await self._download_m3u8_video(video_url, filename)
                 else:
-                    filename = os.path.join(self.output_path, f"{image_signature}.mp4")
+                    filename = os.path.join(output_path, f"{image_signature}.mp4")
                     await self._download_video(video_url, filename)
 
                 result.append(MediaContent(
@@ -78,7 +82,7 @@ class PinterestService(BaseService):
                 carousel_data = post_dict["carousel_data"]
                 for i, image_url in enumerate(carousel_data):
                     filename = os.path.join(
-                        self.output_path, f"{image_signature}_{i}.jpg"
+                        output_path, f"{image_signature}_{i}.jpg"
                     )
                     await self._download_photo(image_url, filename)
                     result.append(MediaContent(
@@ -89,14 +93,14 @@ class PinterestService(BaseService):
             elif post_dict["ext"] == "jpg":
                 image_url = post_dict["image"]
                 if image_url.endswith(".gif"):
-                    filename = os.path.join(self.output_path, f"{image_signature}.gif")
+                    filename = os.path.join(output_path, f"{image_signature}.gif")
                     await self._download_video(image_url, filename)
                     result.append(MediaContent(
                         type=MediaType.GIF,
                         path=Path(filename),
                     ))
                 else:
-                    filename = os.path.join(self.output_path, f"{image_signature}.jpg")
+                    filename = os.path.join(output_path, f"{image_signature}.jpg")
                     await self._download_photo(image_url, filename)
                     result.append(MediaContent(
                         type=MediaType.PHOTO,
@@ -237,29 +241,11 @@ class PinterestService(BaseService):
     async def _download_photo(self, url: str, filename: str) -> None:
         try:
             content_url = re.sub(r"/\d+x", "/originals", url)
-            async with aiohttp.ClientSession() as session:
-                async with session.get(content_url) as response:
-                    response_status = response.status
-                    if response_status == 200:
-                        async with aiofiles.open(filename, "wb") as f:
-                            await f.write(await response.read())
-                        return
-
-            if response_status == 403:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url) as response:
-                        if response.status == 200:
-                            async with aiofiles.open(filename, "wb") as f:
-                                await f.write(await response.read())
-                            return
-                        else:
-                            raise BotError(
-                                code=ErrorCode.DOWNLOAD_FAILED,
-                                message=f"Failed to retrieve image. Status code: {response.status}",
-                                url=url,
-                                critical=True,
-                                is_logged=True,
-                            )
+            try:
+                await download_file(content_url, filename, estimate=DEFAULT_PHOTO_ESTIMATE)
+            except BotError:
+                # Originals aren't available for every pin, the sized image is
+                await download_file(url, filename, estimate=DEFAULT_PHOTO_ESTIMATE)
         except Exception as e:
             raise BotError(
                 code=ErrorCode.DOWNLOAD_FAILED,
@@ -271,21 +257,9 @@ class PinterestService(BaseService):
 
     async def _download_video(self, url: str, filename: str) -> None:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    content_length = response.headers.get("Content-Length")
-                    if content_length and int(content_length) > 50 * 1024 * 1024:
-                        raise BotError(
-                            code=ErrorCode.SIZE_CHECK_FAIL,
-                            message=f"File size exceeds 50MB: {url}",
-                            url=url,
-                            critical=False,
-                            is_logged=False,
-                        )
-
-                    async with aiofiles.open(filename, "wb") as f:
-                        async for chunk in response.content.iter_chunked(1024):
-                            await f.write(chunk)
+            limit = size_limit(self.name)
+            await check_url_size(url, limit)
+            await download_file(url, filename, max_size=limit, estimate=DEFAULT_VIDEO_ESTIMATE)
         except BotError as e:
             raise e
         except Exception as e:
@@ -307,12 +281,14 @@ class PinterestService(BaseService):
     async def _download_m3u8_video(self, url: str, filename: str) -> None:
         try:
             ydl_opts = {'outtmpl': filename}
+            await disk_admission.reserve(os.path.dirname(filename), DEFAULT_VIDEO_ESTIMATE)
             loop = asyncio.get_event_loop()
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                await loop.run_in_executor(
-                        self._download_executor,
-                        lambda: ydl.download([url])
-                )
+            async with open_ydl(ydl_opts) as ydl:
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                            self._download_executor,
+                            lambda: ydl.download([url])
+                    )
         except Exception as e:
             raise BotError(
                 code=ErrorCode.DOWNLOAD_FAILED,
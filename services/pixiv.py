@@ -1,16 +1,16 @@
-import asyncio
 import os
 import re
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-import aiofiles
 import aiohttp
 from fake_useragent import UserAgent
 
+from managers.admission_manager import DEFAULT_PHOTO_ESTIMATE
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils.error_handler import BotError, ErrorCode
+from utils.http_download import download_file
 
 ua = UserAgent(platforms="desktop")
 
@@ -36,7 +36,8 @@ class PixivService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
         match = re.search(r'pixiv\.net/.*/artworks/(\d+)$', url)
 
@@ -67,7 +68,7 @@ class PixivService(BaseService):
             for img in page_response_json["body"]:
                 img_url=img["urls"]["original"]
 
-                filename = self.output_path + img_url.split("/")[-1]
+                filename = os.path.join(output_path, img_url.split("/")[-1])
                 await self._download_photo(img_url, filename)
 
                 result.append(
@@ -92,27 +93,6 @@ class PixivService(BaseService):
         return result
 
     async def _download_photo(self, url: str, filename: str) -> None:
-        retries = 3
         connector = aiohttp.TCPConnector(force_close=True)
         async with aiohttp.ClientSession(connector=connector) as session:
-            for attempt in range(retries):
-                try:
-                    async with session.get(url, headers=self.headers) as response:
-                        if response.status == 200:
-                            async with aiofiles.open(filename, "wb") as f:
-                                async for chunk in response.content.iter_chunked(1024):
-                                    await f.write(chunk)
-                            break
-                        else:
-                            raise BotError(
-                                code=ErrorCode.DOWNLOAD_FAILED,
-                                message=f"Failed to download Pixiv image: {response.status}",
-                                url=url,
-                                critical=False,
-                                is_logged=True,
-                            )
-                except Exception:
-                    if attempt < retries - 1:
-                        await asyncio.sleep(0.5)
-                    else:
-                        raise
+            await download_file(url, filename, session=session, headers=self.headers, estimate=DEFAULT_PHOTO_ESTIMATE)
@@ -2,21 +2,75 @@ import asyncio
 import os
 import re
 from pathlib import Path
-from typing import List
-from bs4 import BeautifulSoup
+from typing import List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
 
-import aiofiles
 import aiohttp
 from fake_useragent import UserAgent
 
+from managers.admission_manager import DEFAULT_PHOTO_ESTIMATE, disk_admission, estimate_info_size
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.html_parsing import find_element, find_tag, iter_elements, run_parser
+from utils.http_download import download_file
+from utils.size_limits import size_limit
+from utils.video_fit import choose_format, keeps_source, prepare_video
+from utils.video_meta import info_meta
+from utils.ytdlp_session import open_ydl
 
 ua = UserAgent(platforms="desktop")
 
+_ZOOMABLE_WRAPPER = re.compile(r"""class\s*=\s*["'][^"']*\bzoomable-img-wrapper\b""")
+
+
+def _image_source(page: str, start: int, end: Optional[int] = None) -> Optional[str]:
+    img = find_tag(page, "img", start, end)
+    if not img:
+        return None
+    attributes, _ = img
+    return attributes.get("src") or attributes.get("data-lazy-src") or None
+
+
+def _parse_post(page: str) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """
+    Title, post type and image URLs of a post page.
+
+    Reads the <shreddit-post> attributes and the images straight from the
+    markup: post pages are hundreds of KB, mostly comments, and a DOM of
+    them costs far more than the few tags we need.
+    """
+    post = find_tag(page, "shreddit-post")
+    if not post:
+        return None, None, []
+
+    attributes, offset = post
+    author = attributes.get("author") or "N/A"
+    subreddit = attributes.get("subreddit-name") or "N/A"
+    post_title = attributes.get("post-title") or "N/A"
+    title = f"{author} on r/{subreddit} - {post_title}"
+    media_type = attributes.get("post-type") or None
+
+    image_urls = []
+    if media_type == "image":
+        wrapper = _ZOOMABLE_WRAPPER.search(page)
+        src = _image_source(page, wrapper.end()) if wrapper else None
+        if src:
+            image_urls.append(src)
+    elif media_type == "gallery":
+        carousel = find_element(page, "gallery-carousel")
+        if carousel:
+            _, start, end = carousel
+            for _, item_start, item_end in iter_elements(page, "li", start, end):
+                figure = find_tag(page, "figure", item_start, item_end)
+                src = _image_source(page, figure[1], item_end) if figure else None
+                if src:
+                    image_urls.append(src)
+
+    return title, media_type, image_urls
+
 
 class RedditService(BaseService):
     name = "Reddit"
@@ -29,8 +83,11 @@ class RedditService(BaseService):
         self.headers = {
             "User-Agent": self.user_agent,
         }
-        self.yt_dlp_opts = {
-            "outtmpl": f"{self.output_path}/%(id)s_{yt_dlp.utils.sanitize_filename('%(title)s')}.%(ext)s",
+
+    def _get_video_options(self, output_path: str):
+        return {
+            "outtmpl": f"{output_path}/%(id)s_{yt_dlp.utils.sanitize_filename('%(title)s')}.%(ext)s",
+            "merge_output_format": "mp4/mkv",
             "quiet": True,
         }
 
@@ -42,11 +99,9 @@ class RedditService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
-        image_urls = []
-        title = None
-        media_type = None
 
         try:
             async with aiohttp.ClientSession() as session:
@@ -62,70 +117,53 @@ class RedditService(BaseService):
                             is_logged=True,
                         )
 
-            soup = BeautifulSoup(page_content, 'html.parser')
+            title, media_type, image_urls = await run_parser(_parse_post, page_content)
 
-            post_info = soup.find('shreddit-post')
-
-            if post_info:
-                author = post_info.get('author') or 'N/A'
-                subreddit = post_info.get('subreddit-name') or 'N/A'
-                post_title = post_info.get('post-title') or 'N/A'
-                media_type = post_info.get('post-type') or None
-                title = f"{author} on r/{subreddit} - {post_title}"
+            if media_type == 'video':
+                options = self._get_video_options(output_path)
+                loop = asyncio.get_event_loop()
+                async with open_ydl(options) as ydl:
+                    with track_phase("extract", self.name):
+                        info_dict = await loop.run_in_executor(
+                            self._download_executor,
+                            lambda: ydl.extract_info(url, download=False)
+                        )
 
-            if media_type == 'image':
-                img_tag = soup.select_one('.zoomable-img-wrapper img')
-                if img_tag:
-                    src = img_tag.get('src') or img_tag.get('data-lazy-src')
-                    if src:
-                        image_urls.append(src)
-                else:
+                if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
-                        message="No images found on the Reddit page",
+                        message="Failed to get video info",
                         url=url,
-                        critical=False,
-                        is_logged=True,
+                        critical=True,
+                        is_logged=True
                     )
-            elif media_type == 'video':
-                with yt_dlp.YoutubeDL(self.yt_dlp_opts) as ydl:
-                    loop = asyncio.get_event_loop()
 
-                    info_dict = await loop.run_in_executor(
-                        self._download_executor,
-                        lambda: ydl.extract_info(url, download=False)
-                    )
-
-                    if not info_dict:
-                        raise BotError(
-                            code=ErrorCode.DOWNLOAD_FAILED,
-                            message="Failed to get video info",
-                            url=url,
-                            critical=True,
-                            is_logged=True
+                limit = size_limit(self.name)
+                choice = choose_format(info_dict, limit, url)
+                if choice:
+                    options["format"] = choice.format_id
+
+                async with open_ydl(options) as ydl:
+                    await disk_admission.reserve(output_path, choice.size if choice else estimate_info_size(info_dict))
+                    with track_phase("download", self.name):
+                        info_dict = await loop.run_in_executor(
+                            self._download_executor,
+                            lambda: ydl.process_ie_result(info_dict, download=True)
                         )
 
-                    await loop.run_in_executor(
-                        self._download_executor,
-                        lambda: ydl.download([url])
-                    )
-
+                    filename = ydl.prepare_filename(info_dict)
+                    paths = await prepare_video(filename, limit, info_dict.get("duration"))
+                    meta = info_meta(info_dict) if keeps_source(filename, paths) else {}
                     return [
                         MediaContent(
                             type=MediaType.VIDEO,
-                            path=Path(ydl.prepare_filename(info_dict)),
+                            path=Path(path),
                             title=title,
+                            **meta,
                         )
+                        for path in paths
                     ]
-            elif media_type == 'gallery':
-                carousel = soup.select_one('gallery-carousel')
-                for li in carousel.select('li'):
-                    img_tag = li.select_one('figure img')
-                    if img_tag:
-                        src = img_tag.get('src') or img_tag.get('data-lazy-src')
-                        if src:
-                            image_urls.append(src)
-            else:
+            elif media_type not in ('image', 'gallery'):
                 raise BotError(
                     code=ErrorCode.INVALID_URL,
                     message="No media found on the Reddit page",
@@ -133,9 +171,17 @@ class RedditService(BaseService):
                     critical=False,
                     is_logged=False,
                 )
+            elif not image_urls:
+                raise BotError(
+                    code=ErrorCode.DOWNLOAD_FAILED,
+                    message="No images found on the Reddit page",
+                    url=url,
+                    critical=False,
+                    is_logged=True,
+                )
 
             for img_url in image_urls:
-                filename = self.output_path + img_url.split("/")[-1]
+                filename = os.path.join(output_path, img_url.split("/")[-1].split("?")[0])
                 await self._download_photo(img_url, filename)
 
                 result.append(
@@ -160,29 +206,4 @@ class RedditService(BaseService):
         return result
 
     async def _download_photo(self, url: str, filename: str) -> None:
-        retries = 3
-        for attempt in range(retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, headers=self.headers) as response:
-                        if response.status == 200:
-                            async with aiofiles.open(filename, "wb") as f:
-                                while True:
-                                    chunk = await response.content.read(1024)
-                                    if not chunk:
-                                        break
-                                    await f.write(chunk)
-                            break
-                        else:
-                            raise BotError(
-                                code=ErrorCode.DOWNLOAD_FAILED,
-                                message=f"Failed to download Reddit image: {response.status}",
-                                url=url,
-                                critical=False,
-                                is_logged=True,
-                            )
-            except Exception:
-                if attempt < retries - 1:
-                    await asyncio.sleep(0.5)
-                else:
-                    raise
+        await download_file(url, filename, headers=self.headers, estimate=DEFAULT_PHOTO_ESTIMATE)
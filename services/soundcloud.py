@@ -3,18 +3,21 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-import aiofiles
-import aiohttp
-import yt_dlp
 from aiofiles import os as aios
 from yt_dlp.utils import sanitize_filename
 
+from managers.admission_manager import disk_admission, estimate_info_size
+from managers.cover_manager import cover_manager
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
-from utils import random_cookie_file, update_metadata
+from utils import random_cookie_file
+from utils.audio_policy import find_audio_file, get_audio_format
+from utils.audio_postprocessor import AudioTagPP
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.ytdlp_session import open_ydl
 
 
 class SoundCloudService(BaseService):
@@ -26,18 +29,11 @@ class SoundCloudService(BaseService):
         self.output_path = output_path
         os.makedirs(self.output_path, exist_ok=True)
 
-    def _get_audio_options(self):
+    def _get_audio_options(self, output_path: str):
         return {
-            "format": "bestaudio",
-            "writethumbnail": True,
-            "outtmpl": f"{self.output_path}/{sanitize_filename('%(title)s')}",
+            "format": get_audio_format(),
+            "outtmpl": f"{output_path}/{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                },
-            ],
         }
 
     def is_supported(self, url: str) -> bool:
@@ -48,16 +44,18 @@ class SoundCloudService(BaseService):
             re.match(r"^https?:\/\/(www\.)?soundcloud\.com\/[\w\-]+\/sets\/[\w\-]+$", url)
         )
 
-    async def download(self, url: str) -> List[MediaContent]:
-        options = self._get_audio_options()
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
+        options = self._get_audio_options(output_path)
         try:
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
                 if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
@@ -77,47 +75,29 @@ class SoundCloudService(BaseService):
 
                 cover_url = self._get_cover_url(info_dict)
 
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.download([url])
-                )
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict, factor=2))
 
                 base_path = os.path.join(
-                    self.output_path,
+                    output_path,
                     f"{sanitize_filename(info_dict['title'])}"
                 )
 
-                audio_path = f"{base_path}.mp3"
-                cover_path = f"{base_path}.jpg"
-
                 if cover_url is None:
                     cover_url = info_dict.get("thumbnail", None)
 
-                if cover_url:
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(cover_url) as response:
-                                response.raise_for_status()
-                                cover_path = f"{base_path}.jpg"
-                                async with aiofiles.open(cover_path, 'wb') as f:
-                                    async for chunk in response.content.iter_chunked(1024):
-                                        await f.write(chunk)
-
-                        if not await aios.path.exists(cover_path):
-                            cover_path = None
-
-                    except Exception:
-                        cover_path = None
-
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: update_metadata(
-                        audio_path,
-                        title=title,
-                        artist=permofer,
-                        cover_file=cover_path
-                    )
+                cover = await cover_manager.get(cover_url, output_path)
+
+                ydl.add_post_processor(
+                    AudioTagPP(ydl, title=title, artist=permofer, cover=cover.tag if cover else None),
+                    when="post_process",
                 )
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.download([url])
+                    )
+
+                audio_path = find_audio_file(base_path) or f"{base_path}.mp3"
 
                 if await aios.path.exists(audio_path):
                     return [MediaContent(
@@ -126,7 +106,7 @@ class SoundCloudService(BaseService):
                         duration=info_dict.get("duration", None),
                         title=title,
                         performer=permofer,
-                        cover=Path(cover_path) if cover_path else None
+                        cover=cover.thumbnail if cover else None
                     )]
                 else:
                     raise BotError(
@@ -160,12 +140,13 @@ class SoundCloudService(BaseService):
 
         try:
             options = {"noplaylist": False, "extract_flat": True}
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
-                info = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
                 if not info or "entries" not in info:
                     raise BotError(
                         code=ErrorCode.PLAYLIST_INFO_ERROR,
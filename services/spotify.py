@@ -3,14 +3,14 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-import aiofiles
 import aiohttp
-import yt_dlp
 from aiofiles import os as aios
 from yt_dlp.utils import sanitize_filename
 
+from managers.admission_manager import disk_admission, estimate_info_size
+from managers.cover_manager import cover_manager
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils import (
@@ -18,9 +18,12 @@ from utils import (
     get_spotify_author,
     random_cookie_file,
     search_music,
-    update_metadata,
 )
+from utils.audio_policy import find_audio_file, get_audio_format
+from utils.audio_postprocessor import AudioTagPP
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.ytdlp_session import open_ydl
 
 
 class SpotifyService(BaseService):
@@ -32,17 +35,11 @@ class SpotifyService(BaseService):
         self.output_path = output_path
         os.makedirs(self.output_path, exist_ok=True)
 
-    def _get_audio_options(self):
+    def _get_audio_options(self, output_path: str):
         return {
-            "format": "bestaudio",
-            "outtmpl": f"{self.output_path}/{sanitize_filename('%(title)s')}",
+            "format": get_audio_format(),
+            "outtmpl": f"{output_path}/{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                }
-            ],
         }
 
     def is_supported(self, url: str) -> bool:
@@ -51,7 +48,8 @@ class SpotifyService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return bool(re.match(r"https?://open\.spotify\.com/playlist/([\w-]+)", url))
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         permofer, title, cover_url = await get_spotify_author(url)
         if not permofer or not title:
             raise BotError(
@@ -63,15 +61,16 @@ class SpotifyService(BaseService):
             )
 
         video_link = await search_music(permofer, title)
-        options = self._get_audio_options()
+        options = self._get_audio_options(output_path)
         try:
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(video_link, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(video_link, download=False)
+                    )
                 if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
@@ -80,48 +79,28 @@ class SpotifyService(BaseService):
                         is_logged=True
                     )
 
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.download([video_link])
-                )
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict, factor=2))
 
                 base_path = os.path.join(
-                    self.output_path,
+                    output_path,
                     f"{sanitize_filename(info_dict['title'])}"
                 )
-                audio_path = f"{base_path}.mp3"
-                cover_path = f"{base_path}.jpg"
-
                 if cover_url is None:
                     cover_url = info_dict.get("thumbnail", None)
 
-                if cover_url:
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(cover_url) as response:
-                                response.raise_for_status()
-                                cover_path = f"{base_path}.jpg"
-                                async with aiofiles.open(cover_path, 'wb') as f:
-                                    async for chunk in response.content.iter_chunked(1024):
-                                        await f.write(chunk)
-
-                        if not await aios.path.exists(cover_path):
-                            cover_path = None
-
-                    except Exception:
-                        cover_path = None
+                cover = await cover_manager.get(cover_url, output_path)
 
-                assert cover_path, "Cover URL is not available"
-
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: update_metadata(
-                        audio_path,
-                        title=title,
-                        artist=permofer,
-                        cover_file=cover_path
-                    )
+                ydl.add_post_processor(
+                    AudioTagPP(ydl, title=title, artist=permofer, cover=cover.tag if cover else None),
+                    when="post_process",
                 )
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.download([video_link])
+                    )
+
+                audio_path = find_audio_file(base_path) or f"{base_path}.mp3"
 
                 if await aios.path.exists(audio_path):
                     return [MediaContent(
@@ -130,7 +109,7 @@ class SpotifyService(BaseService):
                         duration=info_dict.get("duration", None),
                         title=title,
                         performer=permofer,
-                        cover=Path(cover_path) if cover_path else None
+                        cover=cover.thumbnail if cover else None
                     )]
                 else:
                     raise BotError(
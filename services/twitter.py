@@ -3,16 +3,18 @@ import logging
 import os
 import re
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-import aiofiles
 import aiohttp
 from fake_useragent import UserAgent
 
+from managers.admission_manager import DEFAULT_PHOTO_ESTIMATE, DEFAULT_VIDEO_ESTIMATE
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
 from utils import truncate_string
 from utils.error_handler import BotError, ErrorCode
+from utils.size_limits import check_url_size, size_limit
+from utils.http_download import download_file
 
 ua = UserAgent()
 
@@ -35,7 +37,8 @@ class TwitterService(BaseService):
     def is_playlist(self, url: str) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         result = []
         try:
             match = re.search(r"status/(\d+)", url)
@@ -62,6 +65,7 @@ class TwitterService(BaseService):
             title = tweet_dict["data"]["tweetResult"]["result"]["legacy"]["full_text"]
 
             tasks = []
+            videos = []
             for media in medias:
                 if media["type"] == "photo":
                     photo_url = media["media_url_https"]
@@ -71,7 +75,7 @@ class TwitterService(BaseService):
                     if match is None:
                         continue
                     filename = os.path.join(
-                        self.output_path,
+                        output_path,
                         self._sanitize_filename(os.path.basename(photo_url)),
                     )
                     tasks.append(self._download_file(photo_url, filename))
@@ -96,14 +100,15 @@ class TwitterService(BaseService):
                     match = re.search(r"([^/]+\.mp4)", video_url)
                     if match is None:
                         continue
-                    filename = self.output_path + "/" + match.group(1)
+                    filename = os.path.join(output_path, match.group(1))
 
-                    tasks.append(self._download_file(video_url, filename))
+                    videos.append((video_url, filename, self._bitrate_estimate(video_with_highest_bitrate, media)))
                     result.append(
                         MediaContent(
                             type=MediaType.VIDEO,
                             path=Path(filename),
-                            title=truncate_string(f"{author} - {title}")
+                            title=truncate_string(f"{author} - {title}"),
+                            **self._video_meta(media),
                             )
                         )
 
@@ -115,16 +120,30 @@ class TwitterService(BaseService):
                     match = re.search(r"([^/]+\.mp4)", video_url)
                     if match is None:
                         continue
-                    filename = self.output_path + "/" + match.group(1)
+                    filename = os.path.join(output_path, match.group(1))
 
-                    tasks.append(self._download_file(video_url, filename))
+                    tasks.append(self._download_file(video_url, filename, estimate=DEFAULT_VIDEO_ESTIMATE))
                     result.append(
                         MediaContent(
                             type=MediaType.GIF,
-                            path=Path(filename)
+                            path=Path(filename),
+                            **self._video_meta(media),
                             )
                         )
 
+            # Reject oversized videos before any file of the tweet is downloaded
+            limit = size_limit(self.name)
+            try:
+                sizes = await asyncio.gather(*(check_url_size(video_url, limit) for video_url, _, _ in videos))
+            except BotError:
+                for task in tasks:
+                    task.close()
+                raise
+
+            # Reserve the probed size, or what the bitrate predicts when HEAD doesn't tell
+            for (video_url, filename, bitrate_estimate), size in zip(videos, sizes):
+                tasks.append(self._download_file(video_url, filename, estimate=size or bitrate_estimate))
+
             await asyncio.gather(*tasks)
 
         except BotError as e:
@@ -191,20 +210,27 @@ class TwitterService(BaseService):
                         critical=True,
                     )
 
-    async def _download_file(self, url: str, filename: str, max_size: int = 0):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if max_size and "Content-Length" in response.headers:
-                    if int(response.headers["Content-Length"]) > max_size:
-                        return BotError(
-                            code=ErrorCode.SIZE_CHECK_FAIL,
-                            url=url,
-                            critical=False,
-                        )
-
-                async with aiofiles.open(filename, "wb") as f:
-                    async for chunk in response.content.iter_chunked(1024 * 8):
-                        await f.write(chunk)
+    async def _download_file(self, url: str, filename: str, max_size: int = 0, estimate: int = DEFAULT_PHOTO_ESTIMATE):
+        await download_file(url, filename, max_size=max_size or size_limit(self.name), estimate=estimate)
+
+    @staticmethod
+    def _bitrate_estimate(variant: dict, media: dict) -> int:
+        """Size of a video variant from its bitrate and the tweet video's duration."""
+        duration_millis = (media.get("video_info") or {}).get("duration_millis")
+        if variant.get("bitrate") and duration_millis:
+            return int(variant["bitrate"] / 8 * duration_millis / 1000)
+        return DEFAULT_VIDEO_ESTIMATE
+
+    @staticmethod
+    def _video_meta(media: dict) -> dict:
+        """Width, height and duration of a tweet video from its media entity."""
+        original_info = media.get("original_info") or {}
+        duration_millis = (media.get("video_info") or {}).get("duration_millis")
+        return {
+            "width": original_info.get("width"),
+            "height": original_info.get("height"),
+            "duration": duration_millis / 1000 if duration_millis else None,
+        }
 
     def _sanitize_filename(self, filename: str) -> str:
         return re.sub(r'[<>:"/\\|?*\x00-\x1F]', "_", filename)
@@ -4,58 +4,91 @@ import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-import aiofiles
-import aiohttp
 import yt_dlp
 from yt_dlp.utils import sanitize_filename
 
+from managers.admission_manager import disk_admission, estimate_info_size
+from managers.cache_manager import media_cache
+from managers.cover_manager import cover_manager
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
-from utils import random_cookie_file, update_metadata
+from utils import random_cookie_file
+from utils.audio_policy import find_audio_file
+from utils.audio_postprocessor import AudioTagPP
 from utils.error_handler import BotError, ErrorCode
-from config.settings import LOCAL_SERVER
+from utils.metrics import track_phase
+from utils.format_selector import FormatSelector, prefer_h264
+from utils.size_limits import size_filter, size_limit
+from utils.video_fit import choose_format, fallback_selector, keeps_source, lookup_format, prepare_video
+from utils.ytdlp_session import open_ydl
 
 logger = logging.getLogger(__name__)
 
+# yt-dlp filters for the audio codecs a chat can prefer, the first is the default
+AUDIO_CODEC_FILTERS = {"m4a": "[acodec^=mp4a]", "opus": "[acodec=opus]"}
+
 
 class YouTubeService(BaseService):
     name = "Youtube"
     _download_executor = ThreadPoolExecutor(max_workers=10)
+    _format_selector = FormatSelector(
+        audio_filter=lambda f: (f.get("acodec") or "").startswith("mp4a"),
+        video_rank=prefer_h264,
+    )
+    _fallback_selector = fallback_selector(_format_selector)
+    _capped_selectors: Dict[int, Tuple[FormatSelector, FormatSelector]] = {}
 
     def __init__(self, output_path: str = "other/downloadsTemp") -> None:
         super().__init__()
         self.output_path = output_path
 
-    def _get_video_options(self):
+    def _get_video_options(self, output_path: str):
         return {
-            "format": "bv*[filesize < 50M][ext=mp4][vcodec^=avc1] + ba[ext=m4a]",
-            "outtmpl": f"{self.output_path}/%(id)s_{sanitize_filename('%(title)s')}.%(ext)s",
+            "format": f"bv*[filesize < {size_filter(size_limit(self.name))}] + ba[ext=m4a]/b[filesize < {size_filter(size_limit(self.name))}]",
+            "merge_output_format": "mp4/mkv",
+            "outtmpl": f"{output_path}/%(id)s_{sanitize_filename('%(title)s')}.%(ext)s",
             "noplaylist": True,
             "cookiefile": random_cookie_file(),
         }
 
-    def _get_audio_options(self):
+    def _get_audio_options(self, output_path: str):
         return {
-            "format": "ba[filesize<50M][acodec^=mp4a]/ba[filesize<50M][acodec=opus]/best[filesize<50M]",
-            "outtmpl": f"{self.output_path}/%(id)s_{sanitize_filename('%(title)s')}",
+            "format": self._audio_format(),
+            "outtmpl": f"{output_path}/%(id)s_{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                }
-            ],
         }
 
-    def is_supported(self, url: str) -> bool:
-        return bool(
-            re.match(
-                r"https?://(?:www\.)?(?:m\.)?(?:youtu\.be/|youtube\.com/(?:shorts/|watch\?v=))([\w-]+)",
-                url,
+    @staticmethod
+    def _audio_format(max_size: Optional[int] = None, audio_codec: Optional[str] = None) -> str:
+        limit = size_filter(max_size or size_limit(YouTubeService.name))
+        codecs = sorted(AUDIO_CODEC_FILTERS, key=lambda codec: codec != audio_codec)
+        return "/".join(f"ba[filesize<{limit}]{AUDIO_CODEC_FILTERS[codec]}" for codec in codecs) + f"/best[filesize<{limit}]"
+
+    @classmethod
+    def _selectors(cls, quality_cap: Optional[int] = None) -> Tuple[FormatSelector, FormatSelector]:
+        """The format selector and its fallback, limited to ``quality_cap`` pixels of height if set."""
+        if not quality_cap:
+            return cls._format_selector, cls._fallback_selector
+        if quality_cap not in cls._capped_selectors:
+            selector = FormatSelector(
+                video_filter=lambda f: (f.get("height") or 0) <= quality_cap,
+                audio_filter=cls._format_selector.audio_filter,
+                video_rank=prefer_h264,
             )
+            cls._capped_selectors[quality_cap] = (selector, fallback_selector(selector))
+        return cls._capped_selectors[quality_cap]
+
+    def is_supported(self, url: str) -> bool:
+        return bool(self._get_video_id(url))
+
+    def _get_video_id(self, url: str) -> Optional[str]:
+        match = re.match(
+            r"https?://(?:www\.)?(?:m\.)?(?:youtu\.be/|youtube\.com/(?:shorts/|watch\?v=))([\w-]+)",
+            url,
         )
+        return match.group(1) if match else None
 
     def is_playlist(self, url: str) -> bool:
         return False
@@ -63,14 +96,38 @@ class YouTubeService(BaseService):
     def supports_format_choice(self) -> bool:
         return True
 
-    async def download(self, url: str, format_choice: Optional[str] = None) -> List[MediaContent]:
+    async def download(
+        self,
+        url: str,
+        format_choice: Optional[str] = None,
+        output_path: Optional[str] = None,
+        quality_cap: Optional[int] = None,
+        audio_codec: Optional[str] = None,
+    ) -> List[MediaContent]:
+        output_path = output_path or self.output_path
         if format_choice == "audio":
-            return await self.download_audio(url)
-        return await self.download_video(url)
+            return await self.download_audio(url, output_path, audio_codec)
+        return await self.download_video(url, output_path, quality_cap)
+
+    async def download_video(self, url: str, output_path: str, quality_cap: Optional[int] = None) -> List[MediaContent]:
+        video_id = self._get_video_id(url)
+        # Capped downloads are cached apart, they are a different file
+        cache_format = f"video_{quality_cap}p" if quality_cap else "video"
+        cached = await media_cache.get(self.name, video_id, cache_format)
+        if cached:
+            return [
+                MediaContent(
+                    type=MediaType.VIDEO,
+                    path=cached.path,
+                    width=cached.meta.get("width"),
+                    height=cached.meta.get("height"),
+                    duration=cached.meta.get("duration"),
+                    title=cached.meta.get("title", "video"),
+                )
+            ]
 
-    async def download_video(self, url: str) -> List[MediaContent]:
         try:
-            is_valid, best_format = await self._check_video_size(url)
+            is_valid, best_format = await self._check_video_size(url, quality_cap=quality_cap)
             if is_valid is False and best_format is None:
                 raise BotError(
                     code=ErrorCode.SIZE_CHECK_FAIL,
@@ -80,15 +137,16 @@ class YouTubeService(BaseService):
                     is_logged=False
                 )
 
-            options = self._get_video_options()
+            options = self._get_video_options(output_path)
             options["format"] = best_format
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
 
                 if not info_dict:
                     raise BotError(
@@ -99,19 +157,39 @@ class YouTubeService(BaseService):
                         is_logged=True
                     )
 
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.download([url])
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict))
+
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.download([url])
+                    )
+
+                filename = ydl.prepare_filename(info_dict)
+                paths = await prepare_video(filename, size_limit(self.name), info_dict.get("duration"))
+
+                meta = {
+                    "width": info_dict.get("width", None),
+                    "height": info_dict.get("height", None),
+                    "duration": info_dict.get("duration", None),
+                    "title": info_dict.get("title", "video"),
+                }
+                if not keeps_source(filename, paths):
+                    # Shrunk or split videos have different dimensions and durations
+                    meta.update(width=None, height=None, duration=None)
+
+                if len(paths) > 1:
+                    return [MediaContent(type=MediaType.VIDEO, path=Path(path), **meta) for path in paths]
+
+                video_path = await media_cache.put(
+                    self.name, info_dict["id"], cache_format, paths[0], meta=meta
                 )
 
                 return [
                     MediaContent(
                         type=MediaType.VIDEO,
-                        path=Path(ydl.prepare_filename(info_dict)),
-                        width=info_dict.get("width", None),
-                        height=info_dict.get("height", None),
-                        duration=info_dict.get("duration", None),
-                        title=info_dict.get("title", "video"),
+                        path=video_path,
+                        **meta,
                     )
                 ]
 
@@ -127,9 +205,22 @@ class YouTubeService(BaseService):
                 is_logged=True
             )
 
-    async def download_audio(self, url: str) -> List[MediaContent]:
+    async def download_audio(self, url: str, output_path: str, audio_codec: Optional[str] = None) -> List[MediaContent]:
+        video_id = self._get_video_id(url)
+        cache_format = "audio_opus" if audio_codec == "opus" else "audio"
+        cached = await media_cache.get(self.name, video_id, cache_format)
+        if cached:
+            cover = await cover_manager.get(cached.meta.get("cover_url"), output_path)
+            return [MediaContent(
+                type=MediaType.AUDIO,
+                path=cached.path,
+                duration=cached.meta.get("duration", 0),
+                title=cached.meta.get("title", "audio"),
+                cover=cover.thumbnail if cover else None
+            )]
+
         try:
-            is_valid, best_format = await self._check_audio_size(url)
+            is_valid, best_format = await self._check_audio_size(url, audio_codec=audio_codec)
             if is_valid is False or best_format is None:
                 raise BotError(
                     code=ErrorCode.SIZE_CHECK_FAIL,
@@ -137,15 +228,16 @@ class YouTubeService(BaseService):
                     url=url
                 )
 
-            options = self._get_audio_options()
+            options = self._get_audio_options(output_path)
             options["format"] = best_format
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_running_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
                 if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
@@ -153,42 +245,48 @@ class YouTubeService(BaseService):
                         url=url
                     )
 
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.download([url])
-                )
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict, factor=2))
 
                 base_path = os.path.join(
-                    self.output_path,
+                    output_path,
                     f"{info_dict['id']}_{sanitize_filename(info_dict['title'])}"
                 )
-                audio_path = f"{base_path}.mp3"
-                thumbnail_path = f"{base_path}.jpg"
-
-                thumbnail_url = info_dict.get("thumbnail", None)
-                if thumbnail_url:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(thumbnail_url) as response:
-                            response.raise_for_status()
-                            async with aiofiles.open(thumbnail_path, 'wb') as f:
-                                async for chunk in response.content.iter_chunked(1024):
-                                    await f.write(chunk)
-
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: update_metadata(
-                        audio_path,
+
+                # The cover is fetched first so ffmpeg can embed it while writing the audio
+                cover_url = info_dict.get("thumbnail", None)
+                cover = await cover_manager.get(cover_url, output_path)
+
+                ydl.add_post_processor(
+                    AudioTagPP(
+                        ydl,
                         title=info_dict.get("title", "audio"),
                         artist=info_dict.get("uploader", "unknown"),
-                        cover_file=thumbnail_path
+                        cover=cover.tag if cover else None,
+                        audio_codec=audio_codec,
+                    ),
+                    when="post_process",
+                )
+                with track_phase("download", self.name):
+                    await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.download([url])
                     )
+
+                audio_path = find_audio_file(base_path) or f"{base_path}.mp3"
+                meta = {
+                    "duration": info_dict.get("duration", 0),
+                    "title": info_dict.get("title", "audio"),
+                }
+                cached_audio = await media_cache.put(
+                    self.name, info_dict["id"], cache_format, audio_path,
+                    meta={**meta, "cover_url": cover_url},
                 )
+
                 return [MediaContent(
                     type=MediaType.AUDIO,
-                    path=Path(audio_path),
-                    duration=info_dict.get("duration", 0),
-                    title=info_dict.get("title", "audio"),
-                    cover=Path(thumbnail_path)
+                    path=cached_audio,
+                    cover=cover.thumbnail if cover else None,
+                    **meta,
                 )]
         except BotError as e:
             raise e
@@ -202,79 +300,57 @@ class YouTubeService(BaseService):
             )
 
 
-    async def _check_video_size(self, url: str, max_size_mb: int =50) -> Tuple[bool, Union[str, None]]:
+    async def _check_video_size(self, url: str, max_size_mb: Optional[int] = None, quality_cap: Optional[int] = None) -> Tuple[bool, Union[str, None]]:
         """
-        Checks if there is an available option to download video and audio up to a given size (default 50 MB).
+        Checks if there is an available option to download video and audio up to a given size (default is the upload limit).
+
+        Formats without a known filesize are estimated from their bitrate, and the
+        decision is memoized per video, so repeated links skip the probe entirely.
 
         Args:
             url (str): YouTube video URL.
             max_size_mb (int): Maximum allowed size in megabytes.
+            quality_cap (int): Maximum video height in pixels.
 
         Returns:
             Tuple[bool, Optional[str]]:
             - (True, format string like '137+140') if a suitable pair is found.
             - (False, None) otherwise.
         """
+        max_size = max_size_mb * 1024 * 1024 if max_size_mb else size_limit(self.name)
+        selector, fallback = self._selectors(quality_cap)
+
+        found, choice = lookup_format(
+            selector.media_key(self.name, self._get_video_id(url)),
+            max_size,
+            selector,
+            fallback,
+        )
+        if found:
+            return (True, choice.format_id) if choice else (False, None)
+
         ydl_opts = {
             'skip_download': True,
             'force_ipv4': True,
             'quiet': True,
             "cookiefile": random_cookie_file(),
         }
-        if LOCAL_SERVER:
-            max_size_mb = 100
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            async with open_ydl(ydl_opts) as ydl:
                 loop = asyncio.get_running_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
 
             if not info_dict:
                 return False, None
 
-            formats = info_dict.get('formats', [])
-            video_formats = []
-            audio_formats = []
-
-            for f in formats:
-                ext = f.get('ext')
-                vcodec = f.get('vcodec', '')
-                acodec = f.get('acodec', '')
-                filesize = f.get('filesize') or f.get('filesize_approx')
-
-                if not filesize:
-                    continue
-
-                if vcodec != 'none' and vcodec and ext == "mp4":
-                    if vcodec.startswith('avc1'):
-                        video_formats.append(f)
-                if acodec != 'none' and vcodec == "none" and acodec.startswith('mp4a'):
-                    audio_formats.append(f)
-
-            best_pair = None
-            best_score = (-1, -1)
-
-            for v in video_formats:
-                for a in audio_formats:
-                    v_size = v.get('filesize') or v.get('filesize_approx') or 0
-                    a_size = a.get('filesize') or a.get('filesize_approx') or 0
-
-                    total_size_mb = (v_size + a_size) / (1024 * 1024)
-
-                    if total_size_mb <= max_size_mb:
-                        score = (
-                            v.get('height', 0),
-                            a.get('abr', 0)
-                        )
-                        if score > best_score:
-                            best_score = score
-                            best_pair = f'{v["format_id"]}+{a["format_id"]}'
-
-            if best_pair:
-                return True, best_pair
+            choice = choose_format(info_dict, max_size, url, selector, fallback)
+            if choice:
+                return True, choice.format_id
             else:
                 return False, None
         except Exception as e:
@@ -341,13 +417,14 @@ class YouTubeService(BaseService):
                 return False, None
 
 
-    async def _check_audio_size(self, url: str, max_size_mb: int =50) -> Tuple[bool, Union[str, None]]:
+    async def _check_audio_size(self, url: str, max_size_mb: Optional[int] = None, audio_codec: Optional[str] = None) -> Tuple[bool, Union[str, None]]:
         """
-        Checks if there is an available option to download audio up to a given size (default 50 MB).
+        Checks if there is an available option to download audio up to a given size (default is the upload limit).
 
         Args:
             url (str): YouTube video URL.
             max_size_mb (int): Maximum allowed size in megabytes.
+            audio_codec (str): Preferred codec, a key of AUDIO_CODEC_FILTERS.
 
         Returns:
             Tuple[bool, Optional[str]]:
@@ -358,19 +435,18 @@ class YouTubeService(BaseService):
             'skip_download': True,
             'force_ipv4': True,
             'quiet': True,
-            "format": "ba[filesize<50M][acodec^=mp4a]/ba[filesize<50M][acodec=opus]/best[filesize<50M]",
+            "format": self._audio_format(max_size_mb * 1024 * 1024 if max_size_mb else None, audio_codec),
             "cookiefile": random_cookie_file(),
         }
-        if LOCAL_SERVER:
-            ydl_opts["format"] = "ba[filesize<100M][acodec^=mp4a]/ba[filesize<100M][acodec=opus]/best[filesize<100M]"
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            async with open_ydl(ydl_opts) as ydl:
                 loop = asyncio.get_running_loop()
 
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=False)
-                )
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
                 if not info_dict or not info_dict.get("formats"):
                     raise BotError(
                         code=ErrorCode.INVALID_URL,
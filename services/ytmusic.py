@@ -2,19 +2,22 @@ import asyncio
 import os
 import re
 from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from typing import List, Optional
 
-import aiofiles
-import aiohttp
-import yt_dlp
 from aiofiles import os as aios
 from yt_dlp.utils import sanitize_filename
 from ytmusicapi import YTMusic
 
+from managers.admission_manager import disk_admission, estimate_info_size
+from managers.cover_manager import cover_manager
 from models.media_models import MediaContent, MediaType
 from services.base_service import BaseService
-from utils import random_cookie_file, update_metadata
+from utils import random_cookie_file
+from utils.audio_policy import find_audio_file, get_audio_format
+from utils.audio_postprocessor import AudioTagPP
 from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+from utils.ytdlp_session import open_ydl
 from pathlib import Path
 
 _search_executor = ThreadPoolExecutor(max_workers=5)
@@ -27,25 +30,19 @@ class YtMusicService(BaseService):
         super().__init__()
         self.output_path = output_path
 
-    def _get_playlist_options(self):
+    def _get_playlist_options(self, output_path: str):
         return {
             "format": "bestaudio",
-            "outtmpl": f"{self.output_path}/{sanitize_filename('%(title)s')}",
+            "outtmpl": f"{output_path}/{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
         }
 
-    def _get_audio_options(self):
+    def _get_audio_options(self, output_path: str):
         return {
-            "format": "bestaudio",
-            "outtmpl": f"{self.output_path}/{sanitize_filename('%(title)s')}",
+            "format": get_audio_format(),
+            "outtmpl": f"{output_path}/{sanitize_filename('%(title)s')}",
             "cookiefile": random_cookie_file(),
             "noplaylist": True,
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                }
-            ],
         }
 
     def is_supported(self, url: str) -> bool:
@@ -62,17 +59,19 @@ class YtMusicService(BaseService):
     def supports_format_choice(self) -> bool:
         return False
 
-    async def download(self, url: str) -> List[MediaContent]:
-        options = self._get_audio_options()
+    async def download(self, url: str, output_path: Optional[str] = None) -> List[MediaContent]:
+        output_path = output_path or self.output_path
+        options = self._get_audio_options(output_path)
         try:
-            with yt_dlp.YoutubeDL(options) as ydl:
+            async with open_ydl(options) as ydl:
                 loop = asyncio.get_event_loop()
 
-                # Получаем информацию и сразу скачиваем
-                info_dict = await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: ydl.extract_info(url, download=True)
-                )
+                # Получаем информацию, резервируем место и скачиваем без повторного извлечения
+                with track_phase("extract", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.extract_info(url, download=False)
+                    )
                 if not info_dict:
                     raise BotError(
                         code=ErrorCode.DOWNLOAD_FAILED,
@@ -80,33 +79,32 @@ class YtMusicService(BaseService):
                         url=url,
                     )
 
+                await disk_admission.reserve(output_path, estimate_info_size(info_dict, factor=2))
+
                 base_path = os.path.join(
-                    self.output_path,
+                    output_path,
                     f"{sanitize_filename(info_dict['title'])}"
                 )
-                audio_path = f"{base_path}.mp3"
-                cover_path = f"{base_path}.jpg"
-
-                # Скачивание cover изображения
-                cover_url = info_dict.get("thumbnail", None)
-                if cover_url:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(cover_url) as response:
-                            response.raise_for_status()
-                            async with aiofiles.open(cover_path, 'wb') as f:
-                                async for chunk in response.content.iter_chunked(1024):
-                                    await f.write(chunk)
-
-                # Обновление метаданных
-                await loop.run_in_executor(
-                    self._download_executor,
-                    lambda: update_metadata(
-                        audio_path,
+
+                cover = await cover_manager.get(info_dict.get("thumbnail", None), output_path)
+
+                # Метаданные и обложка записываются ffmpeg вместе с аудио
+                ydl.add_post_processor(
+                    AudioTagPP(
+                        ydl,
                         title=info_dict.get("title", "audio"),
                         artist=info_dict.get("uploader", "unknown"),
-                        cover_file=cover_path
-                    )
+                        cover=cover.tag if cover else None,
+                    ),
+                    when="post_process",
                 )
+                with track_phase("download", self.name):
+                    info_dict = await loop.run_in_executor(
+                        self._download_executor,
+                        lambda: ydl.process_ie_result(info_dict, download=True)
+                    )
+
+                audio_path = find_audio_file(base_path) or f"{base_path}.mp3"
 
                 if await aios.path.exists(audio_path):
                     return [
@@ -115,7 +113,7 @@ class YtMusicService(BaseService):
                             path=Path(audio_path),
                             duration=info_dict.get("duration", 0),
                             title=info_dict.get("title", "audio"),
-                            cover=Path(cover_path)
+                            cover=cover.thumbnail if cover else None
                         )
                     ]
                 else:
@@ -153,7 +151,10 @@ class YtMusicService(BaseService):
             if match:
                 playlist_id = match.group(1)
 
-                playlist_entries = yt.get_playlist(playlist_id, limit=None)
+                playlist_entries = await asyncio.get_event_loop().run_in_executor(
+                    _search_executor,
+                    lambda: yt.get_playlist(playlist_id, limit=None)
+                )
                 for entry in playlist_entries['tracks']:
                     videoid = entry.get('videoId', None)
                     if not videoid:
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config is read at import time: give it dummy credentials like benchmarks/run.py does
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("ADMIN_ID", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+import pytest
+
+from utils import audio_policy
+from utils.audio_policy import get_output_codec
+
+
+@pytest.fixture(autouse=True)
+def default_settings(monkeypatch):
+    monkeypatch.setattr(audio_policy, "AUDIO_OUTPUT_POLICY", "copy")
+    monkeypatch.setattr(audio_policy, "AUDIO_REMUX_CODECS", "m4a")
+
+
+def test_opus_is_encoded_without_preference():
+    ext, codec_args = get_output_codec("opus")
+    assert ext == "mp3"
+    assert "libmp3lame" in codec_args
+
+
+def test_preferred_opus_is_copied():
+    assert get_output_codec("opus", "opus") == ("opus", ["-c:a", "copy"])
+
+
+def test_preference_only_copies_matching_source(monkeypatch):
+    monkeypatch.setattr(audio_policy, "AUDIO_REMUX_CODECS", "")
+    assert get_output_codec("aac", "m4a")[0] == "m4a"
+    assert get_output_codec("aac", "opus")[0] == "mp3"
+
+
+def test_mp3_policy_ignores_preference(monkeypatch):
+    monkeypatch.setattr(audio_policy, "AUDIO_OUTPUT_POLICY", "mp3")
+    assert get_output_codec("opus", "opus")[0] == "mp3"
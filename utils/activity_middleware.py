@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Set
+
+from aiogram import BaseMiddleware
+from aiogram.enums import ChatMemberStatus
+from aiogram.types import TelegramObject, Update
+
+from functions.db import db_touch_chats
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of chat_settings.last_active_at
+ACTIVITY_FLUSH_INTERVAL = 60
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Keeps chat_settings.last_active_at up to date.
+
+    Updates only note the chat in memory; run() writes the chats seen in
+    the last ``interval`` seconds in one statement, so a busy chat costs
+    one row update per interval instead of one per message.
+    """
+
+    def __init__(self, interval: int = ACTIVITY_FLUSH_INTERVAL):
+        self.interval = interval
+        self._seen: Set[int] = set()
+
+    async def __call__(self, handler: Callable, event: TelegramObject, data: Dict[str, Any]):
+        chat = data.get("event_chat")
+        if chat:
+            if self._removes_bot(event):
+                # Blocking or removing the bot is not activity, and must not
+                # reactivate the chat with the next flush
+                self._seen.discard(chat.id)
+            else:
+                self._seen.add(chat.id)
+        return await handler(event, data)
+
+    @staticmethod
+    def _removes_bot(event: TelegramObject) -> bool:
+        update = event.my_chat_member if isinstance(event, Update) else None
+        return update is not None and update.new_chat_member.status in (ChatMemberStatus.KICKED, ChatMemberStatus.LEFT)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._seen:
+            return
+        chat_ids, self._seen = list(self._seen), set()
+        try:
+            await db_touch_chats(chat_ids)
+        except Exception as e:
+            logger.error(f"Failed to record chat activity: {e}")
@@ -0,0 +1,90 @@
+import os
+from typing import List, Optional, Tuple
+
+from config.settings import (
+    AUDIO_MP3_PRESET,
+    AUDIO_MP3_QUALITY,
+    AUDIO_OUTPUT_POLICY,
+    AUDIO_REMUX_CODECS,
+)
+
+REMUX_CODECS = ("m4a", "opus")
+
+AUDIO_EXTENSIONS = (".m4a", ".opus", ".mp3")
+
+
+def _remux_codecs() -> List[str]:
+    return [codec.strip() for codec in AUDIO_REMUX_CODECS.split(",") if codec.strip() in REMUX_CODECS]
+
+
+def get_audio_format(fallback: str = "bestaudio") -> str:
+    """
+    Returns a yt-dlp format string that prefers sources which can be remuxed.
+
+    Args:
+        fallback (str): Format used when no remuxable source exists.
+
+    Returns:
+        str: yt-dlp format string.
+    """
+    if AUDIO_OUTPUT_POLICY != "copy":
+        return fallback
+
+    preferred = []
+    for codec in _remux_codecs():
+        if codec == "m4a":
+            preferred.append("bestaudio[acodec^=mp4a]")
+        elif codec == "opus":
+            preferred.append("bestaudio[acodec=opus]")
+    return "/".join(preferred + [fallback])
+
+
+def get_output_codec(source_codec: Optional[str], preferred_codec: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Decides how the downloaded audio stream is written.
+
+    With the "copy" policy AAC and Opus sources are only remuxed, and MP3
+    encoding is used for everything else. A source in the codec the chat
+    chose is remuxed even if AUDIO_REMUX_CODECS doesn't list it.
+
+    Args:
+        source_codec (str): Codec reported by ffprobe, such as "aac" or "opus".
+        preferred_codec (str): Codec the chat chose, "m4a" or "opus".
+
+    Returns:
+        Tuple[str, List[str]]: Output extension and ffmpeg audio codec arguments.
+    """
+    if source_codec == "mp3":
+        return "mp3", ["-c:a", "copy"]
+
+    if AUDIO_OUTPUT_POLICY == "copy":
+        codecs = _remux_codecs()
+        if preferred_codec in REMUX_CODECS:
+            codecs.append(preferred_codec)
+        if source_codec == "aac" and "m4a" in codecs:
+            return "m4a", ["-c:a", "copy", "-bsf:a", "aac_adtstoasc"]
+        if source_codec == "opus" and "opus" in codecs:
+            return "opus", ["-c:a", "copy"]
+
+    if AUDIO_MP3_QUALITY.isdigit() and int(AUDIO_MP3_QUALITY) < 10:
+        quality = ["-q:a", AUDIO_MP3_QUALITY]
+    else:
+        quality = ["-b:a", f"{AUDIO_MP3_QUALITY.rstrip('kK')}k"]
+    return "mp3", ["-c:a", "libmp3lame", *quality, "-compression_level", AUDIO_MP3_PRESET]
+
+
+def find_audio_file(base_path: str) -> Optional[str]:
+    """
+    Finds the audio file produced by the postprocessor.
+
+    Args:
+        base_path (str): Output path without extension.
+
+    Returns:
+        Optional[str]: Path to the audio file or None if it was not created.
+    """
+    for ext in AUDIO_EXTENSIONS:
+        path = f"{base_path}{ext}"
+        if os.path.exists(path):
+            return path
+    return None
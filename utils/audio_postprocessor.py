@@ -0,0 +1,78 @@
+import contextvars
+import logging
+import os
+from typing import Optional, Union
+
+from yt_dlp.postprocessor import FFmpegPostProcessor
+from yt_dlp.utils import prepend_extension, replace_extension
+
+from .audio_policy import get_output_codec
+from .metrics import track_phase
+from .update_metadata import update_metadata
+
+logger = logging.getLogger(__name__)
+
+
+class AudioTagPP(FFmpegPostProcessor):
+    """
+    Extracts the audio stream and writes tags and cover in one ffmpeg run.
+
+    Replaces the FFmpegExtractAudio + mutagen rewrite pair: the stream is
+    copied or encoded according to the audio policy, and title, artist and
+    the cover (as an attached picture) go into the same output file, so the
+    audio is written to disk only once. Ogg Opus can't carry an attached
+    picture, so its cover is added with mutagen afterwards.
+    """
+
+    def __init__(self, downloader=None, title: Optional[str] = None, artist: Optional[str] = None, cover: Optional[Union[str, os.PathLike]] = None, audio_codec: Optional[str] = None):
+        super().__init__(downloader)
+        self.title = title
+        self.artist = artist
+        self.cover = str(cover) if cover else None
+        self.audio_codec = audio_codec
+        # run() happens in a yt-dlp worker thread: keep the job's service and trace
+        self._context = contextvars.copy_context()
+
+    def run(self, info):
+        return self._context.run(self._run, info)
+
+    def _run(self, info):
+        path = info["filepath"]
+        source_codec = self.get_audio_codec(path)
+        ext, codec_args = get_output_codec(source_codec, self.audio_codec)
+
+        cover = self.cover if self.cover and os.path.exists(self.cover) else None
+        embed_cover = cover is not None and ext != "opus"
+
+        title = self.title or info.get("title")
+        artist = self.artist or info.get("artist") or info.get("uploader")
+
+        inputs = [path]
+        options = ["-map", "0:a:0", *codec_args]
+        if embed_cover:
+            inputs.append(cover)
+            options += ["-map", "1:0", "-c:v", "mjpeg", "-disposition:v:0", "attached_pic"]
+        if ext == "mp3":
+            options += ["-id3v2_version", "3"]
+        if title:
+            options += ["-metadata", f"title={title}"]
+        if artist:
+            options += ["-metadata", f"artist={artist}"]
+
+        new_path = replace_extension(path, ext, info.get("ext"))
+        temp_path = prepend_extension(new_path, "temp")
+
+        self.to_screen(f'Writing "{new_path}" ({source_codec} -> {ext})')
+        with track_phase("tag"):
+            self.run_ffmpeg_multiple_files(inputs, temp_path, options)
+        os.replace(temp_path, new_path)
+        if new_path != path:
+            os.remove(path)
+
+        if cover and not embed_cover:
+            with track_phase("tag"):
+                update_metadata(new_path, title=title or "", artist=artist or "", cover_file=cover)
+
+        info["filepath"] = new_path
+        info["ext"] = ext
+        return [], info
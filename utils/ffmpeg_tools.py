@@ -0,0 +1,63 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from utils.error_handler import BotError, ErrorCode
+from utils.metrics import track_phase
+
+
+async def _run(program: str, *args: str) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        program, *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise BotError(
+            code=ErrorCode.DOWNLOAD_FAILED,
+            message=f"{program} failed: {stderr.decode(errors='ignore')[-500:]}",
+            critical=True,
+            is_logged=True,
+        )
+    return stdout
+
+
+async def run_ffmpeg(*args: str) -> None:
+    with track_phase("transcode"):
+        await _run("ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args)
+
+
+async def run_ffprobe(path: str, *entries: str) -> Dict[str, Any]:
+    """
+    Runs ffprobe and returns its JSON output.
+
+    Args:
+        path (str): Media file.
+        entries (str): ``-show_entries`` sections, such as "format=duration".
+    """
+    with track_phase("probe"):
+        output = await _run(
+            "ffprobe", "-v", "error",
+            "-show_entries", ":".join(entries),
+            "-of", "json",
+            path,
+        )
+    try:
+        return json.loads(output or b"{}")
+    except ValueError:
+        return {}
+
+
+async def probe_duration(path: str) -> Optional[float]:
+    data = await run_ffprobe(path, "format=duration")
+    try:
+        return float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+from aiohttp import ClientResponse
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+FLUSH_SIZE = 1024 * 1024
+
+
+@dataclass
+class SinkResult:
+    path: str
+    size: int
+    digest: Optional[str] = None
+
+
+class FileSink:
+    """
+    Blocking file writer used by ``stream_to_file`` from a worker thread.
+
+    Buffers are passed to ``os.writev`` as they came from the socket, so a
+    batch is written without joining it into one bytes object first. The
+    file can be preallocated to the expected size and is truncated to the
+    real size on close, unless other writers fill the rest of the file.
+    """
+
+    def __init__(self, path: str, expected_size: Optional[int] = None, hash_name: Optional[str] = None, offset: int = 0, truncate: bool = True) -> None:
+        self.path = path
+        self.size = offset
+        self.truncate = truncate
+        self._hasher = hashlib.new(hash_name) if hash_name else None
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if offset == 0:
+            flags |= os.O_TRUNC
+        self._fd = os.open(path, flags, 0o644)
+        os.lseek(self._fd, offset, os.SEEK_SET)
+
+        if expected_size and expected_size > offset and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self._fd, offset, expected_size - offset)
+            except OSError:
+                # Not supported by every filesystem (tmpfs on old kernels, some FUSE mounts)
+                pass
+
+    def write(self, buffers: List[bytes]) -> None:
+        if self._hasher is not None:
+            for buffer in buffers:
+                self._hasher.update(buffer)
+
+        if hasattr(os, "writev"):
+            views = [memoryview(buffer) for buffer in buffers]
+            while views:
+                written = os.writev(self._fd, views)
+                self.size += written
+                # Drop what was written and retry the rest after a partial write
+                while views and written >= len(views[0]):
+                    written -= len(views[0])
+                    views.pop(0)
+                if views and written:
+                    views[0] = views[0][written:]
+        else:
+            for buffer in buffers:
+                view = memoryview(buffer)
+                while view:
+                    written = os.write(self._fd, view)
+                    self.size += written
+                    view = view[written:]
+
+    def close(self) -> SinkResult:
+        try:
+            if self.truncate:
+                # Drop the preallocated tail if the server sent less than announced
+                os.ftruncate(self._fd, self.size)
+        finally:
+            os.close(self._fd)
+        digest = self._hasher.hexdigest() if self._hasher is not None else None
+        return SinkResult(path=self.path, size=self.size, digest=digest)
+
+
+async def stream_to_file(
+    response: ClientResponse,
+    path: str,
+    hash_name: Optional[str] = None,
+    offset: int = 0,
+    truncate: bool = True,
+) -> SinkResult:
+    """
+    Streams the response body into a file.
+
+    The read size starts at 64 KB and doubles up to 1 MB while the socket
+    keeps filling whole chunks, so fast CDNs are read in large pieces and
+    slow ones don't stall on big reads. Chunks are collected and written in
+    1 MB batches from a worker thread, and are hashed during the same copy.
+
+    Args:
+        response (ClientResponse): Response whose body is written.
+        path (str): Destination file.
+        hash_name (str): hashlib algorithm, such as "sha256", to hash the body.
+        offset (int): Position to start writing at, used to resume a download.
+        truncate (bool): Cut the file at the last written byte. Disabled for
+            byte ranges written into a shared file.
+
+    Returns:
+        SinkResult: File path, final size and optional hex digest.
+    """
+    expected_size = offset + response.content_length if response.content_length else None
+    sink = await asyncio.to_thread(FileSink, path, expected_size, hash_name, offset, truncate)
+
+    try:
+        chunk_size = MIN_CHUNK_SIZE
+        buffers: List[bytes] = []
+        buffered = 0
+
+        while True:
+            chunk = await response.content.read(chunk_size)
+            if not chunk:
+                break
+
+            buffers.append(chunk)
+            buffered += len(chunk)
+            if len(chunk) == chunk_size:
+                chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+            elif chunk_size > MIN_CHUNK_SIZE and len(chunk) < chunk_size // 4:
+                chunk_size //= 2
+
+            if buffered >= FLUSH_SIZE:
+                await asyncio.to_thread(sink.write, buffers)
+                buffers = []
+                buffered = 0
+
+        if buffers:
+            await asyncio.to_thread(sink.write, buffers)
+    except BaseException:
+        await asyncio.to_thread(sink.close)
+        raise
+
+    return await asyncio.to_thread(sink.close)
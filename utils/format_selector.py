@@ -0,0 +1,167 @@
+import bisect
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import CACHE_LOOKUPS
+
+FormatFilter = Callable[[Dict[str, Any]], bool]
+FormatRank = Callable[[Dict[str, Any]], int]
+
+
+@dataclass(frozen=True)
+class FormatChoice:
+    format_id: str
+    size: int
+    height: int = 0
+
+
+def estimate_format_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """
+    Returns the format size in bytes.
+
+    Uses ``filesize``, then ``filesize_approx``, then ``tbr`` (kbit/s) x duration.
+    Returns None when none of them are known.
+    """
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+
+    tbr = fmt.get("tbr")
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def _has_codec(codec: Optional[str]) -> bool:
+    return bool(codec) and codec != "none"
+
+
+def prefer_h264(fmt: Dict[str, Any]) -> int:
+    """Ranks H.264 above other codecs of the same height, since it's remuxed without re-encoding."""
+    vcodec = fmt.get("vcodec") or ""
+    return 1 if vcodec.startswith(("avc1", "h264")) else 0
+
+
+class FormatSelector:
+    """
+    Picks the best yt-dlp format (or video+audio pair) that fits a size limit.
+
+    Audio formats are sorted by size once, and for every video format the best
+    audio that still fits the remaining budget is found with a binary search,
+    so the search is O((V + A) log A) instead of checking every pair.
+    Among formats of the same height, ``video_rank`` breaks ties before bitrate.
+    Decisions are memoized per media ID and size limit.
+    """
+
+    def __init__(self, video_filter: Optional[FormatFilter] = None, audio_filter: Optional[FormatFilter] = None, cache_size: int = 1024, video_rank: Optional[FormatRank] = None) -> None:
+        self.video_filter = video_filter or (lambda f: True)
+        self.audio_filter = audio_filter or (lambda f: True)
+        self.video_rank = video_rank or (lambda f: 0)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int], Optional[FormatChoice]]" = OrderedDict()
+
+    @staticmethod
+    def media_key(extractor: Optional[str], media_id: Optional[str]) -> Optional[str]:
+        if media_id is None:
+            return None
+        return f"{extractor}:{media_id}"
+
+    def lookup(self, media_id: Optional[str], max_size: int) -> Tuple[bool, Optional[FormatChoice]]:
+        """
+        Returns a memoized decision.
+
+        Returns:
+            Tuple[bool, Optional[FormatChoice]]: (False, None) when nothing is
+            memoized, otherwise (True, choice) where choice may be None if
+            nothing fitted the limit.
+        """
+        key = (media_id, max_size)
+        if media_id is None or key not in self._cache:
+            CACHE_LOOKUPS.inc(cache="format", result="miss")
+            return False, None
+
+        CACHE_LOOKUPS.inc(cache="format", result="hit")
+        self._cache.move_to_end(key)
+        return True, self._cache[key]
+
+    def select(self, info_dict: Dict[str, Any], max_size: int) -> Optional[FormatChoice]:
+        """
+        Selects the best format for the info dict and memoizes the result.
+
+        Args:
+            info_dict (dict): Info dict from ``extract_info(download=False)``.
+            max_size (int): Size limit in bytes.
+
+        Returns:
+            Optional[FormatChoice]: Chosen format, or None if nothing fits.
+        """
+        media_id = self.media_key(info_dict.get("extractor_key"), info_dict.get("id"))
+        found, choice = self.lookup(media_id, max_size)
+        if found:
+            return choice
+
+        choice = self._select(info_dict.get("formats") or [], info_dict.get("duration"), max_size)
+
+        if media_id is not None:
+            self._cache[(media_id, max_size)] = choice
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return choice
+
+    def _select(self, formats: List[Dict[str, Any]], duration: Optional[float], max_size: int) -> Optional[FormatChoice]:
+        videos = []
+        audios = []
+        best: Optional[FormatChoice] = None
+        best_score = (-1, -1, -1, -1)
+
+        for f in formats:
+            size = estimate_format_size(f, duration)
+            if size is None:
+                continue
+
+            has_video = _has_codec(f.get("vcodec"))
+            has_audio = _has_codec(f.get("acodec"))
+            height = f.get("height") or 0
+
+            if has_video and has_audio:
+                # Muxed formats need no pair
+                if size <= max_size and self.video_filter(f) and self.audio_filter(f):
+                    score = (height, self.video_rank(f), f.get("abr") or 0, f.get("tbr") or 0)
+                    if score > best_score:
+                        best_score = score
+                        best = FormatChoice(f["format_id"], size, height)
+            elif has_video:
+                if size <= max_size and self.video_filter(f):
+                    videos.append((size, height, self.video_rank(f), f.get("tbr") or 0, f["format_id"]))
+            elif has_audio:
+                if size <= max_size and self.audio_filter(f):
+                    audios.append((size, f.get("abr") or 0, f["format_id"]))
+
+        if videos and audios:
+            audios.sort()
+            audio_sizes = [a[0] for a in audios]
+
+            # best_upto[i] is the index of the highest-bitrate audio among audios[:i + 1]
+            best_upto = []
+            for i, audio in enumerate(audios):
+                if not best_upto or audio[1] > audios[best_upto[-1]][1]:
+                    best_upto.append(i)
+                else:
+                    best_upto.append(best_upto[-1])
+
+            for v_size, height, rank, tbr, v_id in videos:
+                i = bisect.bisect_right(audio_sizes, max_size - v_size) - 1
+                if i < 0:
+                    continue
+                a_size, abr, a_id = audios[best_upto[i]]
+                score = (height, rank, abr, tbr)
+                if score > best_score:
+                    best_score = score
+                    best = FormatChoice(f"{v_id}+{a_id}", v_size + a_size, height)
+
+        return best
+
+
+# Shared selector for services without codec requirements
+default_format_selector = FormatSelector(video_rank=prefer_h264)
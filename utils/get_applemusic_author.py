@@ -1,14 +1,39 @@
 import logging
 import re
+from typing import Optional, Tuple
 
 import aiohttp
-from bs4 import BeautifulSoup
 
 from config.secrets import APPLEMUSIC_DEV_TOKEN
+from config.settings import COVER_TAG_SIZE
+from utils.html_parsing import element_text, find_element, iter_tags, run_parser
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_song_page(html_content: str) -> Tuple[str, Optional[str]]:
+    """Page title and the largest WebP cover of a song page, read from the markup without a DOM."""
+    title_element = find_element(html_content, "title")
+    title = element_text(html_content, title_element).strip() if title_element else ""
+
+    best_image_url = None
+    picture = find_element(html_content, "picture")
+    if picture:
+        _, start, end = picture
+        for attributes, _ in iter_tags(html_content, "source", start, end):
+            if attributes.get("type") != "image/webp":
+                continue
+            srcset = " ".join(attributes.get("srcset", "").split()).strip()
+            matches = re.findall(r"(\S+)\s+(\d+)w", srcset)
+            if matches:
+                images = [(image_url.lstrip(", "), int(size)) for image_url, size in matches]
+                images.sort(key=lambda x: x[1], reverse=True) # Сортируем по размеру, чтобы получить наибольшее
+                best_image_url = images[0][0]
+            break
+
+    return title, best_image_url
+
+
 async def get_applemusic_author(url: str):
     """Gets artist name, track title and track cover from Apple Music.
 
@@ -64,7 +89,7 @@ async def get_applemusic_author(url: str):
                                     cover_url = track_info['attributes'].get('artwork', {}).get('url')
 
                                     if cover_url:
-                                        cover_url = cover_url.replace('{w}x{h}', '800x800')
+                                        cover_url = cover_url.replace('{w}x{h}', f'{COVER_TAG_SIZE}x{COVER_TAG_SIZE}')
                                         if '{f}' in cover_url:
                                             cover_url = cover_url.replace('{f}', '.jpg')
 
@@ -100,11 +125,7 @@ async def get_applemusic_author(url: str):
                     return None, None, None
 
                 html_content = await response.text(encoding="utf-8")
-                soup = BeautifulSoup(html_content, "html.parser")
-
-                # Извлечение заголовка (title)
-                title_tag = soup.find("title")
-                title = title_tag.text.strip() if title_tag else ""
+                title, best_image_url = await run_parser(_parse_song_page, html_content)
 
                 # Парсинг заголовка для получения названия трека и исполнителя
                 parts = re.split(r" - | – ", title, maxsplit=2)
@@ -119,23 +140,6 @@ async def get_applemusic_author(url: str):
                     )
                     return None, None, None
 
-                # Извлечение URL обложки
-                picture_tag = soup.find("picture")
-                best_image_url = None
-
-                if picture_tag:
-                    source_tag = picture_tag.find("source", {"type": "image/webp"})
-                    if source_tag and "srcset" in source_tag.attrs:
-                        srcset = " ".join(source_tag["srcset"].split()).strip()
-                        matches = re.findall(r"(\S+)\s+(\d+)w", srcset)
-
-                        if matches:
-                            images = [
-                                (url.lstrip(", "), int(size)) for url, size in matches
-                            ]
-                            images.sort(key=lambda x: x[1], reverse=True) # Сортируем по размеру, чтобы получить наибольшее
-                            best_image_url = images[0][0]
-
                 logger.info("Successfully parsed data from HTML.")
                 return artist_name, track_title, best_image_url
 
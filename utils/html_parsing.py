@@ -0,0 +1,76 @@
+import asyncio
+import html
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from utils.metrics import track_phase
+
+# Parses get their own threads, so they never wait behind downloads
+_parse_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="parse")
+
+_ATTRIBUTE = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?""")
+
+Attributes = Dict[str, str]
+
+
+async def run_parser(func: Callable[..., Any], *args: Any) -> Any:
+    """Runs ``func(*args)`` in the parse pool, recorded as the "parse" phase of the job."""
+    loop = asyncio.get_running_loop()
+    with track_phase("parse"):
+        return await loop.run_in_executor(_parse_executor, partial(func, *args))
+
+
+@lru_cache(maxsize=None)
+def _open_tag(name: str) -> re.Pattern:
+    # Attribute values may contain ">" inside quotes
+    return re.compile(rf"""<{re.escape(name)}(?=[\s/>])((?:[^>"']|"[^"]*"|'[^']*')*)>""", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _close_tag(name: str) -> re.Pattern:
+    return re.compile(rf"</{re.escape(name)}\s*>", re.IGNORECASE)
+
+
+def parse_attributes(source: str) -> Attributes:
+    """Attributes of an opening tag (the part after the tag name), names lowercased and values unescaped."""
+    attributes = {}
+    for match in _ATTRIBUTE.finditer(source):
+        name, double, single, bare = match.groups()
+        value = next((item for item in (double, single, bare) if item is not None), "")
+        attributes.setdefault(name.lower(), html.unescape(value))
+    return attributes
+
+
+def iter_tags(markup: str, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[Attributes, int]]:
+    """Yields the attributes and end offset of every opening ``<name>`` tag in ``markup[start:end]``."""
+    for match in _open_tag(name).finditer(markup, start, len(markup) if end is None else end):
+        yield parse_attributes(match.group(1)), match.end()
+
+
+def find_tag(markup: str, name: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[Attributes, int]]:
+    """The first opening ``<name>`` tag in ``markup[start:end]``, see iter_tags."""
+    return next(iter_tags(markup, name, start, end), None)
+
+
+def iter_elements(markup: str, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[Attributes, int, int]]:
+    """
+    Yields the attributes and the content span of every ``<name>...</name>``
+    element in ``markup[start:end]``. Only for elements that don't nest.
+    """
+    end = len(markup) if end is None else end
+    for attributes, content_start in iter_tags(markup, name, start, end):
+        close = _close_tag(name).search(markup, content_start, end)
+        yield attributes, content_start, close.start() if close else end
+
+
+def find_element(markup: str, name: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[Attributes, int, int]]:
+    """The first ``<name>...</name>`` element in ``markup[start:end]``, see iter_elements."""
+    return next(iter_elements(markup, name, start, end), None)
+
+
+def element_text(markup: str, span: Tuple[Attributes, int, int]) -> str:
+    """Unescaped text of an element found by find_element, with inner tags removed."""
+    _, start, end = span
+    return html.unescape(re.sub(r"<[^>]*>", "", markup[start:end]))
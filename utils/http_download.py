@@ -0,0 +1,432 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from config.settings import (
+    DOWNLOAD_BACKOFF_BASE,
+    DOWNLOAD_BACKOFF_MAX,
+    DOWNLOAD_RETRIES,
+    HOST_RETRY_BUDGET,
+    SEGMENTED_HOSTS,
+    SEGMENTED_MIN_SIZE_MB,
+    SEGMENTED_PARTS,
+)
+from managers.admission_manager import DEFAULT_VIDEO_ESTIMATE, disk_admission
+from managers.workspace_manager import workspace_manager
+from utils.error_handler import BotError, ErrorCode
+from utils.file_sink import SinkResult, stream_to_file
+from utils.metrics import HTTP_BYTES, HTTP_REQUESTS, HTTP_SECONDS
+from utils.tracing import add_span
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class _RangeNotSupported(Exception):
+    pass
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"response status {status}")
+        self.status = status
+
+
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, _RetryableStatus)
+
+
+def _parse_hosts(value: str) -> Dict[str, int]:
+    hosts = {}
+    for item in value.split(","):
+        host, _, parts = item.strip().partition("=")
+        if host:
+            hosts[host.lower()] = int(parts) if parts.isdigit() else SEGMENTED_PARTS
+    return hosts
+
+
+SEGMENTED_HOST_PARTS = _parse_hosts(SEGMENTED_HOSTS)
+
+
+def segment_count(url: str, response: aiohttp.ClientResponse) -> int:
+    """
+    Returns how many byte ranges the response body should be fetched in.
+
+    Only hosts listed in SEGMENTED_HOSTS are split, and only when the server
+    advertises ``Accept-Ranges: bytes`` and the file is at least
+    SEGMENTED_MIN_SIZE_MB. Returns 1 for a single sequential stream.
+    """
+    size = response.content_length
+    if not size or size < SEGMENTED_MIN_SIZE_MB * 1024 * 1024:
+        return 1
+    if response.headers.get("Accept-Ranges", "").lower() != "bytes":
+        return 1
+
+    host = (urlparse(url).hostname or "").lower()
+    for pattern, parts in SEGMENTED_HOST_PARTS.items():
+        if host == pattern or host.endswith(f".{pattern}"):
+            return max(parts, 1)
+    return 1
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry number (from 1)."""
+    return random.uniform(0, min(DOWNLOAD_BACKOFF_MAX, DOWNLOAD_BACKOFF_BASE * 2 ** attempt))
+
+
+class RetryBudget:
+    """
+    Token bucket of retries per host.
+
+    Every host may be retried ``per_minute`` times a minute. When a CDN is
+    down the budget runs out and downloads fail fast instead of every job
+    backing off against the same host.
+    """
+
+    def __init__(self, per_minute: int = HOST_RETRY_BUDGET) -> None:
+        self.capacity = per_minute
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, host: str) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(host, (float(self.capacity), now))
+        tokens = min(float(self.capacity), tokens + (now - updated) * self.capacity / 60)
+        if tokens < 1:
+            self._buckets[host] = (tokens, now)
+            return False
+
+        self._buckets[host] = (tokens - 1, now)
+        return True
+
+
+retry_budget = RetryBudget()
+
+
+class PartFile:
+    """
+    A ``.part`` file with a JSON sidecar that makes a download resumable.
+
+    The sidecar keeps the URL and the ETag/Last-Modified of the response and
+    is marked as "writing" while data is streamed. A part without a
+    validator, or one left "writing" by a crash (its preallocated tail can't
+    be told apart from real data), is downloaded again from zero.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.meta_path = f"{path}.json"
+
+    def checkpoint(self, url: str) -> Tuple[int, Optional[str]]:
+        """Returns the offset to resume from and the validator for If-Range."""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            size = os.path.getsize(self.path)
+        except (OSError, ValueError):
+            return 0, None
+
+        if meta.get("url") != url or meta.get("writing") or not meta.get("validator"):
+            return 0, None
+        return size, meta["validator"]
+
+    def save(self, url: str, validator: str, writing: bool) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "validator": validator, "writing": writing}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def commit(self, filename: str) -> None:
+        os.replace(self.path, filename)
+        self.discard_meta()
+
+    def discard_meta(self) -> None:
+        _remove(self.meta_path)
+
+    def discard(self) -> None:
+        _remove(self.path)
+        _remove(self.meta_path)
+
+
+# Keys of parts that a running download is writing to
+_active_parts: Set[str] = set()
+
+
+async def _claim_part(url: str, filename: str) -> Tuple[PartFile, Optional[str]]:
+    # Parts are keyed by URL and live outside job workspaces, so a job that
+    # was cancelled leaves its progress for the next request of the same URL
+    key = hashlib.sha256(url.encode()).hexdigest()[:32]
+    if key in _active_parts:
+        return PartFile(f"{filename}.part"), None
+
+    _active_parts.add(key)
+    partial_dir = workspace_manager.partial_dir
+    await asyncio.to_thread(partial_dir.mkdir, parents=True, exist_ok=True)
+    return PartFile(str(partial_dir / f"{key}.part")), key
+
+
+class _Download:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        filename: str,
+        part: PartFile,
+        headers: Optional[Dict[str, str]],
+        max_size: int,
+        estimate: int,
+    ) -> None:
+        self.session = session
+        self.url = url
+        self.host = urlparse(url).hostname or ""
+        self.owner = os.path.dirname(filename)
+        self.part = part
+        self.headers = headers or {}
+        self.max_size = max_size
+        self.estimate = estimate
+        self.reserved = False
+
+    def _check_status(self, response: aiohttp.ClientResponse) -> None:
+        if response.status in RETRY_STATUSES:
+            raise _RetryableStatus(response.status)
+
+        raise BotError(
+            code=ErrorCode.DOWNLOAD_FAILED,
+            message=f"Failed to download {self.url}: response status {response.status}",
+            url=self.url,
+            critical=False,
+            is_logged=True,
+        )
+
+    async def _admit(self, total: Optional[int]) -> None:
+        if self.max_size and total and total > self.max_size:
+            raise BotError(
+                code=ErrorCode.SIZE_CHECK_FAIL,
+                message=f"File size {total} exceeds {self.max_size}: {self.url}",
+                url=self.url,
+                critical=False,
+            )
+
+        if not self.reserved:
+            await disk_admission.reserve(self.owner, total or self.estimate)
+            self.reserved = True
+
+    async def attempt(self) -> SinkResult:
+        offset, validator = await asyncio.to_thread(self.part.checkpoint, self.url)
+        headers = dict(self.headers)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        async with self.session.get(self.url, headers=headers) as response:
+            if response.status == 200:
+                offset = 0
+            elif response.status == 206 and offset:
+                logger.info(f"Resuming download from {self.host} at {offset} bytes")
+            elif response.status == 416 and offset:
+                await asyncio.to_thread(self.part.discard)
+                raise _RetryableStatus(response.status)
+            else:
+                self._check_status(response)
+
+            total = offset + response.content_length if response.content_length is not None else None
+            await self._admit(total)
+
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            parts = segment_count(self.url, response) if offset == 0 else 1
+            if parts <= 1:
+                return await self._stream(response, offset, validator, total)
+
+        # Ranges are written out of order, so the part can't be resumed by its size
+        await asyncio.to_thread(self.part.discard_meta)
+        try:
+            return await _download_segments(self.session, self.url, self.part.path, total, parts, self.headers, validator)
+        except _RangeNotSupported:
+            logger.info(f"Ranges are not honoured by {self.host}, downloading as one stream")
+
+        async with self.session.get(self.url, headers=self.headers) as response:
+            if response.status != 200:
+                self._check_status(response)
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            return await self._stream(response, 0, validator, response.content_length)
+
+    async def _stream(
+        self,
+        response: aiohttp.ClientResponse,
+        offset: int,
+        validator: Optional[str],
+        total: Optional[int],
+    ) -> SinkResult:
+        if validator:
+            await asyncio.to_thread(self.part.save, self.url, validator, True)
+        else:
+            await asyncio.to_thread(self.part.discard_meta)
+
+        try:
+            result = await stream_to_file(response, self.part.path, offset=offset)
+        finally:
+            if validator:
+                await asyncio.to_thread(self.part.save, self.url, validator, False)
+
+        if total is not None and result.size != total:
+            raise aiohttp.ClientPayloadError(f"Got {result.size} of {total} bytes")
+        return result
+
+
+async def download_file(
+    url: str,
+    filename: str,
+    session: Optional[aiohttp.ClientSession] = None,
+    headers: Optional[Dict[str, str]] = None,
+    max_size: int = 0,
+    estimate: int = DEFAULT_VIDEO_ESTIMATE,
+    retries: int = DOWNLOAD_RETRIES,
+) -> SinkResult:
+    """
+    Downloads a direct media URL into a file.
+
+    The size from ``Content-Length`` is checked against ``max_size`` and
+    reserved in the disk admission controller before anything is written.
+    Large files from CDNs that support ranges are fetched as several
+    concurrent byte ranges, everything else as a single stream.
+
+    Data goes to a ``.part`` file first. Network errors and 429/5xx answers
+    are retried with exponential backoff and jitter while the host's retry
+    budget lasts, and every retry continues from the bytes already on disk
+    if the server still returns the same ETag/Last-Modified.
+
+    Args:
+        url (str): Media URL.
+        filename (str): Destination file inside the job workspace.
+        session (ClientSession): Session to reuse. A new one is opened if omitted.
+        headers (dict): Extra request headers, such as Referer.
+        max_size (int): Size limit in bytes, 0 disables the check.
+        estimate (int): Bytes to reserve when the size is unknown.
+        retries (int): How many times a failed attempt is retried.
+
+    Returns:
+        SinkResult: Path and size of the downloaded file.
+
+    Raises:
+        BotError: If the download fails or the file is larger than ``max_size``.
+    """
+    own_session = session is None
+    if session is None:
+        session = aiohttp.ClientSession()
+
+    part, key = await _claim_part(url, filename)
+    download = _Download(session, url, filename, part, headers, max_size, estimate)
+    started = time.perf_counter()
+    started_at = time.time()
+    outcome = "error"
+    size = 0
+    try:
+        attempt = 0
+        while True:
+            try:
+                result = await download.attempt()
+                break
+            except BotError:
+                await asyncio.to_thread(part.discard)
+                raise
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > retries or not retry_budget.acquire(download.host):
+                    raise BotError(
+                        code=ErrorCode.DOWNLOAD_FAILED,
+                        message=f"Failed to download {url} after {attempt} attempts: {e}",
+                        url=url,
+                        critical=False,
+                        is_logged=True,
+                    )
+
+                delay = backoff_delay(attempt)
+                logger.warning(f"Download from {download.host} failed ({e}), retry {attempt}/{retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        await asyncio.to_thread(part.commit, filename)
+        HTTP_BYTES.inc(result.size, host=download.host)
+        size = result.size
+        outcome = "ok"
+        return SinkResult(path=filename, size=result.size, digest=result.digest)
+    finally:
+        elapsed = time.perf_counter() - started
+        HTTP_REQUESTS.inc(host=download.host, result=outcome)
+        HTTP_SECONDS.observe(elapsed, host=download.host)
+        add_span("http", started_at, elapsed, error=outcome != "ok", host=download.host, bytes=size)
+        if key is not None:
+            _active_parts.discard(key)
+        if own_session:
+            await session.close()
+
+
+async def _download_segments(
+    session: aiohttp.ClientSession,
+    url: str,
+    filename: str,
+    size: int,
+    parts: int,
+    headers: Optional[Dict[str, str]],
+    validator: Optional[str],
+) -> SinkResult:
+    await asyncio.to_thread(_preallocate, filename, size)
+
+    step = -(-size // parts)
+    tasks = [
+        asyncio.create_task(_download_range(session, url, filename, start, min(start + step, size) - 1, headers, validator))
+        for start in range(0, size, step)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    logger.info(f"Downloaded {size} bytes in {len(tasks)} ranges from {urlparse(url).hostname}")
+    return SinkResult(path=filename, size=size)
+
+
+async def _download_range(
+    session: aiohttp.ClientSession,
+    url: str,
+    filename: str,
+    start: int,
+    end: int,
+    headers: Optional[Dict[str, str]],
+    validator: Optional[str],
+) -> None:
+    range_headers = {**(headers or {}), "Range": f"bytes={start}-{end}"}
+    if validator:
+        # The server answers 200 instead of 206 if the file changed meanwhile
+        range_headers["If-Range"] = validator
+
+    async with session.get(url, headers=range_headers) as response:
+        if response.status in RETRY_STATUSES:
+            raise _RetryableStatus(response.status)
+        if response.status != 206:
+            raise _RangeNotSupported()
+
+        result = await stream_to_file(response, filename, offset=start, truncate=False)
+        if result.size != end + 1:
+            raise aiohttp.ClientPayloadError(f"Range {start}-{end} ended at {result.size}")
+
+
+def _preallocate(filename: str, size: int) -> None:
+    with open(filename, "wb") as f:
+        f.truncate(size)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
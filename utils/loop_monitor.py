@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from config.settings import BLOCKING_THRESHOLD_MS, LOOP_LAG_INTERVAL
+from utils.metrics import LOOP_LAG, LOOP_STALL_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Watches the health of the event loop.
+
+    The lag sampler sleeps for ``interval`` and records how much later than
+    asked the loop woke it up. With a ``threshold`` a watchdog thread also
+    pings the loop and, if the ping isn't answered in time, logs the stack
+    of the loop thread: the code that holds the loop.
+    """
+
+    def __init__(self, interval: float, threshold: float = 0.0) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._stopped = threading.Event()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if self.threshold:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+        try:
+            while True:
+                expected = self._loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                LOOP_LAG.observe(max(0.0, self._loop.time() - expected))
+        finally:
+            self._stopped.set()
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                # The loop is closed
+                return
+
+            if not answered.wait(self.threshold):
+                # Taken while the loop is still blocked, so it shows the culprit
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+                while not answered.wait(1) and not self._stopped.is_set():
+                    pass
+                held = time.monotonic() - sent
+                LOOP_STALLS.inc()
+                LOOP_STALL_SECONDS.inc(held)
+                logger.warning(f"Event loop was blocked for {held:.3f}s, stack while blocked:\n{stack}")
+
+            self._stopped.wait(self.threshold)
+
+
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL, BLOCKING_THRESHOLD_MS / 1000)
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Service of the job running in the current task, for phases deep in shared helpers
+current_service: ContextVar[str] = ContextVar("current_service", default="unknown")
+
+# Seconds: from a cache hit to a long transcode
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Observations also come from yt-dlp worker threads
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from a callback when /metrics is scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        """``callback`` returns the current values keyed by label values, ``()`` for an unlabeled gauge."""
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._callback:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} callback failed: {e}")
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+# Jobs and errors
+JOBS = Counter("charlotte_jobs_total", "Finished download jobs by service and result (ok or error code).", ["service", "result"])
+JOB_SECONDS = Histogram("charlotte_job_seconds", "Duration of whole download jobs.", ["service"])
+PHASE_SECONDS = Histogram(
+    "charlotte_phase_seconds",
+    "Duration of job phases: resolve, extract, parse, download, search, probe, transcode, tag, upload.",
+    ["service", "phase"],
+)
+UPLOAD_BYTES = Counter("charlotte_upload_bytes_total", "Bytes of media sent to Telegram.", ["service"])
+
+# Outgoing HTTP
+HTTP_REQUESTS = Counter("charlotte_http_requests_total", "Direct HTTP downloads by host and result (ok or error).", ["host", "result"])
+HTTP_SECONDS = Histogram("charlotte_http_request_seconds", "Duration of direct HTTP downloads.", ["host"])
+HTTP_BYTES = Counter("charlotte_http_bytes_total", "Bytes received by direct HTTP downloads.", ["host"])
+
+# Caches
+CACHE_LOOKUPS = Counter("charlotte_cache_lookups_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+
+# Queues and executors, read when scraped
+ACTIVE_TASKS = Gauge("charlotte_active_tasks", "Download tasks running or waiting per user.")
+DISK_WAITING = Gauge("charlotte_disk_admission_waiting", "Jobs waiting for temp-dir space.")
+DISK_RESERVED = Gauge("charlotte_disk_admission_reserved_bytes", "Temp-dir bytes reserved by running jobs.")
+WORKSPACES = Gauge("charlotte_workspaces_active", "Job workspaces currently open.")
+EXECUTOR_THREADS = Gauge("charlotte_executor_threads", "Worker threads started per service executor.", ["service"])
+EXECUTOR_QUEUE = Gauge("charlotte_executor_queue", "Work items waiting for a thread per service executor.", ["service"])
+EXECUTOR_MAX = Gauge("charlotte_executor_max_workers", "Thread limit per service executor.", ["service"])
+
+# Event loop health, see utils.loop_monitor
+LOOP_LAG = Histogram(
+    "charlotte_event_loop_lag_seconds",
+    "How late the event loop ran a timer, sampled every LOOP_LAG_INTERVAL.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_STALLS = Counter("charlotte_event_loop_stalls_total", "Times a callback held the event loop longer than BLOCKING_THRESHOLD_MS.")
+LOOP_STALL_SECONDS = Counter("charlotte_event_loop_stall_seconds_total", "Time the event loop was held by stalled callbacks.")
+
+
+@contextmanager
+def track_phase(phase: str, service: Optional[str] = None, **attributes: Any) -> Iterator[None]:
+    """
+    Records how long the block took as ``phase`` of a job, by default of the
+    current service, both in the phase histogram and as a span of the job trace.
+    """
+    with PHASE_SECONDS.time(service=service or current_service.get(), phase=phase), span(phase, **attributes):
+        yield
+
+
+async def _metrics_view(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serves the registry on http://host:port/metrics."""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_view)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics are served on http://{host}:{port}/metrics")
+    return runner
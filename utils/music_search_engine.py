@@ -5,6 +5,8 @@ from concurrent.futures import ThreadPoolExecutor
 
 from ytmusicapi import YTMusic
 
+from utils.metrics import track_phase
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,15 +14,16 @@ _search_executor = ThreadPoolExecutor(max_workers=5)
 
 async def search_music(artist: str, title: str) -> Optional[str]:
     try:
-        yt = await asyncio.get_event_loop().run_in_executor(
-            _search_executor,
-            YTMusic
-        )
-
-        search_results = await asyncio.get_event_loop().run_in_executor(
-            _search_executor,
-            lambda: yt.search(f"{artist} - {title}", limit=10, filter="songs")
-        )
+        with track_phase("search"):
+            yt = await asyncio.get_event_loop().run_in_executor(
+                _search_executor,
+                YTMusic
+            )
+
+            search_results = await asyncio.get_event_loop().run_in_executor(
+                _search_executor,
+                lambda: yt.search(f"{artist} - {title}", limit=10, filter="songs")
+            )
 
         for track in search_results:
             if not track.get('duration'):
@@ -1,5 +1,6 @@
 import os
 import random
+import time
 
 emojis = {
 "👍", "❤", "🔥", "🥰", "👏", "😁", "🤔", "🤯", "😱", "🎉", "🤩", "🙏", "👌", "🕊", "😍", "🐳", "❤‍🔥", "🌭", "💯", "🤣", "⚡", "🍌", "🏆", "🍾", "💋", "👻", "👨‍💻", "👀", "🎃", "😇", "😨", "🤝", "✍", "🤗", "🫡", "🎅", "🎄", "☃", "💅", "🤪", "🆒", "💘", "🦄", "😘",  "😎", "👾"
@@ -10,6 +11,16 @@ def random_emoji():
     return random.choice(list(emojis))
 
 
+# The cookies directory is listed at most once per COOKIE_LIST_TTL seconds:
+# option builders call random_cookie_file on the event loop for every job
+COOKIE_LIST_TTL = 60
+_cookie_files = []
+_cookie_files_listed = 0.0
+
+
 def random_cookie_file():
-    cookie_files = os.listdir("cookies")
-    return f"cookies/{random.choice(cookie_files)}" if cookie_files else None
+    global _cookie_files, _cookie_files_listed
+    if time.monotonic() - _cookie_files_listed > COOKIE_LIST_TTL:
+        _cookie_files = os.listdir("cookies")
+        _cookie_files_listed = time.monotonic()
+    return f"cookies/{random.choice(_cookie_files)}" if _cookie_files else None
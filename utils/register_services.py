@@ -4,6 +4,7 @@ import logging
 import os
 
 from services import base_service
+from utils.metrics import EXECUTOR_MAX, EXECUTOR_QUEUE, EXECUTOR_THREADS
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,18 @@ def register_service(name, handler):
         logger.info(f"{name} registered")
 
 
+def _executors():
+    for name, handler in SERVICES.items():
+        executor = getattr(handler, "_download_executor", None)
+        if executor is not None:
+            yield getattr(handler, "name", name), executor
+
+
+EXECUTOR_THREADS.set_function(lambda: {(name,): len(executor._threads) for name, executor in _executors()})
+EXECUTOR_QUEUE.set_function(lambda: {(name,): executor._work_queue.qsize() for name, executor in _executors()})
+EXECUTOR_MAX.set_function(lambda: {(name,): executor._max_workers for name, executor in _executors()})
+
+
 def get_service_handler(url):
     for name, handler in SERVICES.items():
         if handler.is_supported(url):
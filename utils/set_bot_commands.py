@@ -27,6 +27,7 @@ async def set_default_commands():
             types.BotCommand(command="start", description="🌸 Start work with me"),
             types.BotCommand(command="help", description="🐾 My commands"),
             types.BotCommand(command="settings", description="🎀 Settings"),
+            types.BotCommand(command="format", description="🎬 YouTube download preferences"),
             types.BotCommand(command="cancel", description="🔮 Cancel task"),
             types.BotCommand(command="support", description="💖 Support Charlotte"),
         ]
@@ -0,0 +1,122 @@
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from config.settings import LOCAL_SERVER, MAX_FILE_SIZE_MB, SERVICE_SIZE_LIMITS_MB
+from utils.error_handler import BotError, ErrorCode
+from utils.format_selector import FormatChoice, estimate_format_size
+
+logger = logging.getLogger(__name__)
+
+# Bot API upload limits: 2000 MB through a local server, 50 MB through api.telegram.org
+UPLOAD_LIMIT_MB = 2000 if LOCAL_SERVER else 50
+
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    limits = {}
+    for item in value.split(","):
+        service, _, limit = item.strip().partition("=")
+        if service and limit.strip().isdigit():
+            limits[service.strip().lower()] = int(limit)
+    return limits
+
+
+SERVICE_LIMITS = _parse_limits(SERVICE_SIZE_LIMITS_MB)
+
+
+def size_limit(service: Optional[str] = None) -> int:
+    """
+    Returns the size limit in bytes for media of a service.
+
+    The limit is the Bot API upload limit, lowered by MAX_FILE_SIZE_MB and
+    by the service's entry in SERVICE_SIZE_LIMITS_MB. It never exceeds what
+    Telegram accepts.
+    """
+    limit_mb = UPLOAD_LIMIT_MB
+    if MAX_FILE_SIZE_MB:
+        limit_mb = min(limit_mb, MAX_FILE_SIZE_MB)
+    if service:
+        limit_mb = min(limit_mb, SERVICE_LIMITS.get(service.lower(), limit_mb))
+    return limit_mb * 1024 * 1024
+
+
+def size_filter(max_size: Optional[int] = None) -> str:
+    """Size limit for yt-dlp format filters, such as "50M"."""
+    return f"{(max_size or size_limit()) // (1024 * 1024)}M"
+
+
+def ensure_size(size: Optional[int], limit: int, url: Optional[str] = None) -> None:
+    """
+    Raises:
+        BotError: If the known size is over the limit.
+    """
+    if size and size > limit:
+        raise BotError(
+            code=ErrorCode.SIZE_CHECK_FAIL,
+            message=f"Media size {size} exceeds the limit of {limit} bytes",
+            url=url,
+            critical=False,
+        )
+
+
+async def probe_size(url: str, session: Optional[aiohttp.ClientSession] = None, headers: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """
+    Returns the file size reported by a HEAD request, or None if it's unknown.
+
+    Probing is best effort: servers that reject HEAD or omit Content-Length
+    are left to the size check of the download itself.
+    """
+    own_session = session is None
+    if session is None:
+        session = aiohttp.ClientSession()
+
+    try:
+        async with session.head(url, headers=headers, allow_redirects=True, timeout=PROBE_TIMEOUT) as response:
+            if response.status == 200:
+                return response.content_length
+    except Exception as e:
+        logger.debug(f"HEAD probe of {url} failed: {e}")
+    finally:
+        if own_session:
+            await session.close()
+    return None
+
+
+async def check_url_size(url: str, limit: int, session: Optional[aiohttp.ClientSession] = None, headers: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """
+    Probes the URL with HEAD and rejects it before anything is downloaded.
+
+    Returns:
+        Optional[int]: Probed size in bytes, or None if it's unknown.
+
+    Raises:
+        BotError: If the file is larger than ``limit``.
+    """
+    size = await probe_size(url, session=session, headers=headers)
+    ensure_size(size, limit, url)
+    return size
+
+
+def check_info_size(info_dict: Dict[str, Any], choice: Optional[FormatChoice], limit: int, url: Optional[str] = None) -> None:
+    """
+    Rejects yt-dlp media when no format can fit the limit.
+
+    ``choice`` is the format picked by the format selector. When it is None
+    and the smallest format with a known size is still over the limit, the
+    download is doomed and is stopped before it starts. Media without any
+    known sizes is let through.
+
+    Raises:
+        BotError: If every known format is larger than ``limit``.
+    """
+    if choice is not None:
+        return
+
+    duration = info_dict.get("duration")
+    formats = info_dict.get("formats") or [info_dict]
+    sizes = [size for size in (estimate_format_size(f, duration) for f in formats) if size]
+    if sizes:
+        ensure_size(min(sizes), limit, url)
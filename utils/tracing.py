@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from html import escape
+from typing import Any, Dict, Iterator, List, Optional
+
+import aiohttp
+from aiogram import Bot
+
+from config.secrets import ADMIN_ID
+from config.settings import SLOW_JOB_SECONDS, TRACE_OTLP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+# One JSON line per finished job, see main.py for the handler
+jobs_logger = logging.getLogger("jobs")
+
+OTLP_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# Exports in flight, so they aren't garbage-collected before they finish
+_exports: set = set()
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    span_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    parent_id: Optional[str] = None
+    duration: float = 0.0
+    error: bool = False
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class JobTrace:
+    """Timings of one download job, from the URL message to the last upload."""
+
+    service: str
+    url: str
+    chat_id: Optional[int] = None
+    user_id: Optional[int] = None
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    span_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    started: float = field(default_factory=time.time)
+    duration: float = 0.0
+    status: str = "ok"
+    spans: List[Span] = field(default_factory=list)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def phases(self) -> Dict[str, float]:
+        """Total seconds per span name."""
+        totals: Dict[str, float] = defaultdict(float)
+        for span in self.spans:
+            totals[span.name] += span.duration
+        return dict(totals)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "service": self.service,
+            "url": self.url,
+            "chat_id": self.chat_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "started": round(self.started, 3),
+            "duration_ms": round(self.duration * 1000),
+            **self.attributes,
+            "phases_ms": {name: round(seconds * 1000) for name, seconds in self.phases().items()},
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset_ms": round((span.start - self.started) * 1000),
+                    "duration_ms": round(span.duration * 1000),
+                    **({"error": True} if span.error else {}),
+                    **span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+current_trace: ContextVar[Optional[JobTrace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def start_trace(service: str, url: str, chat_id: Optional[int] = None, user_id: Optional[int] = None) -> JobTrace:
+    """Creates the trace of a job and makes it current for the calling task and the tasks it starts."""
+    trace = JobTrace(service=service, url=url, chat_id=chat_id, user_id=user_id)
+    current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Records the block as a span of the current job.
+
+    Yields the span so the block can add attributes such as sizes, or None
+    when no job is traced.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    item = Span(name=name, start=time.time(), parent_id=parent.span_id if parent else None, attributes=attributes)
+    token = _current_span.set(item)
+    started = time.perf_counter()
+    try:
+        yield item
+    except BaseException:
+        item.error = True
+        raise
+    finally:
+        item.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        trace.spans.append(item)
+
+
+def add_span(name: str, start: float, duration: float, error: bool = False, **attributes: Any) -> None:
+    """Adds an already measured interval (``start`` from ``time.time()``) to the current job."""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    trace.spans.append(Span(
+        name=name,
+        start=start,
+        parent_id=parent.span_id if parent else None,
+        duration=duration,
+        error=error,
+        attributes=attributes,
+    ))
+
+
+def format_report(trace: JobTrace) -> str:
+    """HTML breakdown of a job for the admin."""
+    lines = [
+        f"🐢 Slow job: {trace.duration:.1f}s, {escape(trace.service)}, {escape(trace.status)}",
+        escape(trace.url),
+        "",
+    ]
+    for name, seconds in sorted(trace.phases().items(), key=lambda item: -item[1]):
+        lines.append(f"{escape(name)}: {seconds:.2f}s")
+    for key, value in trace.attributes.items():
+        lines.append(f"{escape(key)}: {escape(str(value))}")
+    return "<pre>" + "\n".join(lines) + "</pre>"
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_payload(trace: JobTrace) -> Dict[str, Any]:
+    def nanos(seconds: float) -> str:
+        return str(int(seconds * 1e9))
+
+    root = {
+        "traceId": trace.trace_id,
+        "spanId": trace.span_id,
+        "name": "job",
+        "kind": 1,
+        "startTimeUnixNano": nanos(trace.started),
+        "endTimeUnixNano": nanos(trace.started + trace.duration),
+        "attributes": _otlp_attributes({
+            "service": trace.service,
+            "url": trace.url,
+            "chat_id": trace.chat_id,
+            "user_id": trace.user_id,
+            "status": trace.status,
+            **trace.attributes,
+        }),
+        "status": {"code": 1 if trace.status == "ok" else 2},
+    }
+    children = [
+        {
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "parentSpanId": item.parent_id or trace.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": nanos(item.start),
+            "endTimeUnixNano": nanos(item.start + item.duration),
+            "attributes": _otlp_attributes(item.attributes),
+            "status": {"code": 2 if item.error else 1},
+        }
+        for item in trace.spans
+    ]
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": "charlotte"})},
+            "scopeSpans": [{"scope": {"name": "charlotte"}, "spans": [root, *children]}],
+        }]
+    }
+
+
+async def _export(trace: JobTrace) -> None:
+    try:
+        async with aiohttp.ClientSession(timeout=OTLP_TIMEOUT) as session:
+            async with session.post(TRACE_OTLP_ENDPOINT, json=_otlp_payload(trace)) as response:
+                if response.status >= 400:
+                    logger.warning(f"Trace export failed: response status {response.status}")
+    except Exception as e:
+        logger.warning(f"Trace export failed: {e}")
+
+
+async def finish_trace(trace: JobTrace, status: str = "ok", bot: Optional[Bot] = None) -> None:
+    """
+    Closes the trace: writes the job log line, exports the spans to
+    TRACE_OTLP_ENDPOINT if it's set, and reports the job to the admin when
+    it took longer than SLOW_JOB_SECONDS.
+    """
+    trace.duration = time.time() - trace.started
+    trace.status = status
+    jobs_logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+    if TRACE_OTLP_ENDPOINT:
+        # Exporting must not delay the user's next job
+        task = asyncio.create_task(_export(trace))
+        _exports.add(task)
+        task.add_done_callback(_exports.discard)
+
+    if bot is not None and SLOW_JOB_SECONDS and trace.duration >= SLOW_JOB_SECONDS:
+        try:
+            await bot.send_message(ADMIN_ID, format_report(trace))
+        except Exception as e:
+            logger.warning(f"Failed to report slow job {trace.trace_id}: {e}")
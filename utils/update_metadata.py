@@ -1,55 +1,115 @@
+import base64
 import logging
 from typing import Optional
 
+from mutagen.flac import Picture
 from mutagen.id3 import ID3
 from mutagen.id3._frames import APIC, TIT2, TPE1
 from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.oggopus import OggOpus
 
 logger = logging.getLogger(__name__)
 
 
+def _keep_padding(info) -> int:
+    # Reuse the existing padding so the tag is rewritten in place
+    # instead of shifting the whole audio stream
+    if info.padding >= 0:
+        return info.padding
+    return info.get_default_padding()
+
+
 def update_metadata(
     audio_file: str, title: str, artist: str, cover_file: Optional[str]
 ) -> None:
     """
-    Updates the MP3 file metadata and adds a cover art.
+    Updates the audio file metadata and adds a cover art.
+
+    MP3 files get ID3 tags, M4A files get MP4 atoms and Opus files get
+    Vorbis comments, so remuxed audio is tagged without re-encoding.
 
-    :param audio_file: The path to the MP3 file.
+    :param audio_file: The path to the MP3, M4A or Opus file.
     :param title: New title of the track.
     :param artist: New artist of the track.
     :param cover_file: Path to cover image (optional).
     :return: None
     """
-    # Checking file extension
-    if not audio_file.lower().endswith(".mp3"):
-        logger.error(f"Файл {audio_file} не является MP3.")
+    extension = audio_file.lower().rsplit(".", 1)[-1]
+    if extension not in ("mp3", "m4a", "opus"):
+        logger.error(f"Файл {audio_file} не является MP3, M4A или Opus.")
         return
 
     try:
-        # Open the file to read and write metadata
-        audio = MP3(audio_file, ID3=ID3)
-
-        # Add or update title and artist
-        audio["TIT2"] = TIT2(encoding=3, text=title)
-        audio["TPE1"] = TPE1(encoding=3, text=artist)
-
-        # If there's a cover, add it
+        cover = None
         if cover_file:
             with open(cover_file, "rb") as img:
-                audio.tags.add(
-                    APIC(
-                        encoding=3,
-                        mime="image/jpeg",
-                        type=3,
-                        desc="Cover",
-                        data=img.read(),
-                    )
-                )
-
-        audio.save()
+                cover = img.read()
+
+        if extension == "mp3":
+            _update_mp3(audio_file, title, artist, cover)
+        elif extension == "m4a":
+            _update_m4a(audio_file, title, artist, cover)
+        else:
+            _update_opus(audio_file, title, artist, cover)
+
         logger.info(
             f"Metadata and file cover of {audio_file} have been successfully updated."
         )
 
     except Exception as e:
         logger.error(f"Error when updating metadata: {str(e)}")
+
+
+def _update_mp3(audio_file: str, title: str, artist: str, cover: Optional[bytes]) -> None:
+    # Open the file to read and write metadata
+    audio = MP3(audio_file, ID3=ID3)
+    if audio.tags is None:
+        audio.add_tags()
+
+    # Add or update title and artist
+    audio["TIT2"] = TIT2(encoding=3, text=title)
+    audio["TPE1"] = TPE1(encoding=3, text=artist)
+
+    # If there's a cover, add it
+    if cover:
+        audio.tags.add(
+            APIC(
+                encoding=3,
+                mime="image/jpeg",
+                type=3,
+                desc="Cover",
+                data=cover,
+            )
+        )
+
+    audio.save(padding=_keep_padding)
+
+
+def _update_m4a(audio_file: str, title: str, artist: str, cover: Optional[bytes]) -> None:
+    audio = MP4(audio_file)
+    if audio.tags is None:
+        audio.add_tags()
+
+    audio.tags["\xa9nam"] = [title]
+    audio.tags["\xa9ART"] = [artist]
+    if cover:
+        audio.tags["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_JPEG)]
+
+    audio.save()
+
+
+def _update_opus(audio_file: str, title: str, artist: str, cover: Optional[bytes]) -> None:
+    audio = OggOpus(audio_file)
+
+    audio["title"] = [title]
+    audio["artist"] = [artist]
+    if cover:
+        picture = Picture()
+        picture.type = 3
+        picture.mime = "image/jpeg"
+        picture.desc = "Cover"
+        picture.data = cover
+        audio["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+
+    audio.save()
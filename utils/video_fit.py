@@ -0,0 +1,201 @@
+import asyncio
+import glob
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import (
+    VIDEO_FIT_MAX_HEIGHT,
+    VIDEO_FIT_MIN_KBPS,
+    VIDEO_FIT_POLICY,
+    VIDEO_FIT_SOURCE_FACTOR,
+)
+from utils.error_handler import BotError, ErrorCode
+from utils.ffmpeg_tools import probe_duration, run_ffmpeg
+from utils.format_selector import FormatChoice, FormatSelector, default_format_selector
+from utils.size_limits import check_info_size
+from utils.video_remux import remux_to_mp4
+
+logger = logging.getLogger(__name__)
+
+AUDIO_KBPS = 96
+
+# Output height for a video bitrate budget (kbit/s), from the lowest
+HEIGHT_LADDER = ((600, 360), (1200, 480), (2500, 720), (5000, 1080))
+
+# Room for the container overhead and encoder overshoot
+SIZE_MARGIN = 0.95
+
+
+def fallback_selector(selector: FormatSelector) -> FormatSelector:
+    """Returns a selector with the same codec filters, limited to VIDEO_FIT_MAX_HEIGHT."""
+    return FormatSelector(
+        video_filter=lambda f: selector.video_filter(f) and (f.get("height") or 0) <= VIDEO_FIT_MAX_HEIGHT,
+        audio_filter=selector.audio_filter,
+        video_rank=selector.video_rank,
+    )
+
+
+default_fallback_selector = fallback_selector(default_format_selector)
+
+
+def choose_format(
+    info_dict: Dict[str, Any],
+    limit: int,
+    url: Optional[str] = None,
+    selector: FormatSelector = default_format_selector,
+    fallback: FormatSelector = default_fallback_selector,
+) -> Optional[FormatChoice]:
+    """
+    Picks the highest-resolution format that fits the limit.
+
+    If nothing fits, a source of up to VIDEO_FIT_MAX_HEIGHT and
+    VIDEO_FIT_SOURCE_FACTOR times the limit is picked instead, and the
+    downloaded file is shrunk by ``fit_video``.
+
+    Raises:
+        BotError: If even the fallback budget can't be met.
+    """
+    choice = selector.select(info_dict, limit)
+    if choice is not None or VIDEO_FIT_POLICY == "off":
+        check_info_size(info_dict, choice, limit, url)
+        return choice
+
+    budget = limit * VIDEO_FIT_SOURCE_FACTOR
+    choice = fallback.select(info_dict, budget)
+    if choice is not None:
+        logger.info(f"No format of {url} fits {limit} bytes, downloading {choice.format_id} ({choice.size} bytes) to shrink it")
+    check_info_size(info_dict, choice, budget, url)
+    return choice
+
+
+def lookup_format(
+    media_id: Optional[str],
+    limit: int,
+    selector: FormatSelector = default_format_selector,
+    fallback: FormatSelector = default_fallback_selector,
+) -> Tuple[bool, Optional[FormatChoice]]:
+    """Memoized counterpart of ``choose_format``, see ``FormatSelector.lookup``."""
+    found, choice = selector.lookup(media_id, limit)
+    if found and choice is None and VIDEO_FIT_POLICY != "off":
+        return fallback.lookup(media_id, limit * VIDEO_FIT_SOURCE_FACTOR)
+    return found, choice
+
+
+def _target_height(video_kbps: float) -> int:
+    for max_kbps, height in HEIGHT_LADDER:
+        if video_kbps <= max_kbps:
+            return min(height, VIDEO_FIT_MAX_HEIGHT)
+    return VIDEO_FIT_MAX_HEIGHT
+
+
+async def _reencode(path: str, video_kbps: int) -> str:
+    output = f"{os.path.splitext(path)[0]}.fit.mp4"
+    height = _target_height(video_kbps)
+    await run_ffmpeg(
+        "-i", path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-b:v", f"{video_kbps}k", "-maxrate", f"{int(video_kbps * 1.2)}k", "-bufsize", f"{video_kbps * 2}k",
+        "-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k",
+        "-threads", "0",
+        "-movflags", "+faststart",
+        output,
+    )
+    return output
+
+
+async def _split(path: str, limit: int, duration: float) -> List[str]:
+    size = os.path.getsize(path)
+    parts = math.ceil(size / (limit * SIZE_MARGIN * 0.9))
+    base = os.path.splitext(path)[0]
+
+    # Stream copy cuts on keyframes, so parts are planned with extra headroom
+    await run_ffmpeg(
+        "-i", path,
+        "-map", "0", "-c", "copy",
+        "-f", "segment",
+        "-segment_time", f"{duration / parts:.3f}",
+        "-reset_timestamps", "1",
+        "-segment_format_options", "movflags=+faststart",
+        f"{base}.part%03d.mp4",
+    )
+
+    paths = sorted(glob.glob(f"{glob.escape(base)}.part[0-9][0-9][0-9].mp4"))
+    if not paths or any(os.path.getsize(p) > limit for p in paths):
+        raise BotError(
+            code=ErrorCode.SIZE_CHECK_FAIL,
+            message=f"Could not split {path} into parts under {limit} bytes",
+            critical=False,
+            is_logged=True,
+        )
+    return paths
+
+
+async def fit_video(path: str, limit: int, duration: Optional[float] = None) -> List[str]:
+    """
+    Makes a downloaded video fit the size limit.
+
+    Files under the limit are returned as they are. Otherwise, with the
+    "reencode" policy the video is re-encoded with x264 (veryfast, all
+    threads) at a bitrate computed from the size budget and scaled down
+    by the height ladder. When that bitrate would be below
+    VIDEO_FIT_MIN_KBPS, or with the "split" policy, the video is cut into
+    parts that each fit the limit.
+
+    Args:
+        path (str): Downloaded video.
+        limit (int): Size limit in bytes.
+        duration (float): Duration in seconds, probed with ffprobe if unknown.
+
+    Returns:
+        List[str]: Paths of the files to send, in order.
+    """
+    if VIDEO_FIT_POLICY == "off" or os.path.getsize(path) <= limit:
+        return [path]
+
+    duration = duration or await probe_duration(path)
+    if not duration:
+        raise BotError(
+            code=ErrorCode.SIZE_CHECK_FAIL,
+            message=f"Video {path} is too large and its duration is unknown",
+            critical=False,
+        )
+
+    source = path
+    if VIDEO_FIT_POLICY == "reencode":
+        video_kbps = int(limit * SIZE_MARGIN * 8 / duration / 1000) - AUDIO_KBPS
+        if video_kbps >= VIDEO_FIT_MIN_KBPS:
+            logger.info(f"Re-encoding {path} at {video_kbps} kbit/s to fit {limit} bytes")
+            source = await _reencode(path, video_kbps)
+            await asyncio.to_thread(os.remove, path)
+            if os.path.getsize(source) <= limit:
+                return [source]
+
+    logger.info(f"Splitting {source} into parts of up to {limit} bytes")
+    paths = await _split(source, limit, duration)
+    await asyncio.to_thread(os.remove, source)
+    return paths
+
+
+def keeps_source(source: str, paths: List[str]) -> bool:
+    """Whether ``prepare_video`` at most remuxed ``source``, so its width, height and duration still apply."""
+    return len(paths) == 1 and os.path.splitext(paths[0])[0] == os.path.splitext(source)[0]
+
+
+async def prepare_video(path: str, limit: int, duration: Optional[float] = None) -> List[str]:
+    """
+    Turns a downloaded video into streamable MP4 files under the limit.
+
+    The video is remuxed to MP4 first, see ``remux_to_mp4``. Oversized videos
+    that are going to be re-encoded by ``fit_video`` keep their video stream
+    as is, so they aren't encoded twice.
+
+    Returns:
+        List[str]: Paths of the files to send, in order.
+    """
+    oversized = os.path.getsize(path) > limit and VIDEO_FIT_POLICY == "reencode"
+    path = await remux_to_mp4(path, transcode_video=not oversized)
+    return await fit_video(path, limit, duration)
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import struct
+import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from config.settings import TEMP_DIR
+from managers.cache_manager import media_cache
+from managers.workspace_manager import workspace_manager
+from models.media_models import MediaContent
+from utils.error_handler import BotError
+from utils.ffmpeg_tools import run_ffmpeg, run_ffprobe
+
+logger = logging.getLogger(__name__)
+
+# Telegram thumbnails: JPEG, at most 320 px on each side and under 200 KB
+THUMBNAIL_SIZE = 320
+
+# moov boxes larger than this are left to ffprobe
+MAX_MOOV_SIZE = 8 * 1024 * 1024
+
+VideoMeta = Tuple[Optional[int], Optional[int], Optional[float]]
+
+
+def info_meta(info_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the width, height and duration yt-dlp already knows, as MediaContent fields."""
+    return {
+        "width": info_dict.get("width"),
+        "height": info_dict.get("height"),
+        "duration": info_dict.get("duration"),
+    }
+
+
+def _boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yields (type, payload start, box end) of the boxes in data[start:end]."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _child(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for child_type, child_start, child_end in _boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _read_moov(path: str) -> Optional[bytes]:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            box_size, box_type = struct.unpack(">I4s", f.read(8))
+            header = 8
+            if box_size == 1:
+                box_size = struct.unpack(">Q", f.read(8))[0]
+                header = 16
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < header:
+                return None
+            if box_type == b"moov":
+                if box_size > MAX_MOOV_SIZE:
+                    return None
+                return f.read(box_size - header)
+            offset += box_size
+    return None
+
+
+def parse_mp4_meta(path: str) -> Optional[VideoMeta]:
+    """
+    Reads the width, height and duration of an MP4 from its moov box.
+
+    Only box headers are read until moov is found, so faststart files cost a
+    few kilobytes of I/O. Rotated videos (by the track matrix) get their
+    width and height swapped to the displayed orientation.
+
+    Returns:
+        Optional[VideoMeta]: (width, height, duration), or None if the file
+            isn't an MP4 this parser understands.
+    """
+    try:
+        moov = _read_moov(path)
+        if moov is None:
+            return None
+
+        duration = None
+        mvhd = _child(moov, 0, len(moov), b"mvhd")
+        if mvhd:
+            start = mvhd[0]
+            if moov[start] == 1:
+                timescale, length = struct.unpack_from(">IQ", moov, start + 20)
+            else:
+                timescale, length = struct.unpack_from(">II", moov, start + 12)
+            if timescale:
+                duration = length / timescale
+
+        for box_type, start, end in _boxes(moov, 0, len(moov)):
+            if box_type != b"trak":
+                continue
+            mdia = _child(moov, start, end, b"mdia")
+            hdlr = mdia and _child(moov, mdia[0], mdia[1], b"hdlr")
+            if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+                continue
+            tkhd = _child(moov, start, end, b"tkhd")
+            if not tkhd:
+                continue
+
+            # Matrix and 16.16 fixed-point size follow the version-dependent times
+            offset = tkhd[0] + (36 if moov[tkhd[0]] == 1 else 24) + 16
+            a, b = struct.unpack_from(">ii", moov, offset)
+            width, height = struct.unpack_from(">II", moov, offset + 36)
+            width, height = width >> 16, height >> 16
+            if a == 0 and b != 0:
+                width, height = height, width
+            if width and height:
+                return width, height, duration
+        return None
+    except (OSError, struct.error, IndexError):
+        return None
+
+
+async def _ffprobe_meta(path: str) -> VideoMeta:
+    data = await run_ffprobe(path, "stream=codec_type,width,height", "stream_side_data=rotation", "format=duration")
+    width = height = duration = None
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and stream.get("width"):
+            width, height = stream["width"], stream.get("height")
+            rotation = next((s.get("rotation") for s in stream.get("side_data_list", []) if "rotation" in s), 0)
+            if abs(int(rotation or 0)) % 180 == 90:
+                width, height = height, width
+            break
+    try:
+        duration = float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return width, height, duration
+
+
+async def probe_video(path: str) -> VideoMeta:
+    """
+    Returns the width, height and duration of a video file.
+
+    MP4 files are parsed directly, anything else (or an MP4 the parser
+    can't read) goes through ffprobe.
+    """
+    meta = await asyncio.to_thread(parse_mp4_meta, path)
+    if meta is None:
+        meta = await _ffprobe_meta(path)
+    return meta
+
+
+async def make_thumbnail(path: str, duration: Optional[float] = None) -> Optional[str]:
+    """
+    Extracts a JPEG frame to use as the video thumbnail.
+
+    Files from the media cache get their thumbnail in the job workspace, so
+    the cache directory only holds cache entries and the thumbnail goes away
+    with the job. Outside of a job it goes to TEMP_DIR, which the janitor sweeps.
+
+    Returns:
+        Optional[str]: Path of the thumbnail, or None if ffmpeg failed.
+    """
+    if media_cache.contains_path(path):
+        workspace = workspace_manager.current()
+        directory = str(workspace.path) if workspace else TEMP_DIR
+        output = os.path.join(directory, f"thumb_{uuid.uuid4().hex}.jpg")
+    else:
+        output = f"{os.path.splitext(path)[0]}.thumb.jpg"
+
+    # A frame from the first second, or the middle of very short clips
+    position = min(1.0, duration / 2) if duration else 0
+    try:
+        await run_ffmpeg(
+            "-ss", f"{position:.3f}",
+            "-i", str(path),
+            "-frames:v", "1",
+            "-vf", f"scale={THUMBNAIL_SIZE}:{THUMBNAIL_SIZE}:force_original_aspect_ratio=decrease",
+            "-q:v", "5",
+            output,
+        )
+    except (BotError, OSError) as e:
+        logger.warning(f"Could not make a thumbnail for {path}: {getattr(e, 'message', e)}")
+        return None
+    return output if os.path.exists(output) else None
+
+
+async def complete_video(content: MediaContent) -> None:
+    """
+    Fills in whatever a service couldn't provide for a video: width, height,
+    duration and the thumbnail, so Telegram doesn't have to process the file
+    before showing it.
+    """
+    path = str(content.path)
+    if not (content.width and content.height and content.duration):
+        try:
+            width, height, duration = await probe_video(path)
+        except (BotError, OSError) as e:
+            logger.warning(f"Could not probe {path}: {getattr(e, 'message', e)}")
+        else:
+            content.width = content.width or width
+            content.height = content.height or height
+            content.duration = content.duration or duration
+
+    if content.cover is None:
+        thumbnail = await make_thumbnail(path, content.duration)
+        if thumbnail:
+            content.cover = thumbnail
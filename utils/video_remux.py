@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import struct
+from typing import Optional, Tuple
+
+from utils.ffmpeg_tools import run_ffmpeg, run_ffprobe
+
+logger = logging.getLogger(__name__)
+
+# Codecs every Telegram client plays from an MP4 container
+COPY_VIDEO_CODECS = ("h264", "hevc")
+COPY_AUDIO_CODECS = ("aac", "mp3")
+
+
+async def probe_codecs(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the codec names of the first video and audio streams."""
+    data = await run_ffprobe(path, "stream=codec_type,codec_name")
+    video = audio = None
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and video is None:
+            video = stream.get("codec_name")
+        elif stream.get("codec_type") == "audio" and audio is None:
+            audio = stream.get("codec_name")
+    return video, audio
+
+
+def has_faststart(path: str) -> bool:
+    """Checks whether the moov atom comes before mdat, reading only box headers."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset + 8 <= size:
+                f.seek(offset)
+                box_size, box_type = struct.unpack(">I4s", f.read(8))
+                if box_type == b"moov":
+                    return True
+                if box_type == b"mdat":
+                    return False
+                if box_size == 1:
+                    box_size = struct.unpack(">Q", f.read(8))[0]
+                elif box_size == 0:
+                    return False
+                if box_size < 8:
+                    return False
+                offset += box_size
+    except (OSError, struct.error):
+        pass
+    return False
+
+
+async def remux_to_mp4(path: str, transcode_video: bool = True) -> str:
+    """
+    Converts a downloaded video into a streamable MP4.
+
+    H.264/HEVC video and AAC/MP3 audio are copied without re-encoding, so
+    most sources only cost a file copy. Other codecs (VP9, AV1, Opus) are
+    transcoded: video with x264 veryfast, audio to AAC. The moov atom is
+    moved to the front (faststart) so Telegram can stream the file. MP4
+    files that already have compatible codecs and faststart are returned
+    untouched.
+
+    Args:
+        path (str): Downloaded video in any container.
+        transcode_video (bool): Copy the video stream even if its codec is
+            not compatible, e.g. because it will be re-encoded later anyway.
+
+    Returns:
+        str: Path of the MP4 file.
+    """
+    video_codec, audio_codec = await probe_codecs(path)
+    if video_codec is None:
+        return path
+
+    copy_video = video_codec in COPY_VIDEO_CODECS or not transcode_video
+    copy_audio = audio_codec is None or audio_codec in COPY_AUDIO_CODECS
+    is_mp4 = path.lower().endswith(".mp4")
+
+    if is_mp4 and video_codec in COPY_VIDEO_CODECS and copy_audio and await asyncio.to_thread(has_faststart, path):
+        return path
+
+    base = os.path.splitext(path)[0]
+    output = f"{base}.remux.mp4" if is_mp4 else f"{base}.mp4"
+
+    args = ["-i", path, "-map", "0:v:0", "-map", "0:a:0?"]
+    if copy_video:
+        args += ["-c:v", "copy"]
+        if video_codec == "hevc":
+            # Apple clients only play HEVC tagged as hvc1
+            args += ["-tag:v", "hvc1"]
+    else:
+        args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p", "-threads", "0"]
+    args += ["-c:a", "copy"] if copy_audio else ["-c:a", "aac", "-b:a", "128k"]
+    args += ["-movflags", "+faststart", output]
+
+    logger.info(
+        f"Remuxing {path} to MP4 (video {video_codec}: {'copy' if copy_video else 'x264'}, "
+        f"audio {audio_codec}: {'copy' if copy_audio else 'aac'})"
+    )
+    await run_ffmpeg(*args)
+
+    if is_mp4:
+        await asyncio.to_thread(os.replace, output, path)
+        return path
+
+    await asyncio.to_thread(os.remove, path)
+    return output
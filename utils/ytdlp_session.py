@@ -0,0 +1,23 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Dict
+
+import yt_dlp
+
+
+@asynccontextmanager
+async def open_ydl(options: Dict[str, Any]) -> AsyncIterator[yt_dlp.YoutubeDL]:
+    """
+    Async ``with yt_dlp.YoutubeDL(options)``.
+
+    Building a YoutubeDL loads the extractors and reads the cookie file, and
+    closing it writes the cookies back, so both run in a thread instead of
+    on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    ydl = await loop.run_in_executor(None, yt_dlp.YoutubeDL, options)
+    try:
+        yield ydl
+    finally:
+        await loop.run_in_executor(None, partial(ydl.__exit__, None, None, None))